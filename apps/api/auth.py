@@ -17,6 +17,9 @@
 
 from __future__ import absolute_import
 
+import hashlib
+
+from django.core.cache import cache
 from rest_framework import authentication
 from rest_framework import exceptions
 # Need to use tastypie's ApiKey, since that's what the apiv2 app uses.  Once
@@ -26,6 +29,31 @@ from tastypie.models import ApiKey
 
 from auth.models import CustomUser as User
 
+# Successful authentications are cached for this long.  We only cache the
+# user id and always load the user from the DB, so changes to the user show
+# up right away.  ApiKey changes invalidate the cache (see api.models).
+AUTH_CACHE_TIMEOUT = 5 * 60
+
+def _auth_cache_key(username, api_key):
+    # hash the credentials so that we don't store API keys in cache keys
+    credentials = u'%s\n%s' % (username, api_key or '')
+    return 'api-auth-%s' % hashlib.sha1(
+        credentials.encode('utf-8')).hexdigest()
+
+def invalidate_auth_cache(username, api_keys):
+    """Remove cached authentications for a user.
+
+    :param username: username of the user
+    :param api_keys: list of API keys to invalidate
+    """
+    cache.delete_many([_auth_cache_key(username, api_key)
+                       for api_key in api_keys])
+
+def invalidate_user_auth_cache(user):
+    """Remove all cached authentications for a user."""
+    invalidate_auth_cache(user.username, ApiKey.objects
+                          .filter(user=user).values_list('key', flat=True))
+
 class TokenAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         username = request.META.get('HTTP_X_API_USERNAME')
@@ -34,6 +62,14 @@ class TokenAuthentication(authentication.BaseAuthentication):
         if not username:
             return None
 
+        cache_key = _auth_cache_key(username, api_key)
+        user_id = cache.get(cache_key)
+        if user_id is not None:
+            try:
+                return (User.objects.get(pk=user_id), None)
+            except User.DoesNotExist:
+                cache.delete(cache_key)
+
         try:
             user = User.objects.get(username=username)
         except User.DoesNotExist:
@@ -42,4 +78,5 @@ class TokenAuthentication(authentication.BaseAuthentication):
         if not ApiKey.objects.filter(user=user, key=api_key).exists():
             raise exceptions.AuthenticationFailed('Invalid API Key')
 
+        cache.set(cache_key, user.pk, AUTH_CACHE_TIMEOUT)
         return (user, None)
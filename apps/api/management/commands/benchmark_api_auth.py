@@ -0,0 +1,91 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.client import Client
+
+from api.auth import invalidate_user_auth_cache
+from auth.models import CustomUser as User
+from videos.models import Video
+
+class Command(BaseCommand):
+    args = '<username> <video-id> <language-code>'
+    help = ('Time authenticated requests to the api.views endpoints, with '
+            'and without the API key authentication cache')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', dest='count', type='int', default=1000,
+                    help='Number of requests to make to each endpoint'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 3:
+            raise CommandError('Usage: benchmark_api_auth <username> '
+                               '<video-id> <language-code>')
+        username, video_id, language_code = args
+        try:
+            self.user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError('No user named %s' % username)
+        if not Video.objects.filter(video_id=video_id).exists():
+            raise CommandError('No video with id %s' % video_id)
+        self.client = Client(HTTP_X_API_USERNAME=username,
+                             HTTP_X_APIKEY=self.user.get_api_key())
+        base_url = '/api2/partners/videos/%s/languages/%s/subtitles/' % (
+            video_id, language_code)
+        for endpoint in ('actions', 'notes'):
+            url = base_url + endpoint + '/'
+            self.stdout.write("%s\n" % url)
+            self.run_benchmark('uncached', url, options['count'],
+                               invalidate=True)
+            self.run_benchmark('cached', url, options['count'],
+                               invalidate=False)
+
+    def run_benchmark(self, label, url, count, invalidate):
+        invalidate_user_auth_cache(self.user)
+        # make 1 request first, to warm up the auth cache in the cached case
+        # and any other caches in both cases
+        self.check_response(self.client.get(url))
+        old_use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        queries_before = len(connection.queries)
+        total_time = 0
+        try:
+            for i in xrange(count):
+                if invalidate:
+                    invalidate_user_auth_cache(self.user)
+                start_time = time.time()
+                self.check_response(self.client.get(url))
+                total_time += time.time() - start_time
+            query_count = len(connection.queries) - queries_before
+        finally:
+            connection.use_debug_cursor = old_use_debug_cursor
+        # the invalidate_user_auth_cache() call does 1 query per request
+        if invalidate:
+            query_count -= count
+        self.stdout.write("%-10s %0.3fms/request  %0.1f queries/request\n" % (
+            label, total_time * 1000 / count, float(query_count) / count))
+
+    def check_response(self, response):
+        if response.status_code != 200:
+            raise CommandError('Got status code %s: %s' % (
+                response.status_code, response.content))
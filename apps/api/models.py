@@ -0,0 +1,51 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along
+# with this program.  If not, see http://www.gnu.org/licenses/agpl-3.0.html.
+
+
+from __future__ import absolute_import
+
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from tastypie.models import ApiKey
+
+from api.auth import invalidate_auth_cache
+
+def api_key_will_change(sender, instance, **kwargs):
+    # Invalidate the key currently stored in the DB, not the new one, and
+    # remember it for api_key_changed().
+    if instance.pk is None:
+        instance._old_api_keys = []
+    else:
+        instance._old_api_keys = list(ApiKey.objects.filter(pk=instance.pk)
+                                      .values_list('key', flat=True))
+    invalidate_auth_cache(instance.user.username, instance._old_api_keys)
+
+def api_key_changed(sender, instance, **kwargs):
+    # Invalidate again now that the change is written.  A request that read
+    # the old row before then could have cached it again.
+    invalidate_auth_cache(instance.user.username,
+                          getattr(instance, '_old_api_keys', []) +
+                          [instance.key])
+
+pre_save.connect(api_key_will_change, ApiKey,
+                 dispatch_uid='api.apikey.api_key_will_change')
+pre_delete.connect(api_key_will_change, ApiKey,
+                   dispatch_uid='api.apikey.api_key_will_delete')
+post_save.connect(api_key_changed, ApiKey,
+                  dispatch_uid='api.apikey.api_key_changed')
+post_delete.connect(api_key_changed, ApiKey,
+                    dispatch_uid='api.apikey.api_key_deleted')
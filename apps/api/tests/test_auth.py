@@ -18,7 +18,9 @@
 from django.test import TestCase
 from django.http import HttpRequest
 from nose.tools import *
+import mock
 from rest_framework.exceptions import AuthenticationFailed
+from tastypie.models import ApiKey
 
 from api.auth import TokenAuthentication
 from utils.factories import *
@@ -47,3 +49,67 @@ class TestAPIAuth(TestCase):
     def test_no_token(self):
         request = self.make_request(None, None)
         assert_equal(self.auth.authenticate(request), None)
+
+class TestAPIAuthCache(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.api_key = self.user.get_api_key()
+        self.auth = TokenAuthentication()
+
+    def make_request(self, username, key):
+        request = HttpRequest()
+        request.META['HTTP_X_API_USERNAME'] = username
+        request.META['HTTP_X_APIKEY'] = key
+        return request
+
+    def authenticate(self):
+        return self.auth.authenticate(self.make_request(self.user.username,
+                                                        self.api_key))
+
+    def test_cached(self):
+        assert_equal(self.authenticate(), (self.user, None))
+        # we should only need to load the user
+        with self.assertNumQueries(1):
+            assert_equal(self.authenticate(), (self.user, None))
+
+    def test_failures_not_cached(self):
+        request = self.make_request(self.user.username, "foo")
+        with assert_raises(AuthenticationFailed):
+            self.auth.authenticate(request)
+        with assert_raises(AuthenticationFailed):
+            self.auth.authenticate(request)
+
+    def test_invalidate_on_key_change(self):
+        self.authenticate()
+        api_key = ApiKey.objects.get(user=self.user)
+        api_key.key = 'new-key'
+        api_key.save()
+        with assert_raises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_invalidate_on_key_delete(self):
+        self.authenticate()
+        ApiKey.objects.filter(user=self.user).delete()
+        with assert_raises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_user_changes_not_cached(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.is_staff = True
+        self.user.save()
+        user, auth = self.authenticate()
+        assert_equal(user.is_active, False)
+        assert_equal(user.is_staff, True)
+
+    def test_invalidate_after_key_change_written(self):
+        # simulate a concurrent request caching the old key while the
+        # new one is being saved
+        api_key = ApiKey.objects.get(user=self.user)
+        api_key.key = 'new-key'
+        with mock.patch('api.models.invalidate_auth_cache') as mock_invalidate:
+            api_key.save()
+        assert_equal(mock_invalidate.call_args_list, [
+            mock.call(self.user.username, [self.api_key]),
+            mock.call(self.user.username, [self.api_key, 'new-key']),
+        ])
@@ -53,7 +53,9 @@ def add_credit_to_video_url(video_url, account):
     access_token = youtube.get_new_access_token(account.oauth_refresh_token)
     video_id = video_url.videoid
     credit_text = calc_credit_text(video_url.video)
-    current_description = youtube.get_video_info(video_id).description
+    # don't use a cached description, since we're about to overwrite it
+    current_description = youtube.get_video_info(
+        video_id, use_cache=False).description
     if credit_text not in current_description:
         new_description = '%s\n\n%s' % (current_description, credit_text)
         youtube.update_video_description(video_id, access_token,
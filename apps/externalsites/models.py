@@ -17,6 +17,7 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 import collections
+from contextlib import contextmanager
 import datetime
 from urllib import quote_plus
 import urlparse
@@ -176,6 +177,19 @@ class ExternalAccount(models.Model):
         """
         return False
 
+    @contextmanager
+    def sync_session(self):
+        """Context manager for syncing many subtitles at once.
+
+        Inside the block, subclasses can reuse API clients and cached lookups
+        between calls to update_subtitles() and delete_subtitles().  This is
+        used by externalsites.syncengine.  The calls may come from multiple
+        threads, so anything shared needs to be thread-safe.
+
+        Subclasses may optionally override this method.
+        """
+        yield
+
     class Meta:
         abstract = True
 
@@ -203,19 +217,38 @@ class KalturaAccount(ExternalAccount):
         return fmt(_('partner id %(partner_id)s',
                      partner_id=self.partner_id))
 
+    @contextmanager
+    def sync_session(self):
+        self._sync_session = syncing.kaltura.SyncSession(self.partner_id,
+                                                         self.secret)
+        try:
+            yield
+        finally:
+            self._sync_session = None
+
     def do_update_subtitles(self, video_url, language, tip):
         kaltura_id = video_url.get_video_type().kaltura_id()
         subtitles = tip.get_subtitles()
         sub_data = babelsubs.to(subtitles, 'srt')
 
-        syncing.kaltura.update_subtitles(self.partner_id, self.secret,
-                                         kaltura_id, language.language_code,
-                                         sub_data)
+        session = getattr(self, '_sync_session', None)
+        if session is not None:
+            session.update_subtitles(kaltura_id, language.language_code,
+                                     sub_data)
+        else:
+            syncing.kaltura.update_subtitles(self.partner_id, self.secret,
+                                             kaltura_id,
+                                             language.language_code, sub_data)
 
     def do_delete_subtitles(self, video_url, language):
         kaltura_id = video_url.get_video_type().kaltura_id()
-        syncing.kaltura.delete_subtitles(self.partner_id, self.secret,
-                                         kaltura_id, language.language_code)
+        session = getattr(self, '_sync_session', None)
+        if session is not None:
+            session.delete_subtitles(kaltura_id, language.language_code)
+        else:
+            syncing.kaltura.delete_subtitles(self.partner_id, self.secret,
+                                             kaltura_id,
+                                             language.language_code)
 
 class BrightcoveAccount(ExternalAccount):
     account_type = 'B'
@@ -461,19 +494,33 @@ class YouTubeAccount(ExternalAccount):
             type=ExternalAccount.TYPE_USER,
             channel_id=video_url.owner_username)
 
+    @contextmanager
+    def sync_session(self):
+        self._sync_session = syncing.youtube.SyncSession(
+            self.oauth_refresh_token)
+        try:
+            yield
+        finally:
+            self._sync_session = None
+
+    def _get_sync_session(self):
+        session = getattr(self, '_sync_session', None)
+        if session is None:
+            session = syncing.youtube.SyncSession(self.oauth_refresh_token)
+        return session
+
     def do_update_subtitles(self, video_url, language, version):
         """Do the work needed to update subititles.
 
         Subclasses must implement this method.
         """
-        access_token = youtube.get_new_access_token(self.oauth_refresh_token)
-        syncing.youtube.update_subtitles(video_url.videoid, access_token,
-                                         version)
+        syncing.youtube.update_subtitles(video_url.videoid, None, version,
+                                         session=self._get_sync_session())
 
     def do_delete_subtitles(self, video_url, language):
-        access_token = youtube.get_new_access_token(self.oauth_refresh_token)
-        syncing.youtube.delete_subtitles(video_url.videoid, access_token,
-                                         language.language_code)
+        syncing.youtube.delete_subtitles(video_url.videoid, None,
+                                         language.language_code,
+                                         session=self._get_sync_session())
 
     def delete(self):
         youtube.revoke_auth_token(self.oauth_refresh_token)
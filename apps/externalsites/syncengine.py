@@ -0,0 +1,156 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""externalsites.syncengine -- Sync all subtitles for an account
+
+SyncEngine replaces looping over every video/language and calling
+update_subtitles() one at a time.  It:
+
+    - Skips languages where the SyncedSubtitleVersion already matches the
+      public tip.
+    - Fetches the languages and tips for each video in a couple queries.
+    - Syncs videos in parallel using a thread pool (EXTERNAL_SYNC_THREADS
+      threads).  All languages for a video get synced by the same thread.
+    - Fetches youtube info for VideoURLs that need fix_owner_username() in
+      batches, rather than one API request per video.
+    - Runs inside the account's sync_session(), so that accounts can share
+      an authenticated client and cached lookups between calls.
+"""
+
+from multiprocessing.pool import ThreadPool
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from externalsites.models import SyncedSubtitleVersion
+from utils import youtube
+from videos.models import VideoUrl
+from videos.types.youtube import YoutubeVideoType
+
+logger = logging.getLogger('externalsites.syncengine')
+
+class SyncEngine(object):
+    def __init__(self, account, thread_count=None):
+        self.account = account
+        if thread_count is None:
+            thread_count = getattr(settings, 'EXTERNAL_SYNC_THREADS', 8)
+        self.thread_count = thread_count
+
+    def run(self):
+        """Sync all subtitles for our account.
+
+        :returns: number of languages that we tried to sync
+        """
+        if self.account.should_skip_syncing():
+            return 0
+        jobs = list(self.calc_jobs())
+        with self.account.sync_session():
+            if self.thread_count <= 1 or len(jobs) <= 1:
+                for job in jobs:
+                    self.run_job(job)
+            else:
+                pool = ThreadPool(min(self.thread_count, len(jobs)))
+                try:
+                    pool.map(self.run_job_in_thread, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+        return sum(len(languages) for video_url, languages in jobs)
+
+    def videos(self):
+        if self.account.team:
+            return self.account.team.videos.all()
+        else:
+            return self.account.user.video_set.all()
+
+    def calc_jobs(self):
+        """Calculate the work to do
+
+        :returns: iterable of (video_url, languages) tuples.  languages is a
+            list of SubtitleLanguages that need to be synced, with their public
+            tip cached.
+        """
+        self.prefetch_video_info()
+        synced_versions = dict(
+            ((video_url_id, language_id), version_id)
+            for video_url_id, language_id, version_id in
+            SyncedSubtitleVersion.objects.filter(
+                account_type=self.account.account_type,
+                account_id=self.account.id)
+            .values_list('video_url_id', 'language_id', 'version_id'))
+
+        for video in self.videos():
+            languages = None
+            for video_url in video.get_video_urls():
+                video_url.fix_owner_username()
+                if not self.account.should_sync_video_url(video, video_url):
+                    continue
+                if languages is None:
+                    languages = (video.newsubtitlelanguage_set
+                                 .having_public_versions()
+                                 .fetch_and_join(public_tips=True,
+                                                 video=video))
+                to_sync = [
+                    language for language in languages
+                    if self.needs_sync(video_url, language, synced_versions)
+                ]
+                if to_sync:
+                    yield (video_url, to_sync)
+
+    def prefetch_video_info(self):
+        """Fetch the youtube info that fix_owner_username() needs.
+
+        The info gets stored in the cache that youtube.get_video_info() uses.
+        """
+        video_ids = list(VideoUrl.objects
+                         .filter(video__in=self.videos(),
+                                 type=YoutubeVideoType.abbreviation,
+                                 owner_username__isnull=True)
+                         .values_list('videoid', flat=True))
+        if not video_ids:
+            return
+        try:
+            youtube.get_video_infos(video_ids)
+        except youtube.APIError:
+            # fix_owner_username() will try again for each video
+            pass
+
+    def needs_sync(self, video_url, language, synced_versions):
+        tip = language.get_public_tip()
+        if tip is None:
+            return False
+        return synced_versions.get((video_url.id, language.id)) != tip.id
+
+    def run_job(self, job):
+        video_url, languages = job
+        for language in languages:
+            self.account.update_subtitles(video_url, language)
+
+    def run_job_in_thread(self, job):
+        try:
+            self.run_job(job)
+        except Exception:
+            # update_subtitles() records errors from the external site, so
+            # this is something unexpected.  Log it and keep going with the
+            # other videos.
+            logger.error('Error syncing %s', job[0], exc_info=True)
+        finally:
+            # each thread uses its own DB connection, make sure they don't
+            # stay open.
+            connection.close()
@@ -18,7 +18,9 @@
 
 """externalsites.syncing.kaltura -- Sync subtitles to/from kaltura"""
 
-from xml.dom import minidom
+import threading
+import time
+from xml.etree import cElementTree as ElementTree
 
 import requests
 
@@ -33,17 +35,45 @@ CAPTION_TYPE_SRT = 1
 CAPTION_TYPE_WEBVTT = 3
 # partnerData value we set for subtitles that we've synced
 PARTNER_DATA_TAG = 'synced-from-amara'
+# How long to reuse a cached session for.  Kaltura sessions are valid for 24
+# hours by default, so this leaves plenty of room.
+SESSION_CACHE_TIMEOUT = 60 * 60
+# Error code for an invalid or expired session
+INVALID_KS_CODE = 'INVALID_KS'
+
+class KalturaError(SyncingError):
+    """Error result from the kaltura API."""
+    def __init__(self, code, message):
+        SyncingError.__init__(self, "%s: %s", code, message)
+        self.code = code
+
+# requests session, so that we can reuse HTTP connections
+_http_session = None
+# maps (partner_id, secret) -> (ks, expire_time)
+_session_cache = {}
+_session_cache_lock = threading.Lock()
+
+def _get_http_session():
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.session()
+    return _http_session
+
+def clear_session_cache():
+    with _session_cache_lock:
+        _session_cache.clear()
 
 def _node_text(node):
-    return ''.join(child.nodeValue
-                   for child in node.childNodes
-                   if child.nodeType == child.TEXT_NODE)
+    return (node.text or '') + ''.join(child.tail or '' for child in node)
+
+def _find_children(node, tag_name):
+    return [child for child in node.iter(tag_name) if child is not node]
 
 def _find_child(node, tag_name):
-    return node.getElementsByTagName(tag_name)[0]
+    return _find_children(node, tag_name)[0]
 
 def _has_child(node, tag_name):
-    return len(node.getElementsByTagName(tag_name)) > 0
+    return len(_find_children(node, tag_name)) > 0
 
 def _check_error(result):
     """Checks if we had an error result."""
@@ -51,12 +81,13 @@ def _check_error(result):
         error = _find_child(result, 'error')
         code = _node_text(_find_child(error, 'code'))
         message = _node_text(_find_child(error, 'message'))
-        raise SyncingError("%s: %s" % (code, message))
+        raise KalturaError(code, message)
 
 def _make_request(service, action, data):
     params = { 'service': service, 'action': action, }
-    response = requests.post(KALTURA_API_URL, params=params, data=data)
-    dom = minidom.parseString(response.content)
+    response = _get_http_session().post(KALTURA_API_URL, params=params,
+                                        data=data)
+    dom = ElementTree.fromstring(response.content)
     try:
         result = _find_child(dom, 'result')
     except IndexError:
@@ -75,21 +106,51 @@ def _start_session(partner_id, secret):
 def _end_session(ks):
     _make_request('session', 'end', { 'ks': ks })
 
-def _find_existing_captionset(ks, video_id, language_code):
-    language = KalturaLanguageMap.get_name(language_code)
+def _get_cached_session(partner_id, secret):
+    """Get a session from the cache, or start a new one
+
+    Cached sessions are never ended, we just let them expire on the kaltura
+    side.
+    """
+    key = (partner_id, secret)
+    with _session_cache_lock:
+        if key in _session_cache:
+            ks, expire_time = _session_cache[key]
+            if time.time() < expire_time:
+                return ks
+    ks = _start_session(partner_id, secret)
+    with _session_cache_lock:
+        _session_cache[key] = (ks, time.time() + SESSION_CACHE_TIMEOUT)
+    return ks
+
+def _invalidate_cached_session(partner_id, secret, ks):
+    with _session_cache_lock:
+        if _session_cache.get((partner_id, secret), (None,))[0] == ks:
+            del _session_cache[(partner_id, secret)]
+
+def _list_captionsets(ks, video_id):
+    """Get the caption assets that we've synced for an entry
+
+    :returns: dict mapping kaltura language names to caption ids
+    """
     result = _make_request('caption_captionasset', 'list', {
         'ks': ks,
         'filter:entryIdEqual': video_id,
     })
 
+    captionsets = {}
     objects = _find_child(result, 'objects')
-    for item in objects.getElementsByTagName('item'):
+    for item in _find_children(objects, 'item'):
         partner_data = _find_child(item, 'partnerData')
         language_node = _find_child(item, 'language')
-        if (_node_text(partner_data) == PARTNER_DATA_TAG and
-            _node_text(language_node) == language):
-            return _node_text(_find_child(item, 'id'))
-    return None
+        if _node_text(partner_data) == PARTNER_DATA_TAG:
+            captionsets.setdefault(_node_text(language_node),
+                                   _node_text(_find_child(item, 'id')))
+    return captionsets
+
+def _find_existing_captionset(ks, video_id, language_code):
+    language = KalturaLanguageMap.get_name(language_code)
+    return _list_captionsets(ks, video_id).get(language)
 
 def _add_captions(ks, video_id, language_code):
     language = KalturaLanguageMap.get_name(language_code)
@@ -137,3 +198,68 @@ def delete_subtitles(partner_id, secret, video_id, language_code):
             _delete_captions(ks, caption_id)
     finally:
         _end_session(ks)
+
+class SyncSession(object):
+    """Reuse a kaltura session and caption asset lists for many updates.
+
+    The kaltura session comes from a cache shared by all SyncSessions for the
+    account, so it can be reused between syncs until it expires.  The caption
+    assets for each entry are listed once, so updating the subtitles for a
+    language that we've already synced only needs 1 API call.
+
+    A SyncSession can be used from multiple threads, but an entry should
+    only be synced by 1 thread at a time.
+    """
+    def __init__(self, partner_id, secret):
+        self.partner_id = partner_id
+        self.secret = secret
+        self._captionsets = {}
+
+    def _call(self, func, *args):
+        """Call func with a cached session as the first arg
+
+        If kaltura tells us the cached session is invalid, we start a new one
+        and retry.
+        """
+        ks = _get_cached_session(self.partner_id, self.secret)
+        try:
+            return func(ks, *args)
+        except KalturaError, e:
+            if e.code != INVALID_KS_CODE:
+                raise
+            _invalidate_cached_session(self.partner_id, self.secret, ks)
+            ks = _get_cached_session(self.partner_id, self.secret)
+            return func(ks, *args)
+
+    def _get_captionsets(self, video_id):
+        if video_id not in self._captionsets:
+            self._captionsets[video_id] = self._call(_list_captionsets,
+                                                     video_id)
+        return self._captionsets[video_id]
+
+    def update_subtitles(self, video_id, language_code, srt_data):
+        language = KalturaLanguageMap.get_name(language_code)
+        captionsets = self._get_captionsets(video_id)
+        if language not in captionsets:
+            captionsets[language] = self._call(_add_captions, video_id,
+                                               language_code)
+        self._call(_update_caption_content, captionsets[language], srt_data)
+
+    def delete_subtitles(self, video_id, language_code):
+        language = KalturaLanguageMap.get_name(language_code)
+        captionsets = self._get_captionsets(video_id)
+        if language in captionsets:
+            self._call(_delete_captions, captionsets.pop(language))
+
+def update_all_subtitles(partner_id, secret, video_id, subtitles):
+    """Update the subtitles for several languages of an entry
+
+    This lists the caption assets for the entry once and uses a cached
+    session, so it only needs 1 API call for each language we've synced
+    before.
+
+    :param subtitles: list of (language_code, srt_data) tuples
+    """
+    session = SyncSession(partner_id, secret)
+    for language_code, srt_data in subtitles:
+        session.update_subtitles(video_id, language_code, srt_data)
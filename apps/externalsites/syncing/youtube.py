@@ -19,6 +19,8 @@
 """externalsites.syncing.youtube -- Sync subtitles to/from Youtube"""
 
 import logging
+import threading
+import time
 
 from django.conf import settings
 from django.utils import translation
@@ -28,6 +30,7 @@ from gdata.gauth import OAuth2Token
 import babelsubs
 import unilangs
 
+from utils import youtube
 from utils.metrics import Meter, Occurrence
 
 # NOTE
@@ -46,6 +49,10 @@ logger = logging.getLogger("externalsites.syncing.youtube")
 CAPTION_TRACK_LINK_REL = ('http://gdata.youtube.com'
                           '/schemas/2007#video.captionTracks')
 
+# Access tokens expire after an hour.  Refresh them a bit before that so that
+# requests in progress don't fail.
+ACCESS_TOKEN_LIFETIME = 50 * 60
+
 def _format_subs_for_youtube(subtitle_set):
     return babelsubs.to(subtitle_set, 'sbv').encode('utf-8')
 
@@ -115,10 +122,76 @@ class YoutubeAPIBridge(object):
                                         settings.YOUTUBE_CLIENT_ID,
                                         settings.YOUTUBE_API_KEY)
 
-def update_subtitles(video_id, access_token, subtitle_version):
-    """Push the subtitles for a language to YouTube """
+class SyncSession(object):
+    """Share API access between many subtitle updates.
+
+    A SyncSession shares the access token between updates and caches the
+    caption info for each video, so syncing several languages for a video
+    only needs 1 caption list request.  If we have a refresh token, the
+    access token is refreshed before it expires.  It can be used from
+    multiple threads: each thread gets its own YoutubeAPIBridge, but they
+    share the access token.  A video should only be synced by 1 thread at a
+    time.
+    """
+    def __init__(self, refresh_token=None, access_token=None):
+        self.refresh_token = refresh_token
+        self._access_token = access_token
+        self._access_token_expires = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._caption_info = {}
+
+    def get_access_token(self):
+        with self._lock:
+            if self._access_token is None or self._access_token_expired():
+                self._access_token = youtube.get_new_access_token(
+                    self.refresh_token)
+                self._access_token_expires = (time.time() +
+                                              ACCESS_TOKEN_LIFETIME)
+            return self._access_token
+
+    def _access_token_expired(self):
+        # We don't know when access tokens passed to the constructor expire,
+        # but without a refresh token there's nothing we can do about it.
+        return (self._access_token_expires is not None and
+                time.time() >= self._access_token_expires)
+
+    def get_bridge(self):
+        access_token = self.get_access_token()
+        if getattr(self._local, 'access_token', None) != access_token:
+            self._local.bridge = YoutubeAPIBridge(access_token)
+            self._local.access_token = access_token
+        return self._local.bridge
+
+    def get_caption_info(self, video_id):
+        if video_id not in self._caption_info:
+            self._caption_info[video_id] = self.get_bridge().get_caption_info(
+                video_id)
+        return self._caption_info[video_id]
+
+    def delete_track(self, video_id, language_code):
+        """Delete a caption track if it exists
 
-    bridge = YoutubeAPIBridge(access_token)
+        :returns: True if the track was deleted
+        """
+        caption_info = self.get_caption_info(video_id)
+        if language_code not in caption_info:
+            return False
+        self.get_bridge().delete_track(video_id,
+                                       caption_info[language_code]['track'])
+        del caption_info[language_code]
+        return True
+
+def update_subtitles(video_id, access_token, subtitle_version, session=None):
+    """Push the subtitles for a language to YouTube
+
+    Pass a SyncSession to reuse the API client and caption info between
+    calls, otherwise access_token is used to create a new one.
+    """
+
+    if session is None:
+        session = SyncSession(access_token=access_token)
+    bridge = session.get_bridge()
     try:
         language_code = bridge.get_youtube_language_code(
             subtitle_version.subtitle_language.language_code)
@@ -132,30 +205,26 @@ def update_subtitles(video_id, access_token, subtitle_version):
     content = _format_subs_for_youtube(subs)
     title = ""
 
-    caption_info = bridge.get_caption_info(video_id)
-
     # We can't just update a subtitle track in place.  We need to delete
     # the old one and upload a new one.
-    if language_code in caption_info:
-        bridge.delete_track(video_id, caption_info[language_code]['track'])
+    session.delete_track(video_id, language_code)
 
     bridge.create_track(video_id, title, language_code, content)
     Meter('youtube.subs_pushed').inc()
 
-def delete_subtitles(video_id, access_token, language_code):
+def delete_subtitles(video_id, access_token, language_code, session=None):
     """Delete the subtitles for a language on YouTube """
 
-    bridge = YoutubeAPIBridge(access_token)
+    if session is None:
+        session = SyncSession(access_token=access_token)
     try:
-        language_code = bridge.get_youtube_language_code(language_code)
+        language_code = session.get_bridge().get_youtube_language_code(
+            language_code)
     except KeyError:
         logger.error("Couldn't encode LC %s to youtube" % language_code)
         return
 
-    caption_info = bridge.get_caption_info(video_id)
-    if language_code in caption_info:
-        bridge.delete_track(video_id, caption_info[language_code]['track'])
-    else:
+    if not session.delete_track(video_id, language_code):
         logger.error("Couldn't find LC %s in youtube" % language_code)
 
 def should_add_credit_to_subtitles(subtitle_version, subs):
@@ -24,6 +24,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from externalsites import credit
 from externalsites import subfetch
 from externalsites.models import get_account, get_sync_account
+from externalsites.syncengine import SyncEngine
 from subtitles.models import SubtitleLanguage, SubtitleVersion
 from utils import youtube
 from videos.models import VideoUrl
@@ -108,20 +109,7 @@ def update_all_subtitles(account_type, account_id):
             }
         )
         return
-    if account.team:
-        videos = account.team.videos
-    else:
-        videos = account.user.video_set
-
-    for video in videos.all():
-        for video_url in video.get_video_urls():
-            video_url.fix_owner_username()
-            if account.should_sync_video_url(video, video_url):
-                _sync_all_languages(account, video_url, video)
-
-def _sync_all_languages(account, video_url, video):
-    for language in video.newsubtitlelanguage_set.having_public_versions():
-        account.update_subtitles(video_url, language)
+    SyncEngine(account).run()
 
 @task
 def add_amara_credit(video_url_id):
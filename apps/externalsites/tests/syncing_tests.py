@@ -31,7 +31,7 @@ from externalsites import signalhandlers
 from externalsites.exceptions import SyncingError
 from externalsites.models import (KalturaAccount, SyncedSubtitleVersion,
                                   SyncHistory, get_sync_account)
-from externalsites.syncing import kaltura, brightcove
+from externalsites.syncing import kaltura, brightcove, youtube
 from subtitles import pipeline
 from subtitles.models import ORIGIN_IMPORTED
 from teams.permissions_const import ROLE_ADMIN
@@ -285,6 +285,27 @@ class SubtitleTaskTest(TestCase):
                 ])
                 self.check_no_synced_version(language)
 
+    def test_upload_all_subtitles_skips_synced_languages(self):
+        fr_1 = pipeline.add_subtitles(self.video, 'fr', None)
+        fr_2 = pipeline.add_subtitles(self.video, 'fr', None)
+        en = self.video.subtitle_language('en')
+        fr = fr_1.subtitle_language
+        self.reset_history()
+        SyncedSubtitleVersion.objects.set_synced_version(
+            self.account, self.video_url, en, en.get_tip())
+        SyncedSubtitleVersion.objects.set_synced_version(
+            self.account, self.video_url, fr, fr_1)
+
+        self.run_update_all_subtitles()
+        self.assertEquals(self.mock_update_subtitles.call_count, 1)
+        self.mock_update_subtitles.assert_called_with(self.video_url, fr,
+                                                      fr_2)
+        self.check_synced_version(fr, fr_2)
+
+        self.mock_update_subtitles.reset_mock()
+        self.run_update_all_subtitles()
+        self.assertEquals(self.mock_update_subtitles.call_count, 0)
+
     def test_history(self):
         en_1 = self.video.subtitle_language('en').get_tip()
         en_2 = pipeline.add_subtitles(self.video, 'en', None)
@@ -346,6 +367,67 @@ class SubtitleTaskTest(TestCase):
         self.assertEquals(list(SyncHistory.objects.get_for_language(fr)),
                           list(reversed(french_history)))
 
+class YouTubeSyncSessionTest(TestCase):
+    @patch_for_test('utils.youtube.get_new_access_token')
+    @patch_for_test('externalsites.syncing.youtube.YoutubeAPIBridge')
+    def setUp(self, MockBridge, mock_get_new_access_token):
+        self.mock_get_new_access_token = mock_get_new_access_token
+        self.mock_get_new_access_token.return_value = 'test-access-token'
+        self.MockBridge = MockBridge
+        self.bridge = MockBridge.return_value
+        self.bridge.get_youtube_language_code.side_effect = lambda lc: lc
+        self.bridge.get_caption_info.return_value = {
+            'en': {'url': 'http://example.com/en', 'track': 'en-track'},
+        }
+        self.video = VideoFactory()
+
+    def test_reuse_session(self):
+        versions = [pipeline.add_subtitles(self.video, language_code, None)
+                    for language_code in ('en', 'fr', 'de')]
+        session = youtube.SyncSession('test-refresh-token')
+        for version in versions:
+            youtube.update_subtitles('test-video-id', None, version,
+                                     session=session)
+        self.mock_get_new_access_token.assert_called_once_with(
+            'test-refresh-token')
+        self.MockBridge.assert_called_once_with('test-access-token')
+        self.bridge.get_caption_info.assert_called_once_with('test-video-id')
+        self.bridge.delete_track.assert_called_once_with('test-video-id',
+                                                         'en-track')
+        self.assertEquals(self.bridge.create_track.call_count, 3)
+
+    def test_no_session(self):
+        version = pipeline.add_subtitles(self.video, 'en', None)
+        youtube.update_subtitles('test-video-id', 'test-access-token',
+                                 version)
+        self.assertEquals(self.mock_get_new_access_token.call_count, 0)
+        self.MockBridge.assert_called_once_with('test-access-token')
+
+    def test_refresh_access_token(self):
+        version = pipeline.add_subtitles(self.video, 'en', None)
+        with mock.patch('externalsites.syncing.youtube.time') as mock_time:
+            mock_time.time.return_value = 1000
+            session = youtube.SyncSession('test-refresh-token')
+            youtube.update_subtitles('test-video-id', None, version,
+                                     session=session)
+            # later syncs in the same session should get a new token once
+            # the old one is about to expire
+            self.mock_get_new_access_token.return_value = 'new-access-token'
+            mock_time.time.return_value = (1000 +
+                                           youtube.ACCESS_TOKEN_LIFETIME - 1)
+            youtube.update_subtitles('test-video-id', None, version,
+                                     session=session)
+            self.assertEquals(self.mock_get_new_access_token.call_count, 1)
+            mock_time.time.return_value = (1000 +
+                                           youtube.ACCESS_TOKEN_LIFETIME)
+            youtube.update_subtitles('test-video-id', None, version,
+                                     session=session)
+        self.assertEquals(self.mock_get_new_access_token.call_count, 2)
+        self.assertEquals(self.MockBridge.call_args_list, [
+            mock.call('test-access-token'),
+            mock.call('new-access-token'),
+        ])
+
 class KalturaAccountTest(TestCase):
     def setUp(self):
         TestCase.setUp(self)
@@ -655,6 +737,54 @@ class KalturaSyncingTest(TestCase):
                               self.partner_id, self.secret, self.video_id,
                               'en', "CaptionData")
 
+    def test_sync_session(self):
+        kaltura.clear_session_cache()
+        mocker = KalturaApiMocker(self.partner_id, self.secret, self.video_id)
+        mocker.expect_session_start()
+        mocker.expect_captionasset_list(return_captions=[
+            ('captionid', 'English', 100, kaltura.PARTNER_DATA_TAG),
+        ])
+        mocker.expect_captionasset_setcontent('captionid', "EnglishData",
+                                              "English")
+        mocker.expect_captionasset_add('captionid2', 'French')
+        mocker.expect_captionasset_setcontent('captionid2', "FrenchData",
+                                              "French")
+        # The next session should reuse the cached kaltura session
+        mocker.expect_captionasset_list(return_captions=[
+            ('captionid', 'English', 100, kaltura.PARTNER_DATA_TAG),
+            ('captionid2', 'French', 100, kaltura.PARTNER_DATA_TAG),
+        ])
+        mocker.expect_captionasset_delete('captionid2')
+        with mocker:
+            kaltura.update_all_subtitles(
+                self.partner_id, self.secret, self.video_id, [
+                    ('en', "EnglishData"),
+                    ('fr', "FrenchData"),
+                ])
+            session = kaltura.SyncSession(self.partner_id, self.secret)
+            session.delete_subtitles(self.video_id, 'fr')
+            session.delete_subtitles(self.video_id, 'fr')
+
+    def test_sync_session_expired(self):
+        kaltura.clear_session_cache()
+        mocker = KalturaApiMocker(self.partner_id, self.secret, self.video_id)
+        mocker.expect_session_start()
+        mocker.expect_api_call(
+            'caption_captionasset', 'list', {
+                'ks': mocker.session_id,
+                'filter:entryIdEqual': self.video_id,
+            },
+            mocker.error_response(kaltura.INVALID_KS_CODE, 'Invalid KS'))
+        mocker.expect_session_start()
+        mocker.expect_captionasset_list(return_captions=[
+            ('captionid', 'English', 100, kaltura.PARTNER_DATA_TAG),
+        ])
+        mocker.expect_captionasset_setcontent('captionid', "CaptionData",
+                                              "English")
+        with mocker:
+            session = kaltura.SyncSession(self.partner_id, self.secret)
+            session.update_subtitles(self.video_id, 'en', "CaptionData")
+
     def test_invalid_kaltura_language(self):
         # test what happens when we try to sync a language that doesn't map to
         # a kaltura language, like pt-br
@@ -30,6 +30,7 @@ from django.views.generic.list_detail import object_list
 
 from auth.models import CustomUser as User
 from auth.models import UserLanguage
+from kombu_backends.amazonsqs import batch_sends
 from messages.forms import SendMessageForm, NewMessageForm
 from messages.models import Message
 from messages.rpc import MessagesApiClass
@@ -134,9 +135,10 @@ def new(request):
                 # Creating a bunch of reasonably-sized tasks
                 batch = 0
                 batch_size = 1000
-                while batch < len(new_messages_ids):
-                    send_new_messages_notifications.delay(new_messages_ids[batch:batch+batch_size])
-                    batch += batch_size
+                with batch_sends():
+                    while batch < len(new_messages_ids):
+                        send_new_messages_notifications.delay(new_messages_ids[batch:batch+batch_size])
+                        batch += batch_size
 
             messages.success(request, _(u'Message sent.'))
             return HttpResponseRedirect(reverse('messages:inbox'))
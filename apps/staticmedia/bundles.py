@@ -28,6 +28,9 @@ the files does several things.
 See the bundle_* functions for exactly what we do for various media types.
 """
 
+from __future__ import absolute_import
+
+import hashlib
 import os
 import time
 
@@ -38,10 +41,36 @@ from django.core.urlresolvers import reverse
 from django.template.loader import render_to_string
 
 from staticmedia import utils
+from utils.compress import gzip_string
 
 def static_root():
     return settings.STATIC_ROOT
 
+class BundleBuild(object):
+    """The result of building a bundle.
+
+    We store the built contents along with a gzipped copy and a hash of the
+    contents.  This lets the bundle views serve up precompressed data and
+    handle conditional requests without doing any work per-request.
+
+    Attributes:
+        contents: built bundle data
+        gzipped_contents: contents compressed with gzip
+        etag: hash of the contents, suitable for use in an ETag header
+        build_time: time when the bundle was built
+        commit_id: LAST_COMMIT_GUID of the code that built the bundle
+    """
+    def __init__(self, contents, build_time=None):
+        if build_time is None:
+            build_time = time.time()
+        if isinstance(contents, unicode):
+            contents = contents.encode('utf-8')
+        self.contents = contents
+        self.gzipped_contents = gzip_string(contents)
+        self.etag = hashlib.sha1(contents).hexdigest()
+        self.build_time = build_time
+        self.commit_id = settings.LAST_COMMIT_GUID
+
 class Bundle(object):
     """Represents a single media bundle."""
 
@@ -92,23 +121,41 @@ class Bundle(object):
     def cache_key(self):
         return 'staticmedia:bundle:%s' % self.name
 
-    def get_contents(self):
-        """Get the data for this bundle.
+    def is_current(self, build):
+        """Check if a BundleBuild from the cache can still be used.
+
+        In DEBUG mode, we check the mtimes of our files so that changes show
+        up right away.  Otherwise the files only change when we deploy, so we
+        just make sure that the build came from the current commit rather
+        than stat-ing every file on each request.
+        """
+        if not isinstance(build, BundleBuild):
+            return False
+        if settings.DEBUG:
+            return not self.modified_since(build.build_time)
+        else:
+            return build.commit_id == settings.LAST_COMMIT_GUID
+
+    def get_build(self):
+        """Get a BundleBuild for this bundle.
 
         The first time this method is called, we will build the bundle, then
         store the result in the django cache.
 
-        On subsequent calls, we will only build the bundle again if one of our
-        files has been modified since the last build.
+        On subsequent calls, we will only build the bundle again if
+        is_current() returns False for the cached build.
         """
-        cached_value = cache.get(self.cache_key())
-        if cached_value is not None:
-            if not self.modified_since(cached_value[0]):
-                return cached_value[1]
-        cache_time = time.time()
-        rv = self.build_contents()
-        cache.set(self.cache_key(), (cache_time, rv))
-        return rv
+        build = cache.get(self.cache_key())
+        if build is not None and self.is_current(build):
+            return build
+        build_time = time.time()
+        build = BundleBuild(self.build_contents(), build_time)
+        cache.set(self.cache_key(), build)
+        return build
+
+    def get_contents(self):
+        """Get the data for this bundle."""
+        return self.get_build().contents
 
 class JavascriptBundle(Bundle):
     """Bundle Javascript files.
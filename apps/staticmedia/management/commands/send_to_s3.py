@@ -16,10 +16,8 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
-from cStringIO import StringIO
 import datetime
 import email
-import gzip
 import mimetypes
 import time
 import optparse
@@ -34,6 +32,7 @@ from deploy.git_helpers import get_current_commit_hash
 from staticmedia import bundles
 from staticmedia import oldembedder
 from staticmedia import utils
+from utils.compress import gzip_string
 
 class Command(BaseCommand):
     help = """Upload static media to S3 """
@@ -121,11 +120,7 @@ class Command(BaseCommand):
                 content_type == 'application/javascript')
 
     def compress_string(self, data):
-        zbuf = StringIO()
-        zfile = gzip.GzipFile(mode='wb', compresslevel=6, fileobj=zbuf)
-        zfile.write(data)
-        zfile.close()
-        return zbuf.getvalue()
+        return gzip_string(data)
 
     def upload_old_embedder(self):
         # the old embedder is a little different the the others, since we put
@@ -18,14 +18,19 @@
 
 from __future__ import absolute_import
 
+from cStringIO import StringIO
+import gzip
+import hashlib
 import os
 
 from django.conf import settings
 from django.core.cache import cache
 from django.test import TestCase
+from django.test.client import RequestFactory
 from django.test.utils import override_settings
 
 from staticmedia import bundles
+from staticmedia import views
 from utils import test_utils
 
 @override_settings(MEDIA_BUNDLES={
@@ -140,6 +145,7 @@ class TestCaching(TestCase):
         self.bundle = bundles.Bundle('bundle.js', {
             'files': ('foo.js', 'bar.js')
         })
+        cache.delete(self.bundle.cache_key())
 
     @test_utils.patch_for_test('os.path.getmtime')
     def test_modified_since(self, mock_getmtime):
@@ -161,6 +167,7 @@ class TestCaching(TestCase):
         self.assertEqual(self.bundle.cache_key(),
                          'staticmedia:bundle:bundle.js')
 
+    @override_settings(DEBUG=True)
     @test_utils.patch_for_test('staticmedia.bundles.Bundle.modified_since')
     @test_utils.patch_for_test('staticmedia.bundles.Bundle.build_contents')
     def test_get_contents(self, mock_build, mock_modified_since):
@@ -181,3 +188,88 @@ class TestCaching(TestCase):
         self.assertEqual(self.bundle.get_contents(), 'build-output')
         self.assertEqual(mock_build.call_count, 2)
         self.assertEqual(mock_modified_since.call_count, 2)
+
+    @override_settings(DEBUG=False)
+    @test_utils.patch_for_test('staticmedia.bundles.Bundle.modified_since')
+    @test_utils.patch_for_test('staticmedia.bundles.Bundle.build_contents')
+    def test_get_contents_no_debug(self, mock_build, mock_modified_since):
+        mock_build.return_value = 'build-output'
+        self.assertEqual(self.bundle.get_contents(), 'build-output')
+        self.assertEqual(mock_build.call_count, 1)
+        # outside of DEBUG mode, we shouldn't check the mtimes of the files
+        self.assertEqual(self.bundle.get_contents(), 'build-output')
+        self.assertEqual(mock_build.call_count, 1)
+        self.assertEqual(mock_modified_since.call_count, 0)
+        # we should rebuild the bundle if it was built by a different commit
+        with self.settings(LAST_COMMIT_GUID='test/new-commit'):
+            self.assertEqual(self.bundle.get_contents(), 'build-output')
+        self.assertEqual(mock_build.call_count, 2)
+        self.assertEqual(mock_modified_since.call_count, 0)
+
+    def test_build(self):
+        build = bundles.BundleBuild('build-output')
+        self.assertEqual(build.contents, 'build-output')
+        self.assertEqual(build.etag, hashlib.sha1('build-output').hexdigest())
+        self.assertEqual(gzip.GzipFile(
+            fileobj=StringIO(build.gzipped_contents)).read(), 'build-output')
+
+class TestBundleView(TestCase):
+    @test_utils.patch_for_test('staticmedia.bundles.Bundle.build_contents')
+    def setUp(self, mock_build):
+        mock_build.return_value = 'build-output'
+        self.bundle = bundles.JavascriptBundle('bundle.js', {
+            'files': ('foo.js', 'bar.js')
+        })
+        cache.delete(self.bundle.cache_key())
+        self.build = self.bundle.get_build()
+        self.factory = RequestFactory()
+
+    def get_response(self, **headers):
+        request = self.factory.get('/media/js/bundle.js', **headers)
+        return views._bundle(request, 'bundle.js', bundles.JavascriptBundle)
+
+    @test_utils.patch_for_test('staticmedia.bundles.get_bundle')
+    def test_uncompressed(self, mock_get_bundle):
+        mock_get_bundle.return_value = self.bundle
+        response = self.get_response()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, 'build-output')
+        self.assertEqual(response['ETag'], '"%s"' % self.build.etag)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assert_(not response.has_header('Content-Encoding'))
+        self.assert_(response.has_header('Cache-Control'))
+
+    @test_utils.patch_for_test('staticmedia.bundles.get_bundle')
+    def test_gzip(self, mock_get_bundle):
+        mock_get_bundle.return_value = self.bundle
+        response = self.get_response(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.build.gzipped_contents)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], '"%s-gzip"' % self.build.etag)
+
+    @test_utils.patch_for_test('staticmedia.bundles.get_bundle')
+    def test_gzip_refused(self, mock_get_bundle):
+        mock_get_bundle.return_value = self.bundle
+        response = self.get_response(HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, 'build-output')
+        self.assert_(not response.has_header('Content-Encoding'))
+
+    @test_utils.patch_for_test('staticmedia.bundles.get_bundle')
+    def test_not_modified(self, mock_get_bundle):
+        mock_get_bundle.return_value = self.bundle
+        response = self.get_response(
+            HTTP_IF_NONE_MATCH='"%s"' % self.build.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+        self.assertEqual(response['ETag'], '"%s"' % self.build.etag)
+        # the gzip representation has a different ETag
+        response = self.get_response(
+            HTTP_IF_NONE_MATCH='"%s"' % self.build.etag,
+            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        response = self.get_response(
+            HTTP_IF_NONE_MATCH='"other", "%s-gzip"' % self.build.etag,
+            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 304)
@@ -16,13 +16,15 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from __future__ import absolute_import
+
 from django.conf import settings
 from django.http import HttpResponse, Http404
 from django.shortcuts import render
 
 from staticmedia import bundles
 from staticmedia import oldembedder
-from staticmedia import utils
+from utils.http import conditional_gzip_response
 
 def js_bundle(request, bundle_name):
     return _bundle(request, bundle_name, bundles.JavascriptBundle)
@@ -37,7 +39,17 @@ def _bundle(request, bundle_name, correct_type):
         raise Http404()
     if not isinstance(bundle, correct_type):
         raise Http404()
-    return HttpResponse(bundle.get_contents(), bundle.mime_type)
+    build = bundle.get_build()
+    response = conditional_gzip_response(request, build.etag,
+                                         build.gzipped_contents,
+                                         bundle.mime_type,
+                                         content=build.contents)
+    if settings.DEBUG:
+        response['Cache-Control'] = 'no-cache'
+    else:
+        response['Cache-Control'] = 'public, max-age=%d' % getattr(
+            settings, 'STATIC_MEDIA_BUNDLE_MAX_AGE', 300)
+    return response
 
 def old_embedder_js(request):
     return HttpResponse(oldembedder.js_code(), 'text/javascript')
@@ -19,6 +19,11 @@
 """stastic.hitcounts -- count/aggregate hits
 
 This module handles tracking video hits and subtitle language views.
+
+If HITCOUNTS_WRITE_BEHIND is set, hits are counted in redis instead of
+inserting a row into the hit table for each one.  HitCountMigrater drains the
+redis counters into the per-day table along with the rows from the hit table,
+so the two modes can be switched without losing hits.
 """
 
 import collections
@@ -26,11 +31,16 @@ import datetime
 import string
 
 from django import db
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import F, Sum
 
 from statistic import models
 from utils import applock
+from utils.redis_utils import default_connection
+
+WRITE_BEHIND = getattr(settings, 'HITCOUNTS_WRITE_BEHIND', False)
 
 def now():
     return datetime.datetime.now()
@@ -41,6 +51,142 @@ def next_month(date):
     else:
         return date.replace(year=date.year+1, month=1)
 
+def group_by_count(counts):
+    """Group object ids by their count
+
+    This lets us update the counts for many objects using a query per
+    distinct count, which is much less than a query per object in practice.
+
+    :param counts: dict mapping object ids to counts
+    :returns: dict mapping counts to lists of object ids
+    """
+    rv = collections.defaultdict(list)
+    for obj_id, count in counts.items():
+        rv[count].append(obj_id)
+    return rv
+
+class RedisHitCounter(object):
+    """Counts hits in redis.
+
+    Hits are bucketed by hour.  Each bucket is a hash that maps object ids to
+    hit counts.  We also keep a set of days that have buckets, so that we know
+    what to drain when migrating.
+
+    Draining happens in 2 steps so that we don't lose hits if the database
+    transaction that stores them gets rolled back.  stage_day() renames the
+    buckets to staging keys and returns their counts.  Once the transaction
+    commits, delete_staged() deletes the staging keys.  If something goes
+    wrong before then, restore_staged() merges the staging keys back into the
+    buckets.
+    """
+    # Keep buckets around long enough that we don't lose hits if the
+    # migration doesn't run for a while.
+    BUCKET_TIMEOUT = 60 * 60 * 24 * 14
+
+    def __init__(self, key_prefix, connection=None):
+        self.key_prefix = key_prefix
+        self.connection = connection or default_connection
+
+    def bucket_key(self, dt):
+        return '%s-%s' % (self.key_prefix, dt.strftime('%Y%m%d%H'))
+
+    def days_key(self):
+        return '%s-days' % self.key_prefix
+
+    def staging_key(self, bucket_key):
+        return '%s-staging' % bucket_key
+
+    def staged_buckets_key(self):
+        """Key for the set of bucket keys that have been staged."""
+        return '%s-staged' % self.key_prefix
+
+    def bucket_date(self, bucket_key):
+        return datetime.datetime.strptime(bucket_key[-10:], '%Y%m%d%H').date()
+
+    def add_hit(self, obj_id, dt):
+        key = self.bucket_key(dt)
+        pipe = self.connection.pipeline()
+        pipe.hincrby(key, obj_id, 1)
+        pipe.expire(key, self.BUCKET_TIMEOUT)
+        pipe.sadd(self.days_key(), dt.date().isoformat())
+        pipe.execute()
+
+    def count_hits(self, obj_id, start_datetime, end_datetime):
+        """Count hits for an object between 2 datetimes.
+
+        This only has an hour of precision, we count all hits in the buckets
+        for start_datetime and end_datetime.
+        """
+        pipe = self.connection.pipeline()
+        hour = start_datetime.replace(minute=0, second=0, microsecond=0)
+        while hour <= end_datetime:
+            pipe.hget(self.bucket_key(hour), obj_id)
+            hour += datetime.timedelta(hours=1)
+        return sum(int(count) for count in pipe.execute()
+                   if count is not None)
+
+    def days_to_drain(self, end_date):
+        """Get the days that have hits before end_date."""
+        days = [datetime.datetime.strptime(day, '%Y-%m-%d').date()
+                for day in self.connection.smembers(self.days_key())]
+        return sorted(day for day in days if day < end_date)
+
+    def stage_day(self, date):
+        """Move the counts for a day to staging keys
+
+        Call restore_staged() before this, otherwise we could overwrite
+        counts that are already staged.
+
+        :returns: dict mapping object ids to hit counts
+        """
+        start = datetime.datetime.combine(date, datetime.time())
+        keys = [self.bucket_key(start + datetime.timedelta(hours=i))
+                for i in range(24)]
+        pipe = self.connection.pipeline()
+        for key in keys:
+            pipe.exists(key)
+        keys = [key for key, exists in zip(keys, pipe.execute()) if exists]
+        # Buckets only get created, so the keys still exist.  This pipeline
+        # is a transaction, so each bucket is either in the staging set or
+        # still has its original key.
+        pipe = self.connection.pipeline()
+        for key in keys:
+            pipe.rename(key, self.staging_key(key))
+            pipe.sadd(self.staged_buckets_key(), key)
+        pipe.srem(self.days_key(), date.isoformat())
+        pipe.execute()
+
+        pipe = self.connection.pipeline()
+        for key in keys:
+            pipe.hgetall(self.staging_key(key))
+        counts = collections.defaultdict(int)
+        for bucket in pipe.execute():
+            for obj_id, count in bucket.items():
+                counts[int(obj_id)] += int(count)
+        return counts
+
+    def delete_staged(self):
+        """Delete the staged counts once they've been stored."""
+        keys = self.connection.smembers(self.staged_buckets_key())
+        pipe = self.connection.pipeline()
+        for key in keys:
+            pipe.delete(self.staging_key(key))
+        pipe.delete(self.staged_buckets_key())
+        pipe.execute()
+
+    def restore_staged(self):
+        """Merge staged counts that weren't stored back into the buckets."""
+        for key in self.connection.smembers(self.staged_buckets_key()):
+            counts = self.connection.hgetall(self.staging_key(key))
+            pipe = self.connection.pipeline()
+            for obj_id, count in counts.items():
+                pipe.hincrby(key, obj_id, int(count))
+            pipe.expire(key, self.BUCKET_TIMEOUT)
+            pipe.sadd(self.days_key(), self.bucket_date(key).isoformat())
+            pipe.delete(self.staging_key(key))
+            pipe.srem(self.staged_buckets_key(), key)
+            pipe.execute()
+
 class HitCountMigrater(object):
     """Handles migrating hit counts from table to table.
 
@@ -54,27 +200,36 @@ class HitCountMigrater(object):
     happened a while ago.
 
     Specifically we:
-    - Aggregate data from the hit table to the per-day table once the day is
-    complete
+    - Aggregate data from the hit table and the redis counters to the per-day
+    table once the day is complete
     - Aggregate data from the per-day table to the per-month table once the
     month is complete
     - Delete rows from the hit table older than 24 hours
     - Delete rows from the per-day table older than 30 days
     """
     def __init__(self, obj_field_name, hit_model, per_day_model,
-                 per_month_model, last_hit_counter_migration_type):
+                 per_month_model, last_hit_counter_migration_type,
+                 redis_counter=None):
         self.obj_field_name = obj_field_name
         self.hit_model = hit_model
         self.per_day_model = per_day_model
         self.per_month_model = per_month_model
         self.last_hit_counter_migration_type = last_hit_counter_migration_type
+        self.redis_counter = redis_counter
 
     def migrate(self):
         lock_name = ('hitcount-migration-%s' %
                      self.last_hit_counter_migration_type)
-        with transaction.commit_on_success():
-            with applock.lock(lock_name):
+        # The lock is a MySQL GET_LOCK(), so it's independent of the
+        # transaction and we can hold it until the staged redis counts are
+        # deleted.
+        with applock.lock(lock_name):
+            if self.redis_counter is not None:
+                self.redis_counter.restore_staged()
+            with transaction.commit_on_success():
                 self._migrate()
+            if self.redis_counter is not None:
+                self.redis_counter.delete_staged()
 
     def _migrate(self):
         # calculate now once and keep it constant throughout the migration
@@ -82,6 +237,8 @@ class HitCountMigrater(object):
         last_migration = self.get_last_migration()
         cursor = db.connection.cursor()
         self.migrate_hits(cursor, now_value, last_migration)
+        if self.redis_counter is not None:
+            self.migrate_redis_counts(now_value)
         self.migrate_per_day_counts(cursor, now_value, last_migration)
         self.delete_old_rows(cursor, now_value, last_migration)
         self.update_last_hit_counter_migration(now_value, last_migration)
@@ -127,6 +284,44 @@ class HitCountMigrater(object):
                 hit_table=self.hit_model._meta.db_table)
         cursor.execute(sql, (date, date, date + datetime.timedelta(days=1)))
 
+    def migrate_redis_counts(self, now):
+        # The counts stay in redis staging keys until migrate() deletes them
+        # after our transaction commits.
+        for date in self.redis_counter.days_to_drain(now.date()):
+            counts = self.redis_counter.stage_day(date)
+            self.add_per_day_counts(date, counts)
+
+    def add_per_day_counts(self, date, counts):
+        """Add counts from redis to the per-day table
+
+        :param counts: dict mapping object ids to counts
+        :returns: dict of the counts that were added
+        """
+        obj_field = self.obj_field_name
+        obj_model = self.per_day_model._meta.get_field(obj_field).rel.to
+        # skip counts for objects that have been deleted
+        obj_ids = set(obj_model.objects.filter(pk__in=counts.keys())
+                      .values_list('pk', flat=True))
+        counts = dict((obj_id, count) for obj_id, count in counts.items()
+                      if obj_id in obj_ids)
+        # the per-day table might already have rows from the hit table
+        day_qs = self.per_day_model.objects.filter(date=date)
+        existing_ids = set(day_qs.filter(**{obj_field + '__in': obj_ids})
+                           .values_list(obj_field, flat=True))
+        existing_counts = dict((obj_id, count)
+                               for obj_id, count in counts.items()
+                               if obj_id in existing_ids)
+        for count, ids in group_by_count(existing_counts).items():
+            (day_qs.filter(**{obj_field + '__in': ids})
+             .update(count=F('count') + count))
+        self.per_day_model.objects.bulk_create([
+            self.per_day_model(date=date, count=count,
+                               **{obj_field + '_id': obj_id})
+            for obj_id, count in counts.items()
+            if obj_id not in existing_ids
+        ])
+        return counts
+
     def months_to_migrate_day_counts(self, now, last_migration):
         if last_migration.date is not None:
             month = last_migration.date.replace(day=1)
@@ -195,6 +390,8 @@ class HitCountMigrater(object):
     def update_last_hit_counter_migration(self, now, last_migration):
         last_migration.date = now.date()
         last_migration.save()
+        cache.delete(last_migration_cache_key(
+            self.last_hit_counter_migration_type))
 
 
 class VideoHitCountMigrater(HitCountMigrater):
@@ -211,6 +408,17 @@ WHERE videos_video.id IN (
     WHERE perday.date=%s)"""
         cursor.execute(sql, (date, date, ))
 
+    def add_per_day_counts(self, date, counts):
+        counts = HitCountMigrater.add_per_day_counts(self, date, counts)
+        from videos.models import Video
+        for count, video_ids in group_by_count(counts).items():
+            (Video.objects.filter(id__in=video_ids)
+             .update(view_count=F('view_count') + count))
+        return counts
+
+def last_migration_cache_key(last_hit_counter_migration_type):
+    return 'hitcounts-last-migration-%s' % last_hit_counter_migration_type
+
 class HitCountManager(object):
     """Track hit counts
 
@@ -233,20 +441,32 @@ class HitCountManager(object):
     # type value for the LastHitCountMigration table
     last_hit_counter_migration_type = None
 
+    # count hits in redis rather than the hit table
+    write_behind = WRITE_BEHIND
+    # how long to cache the per-day/per-month totals.  They only change when
+    # we migrate, so this can be long.
+    AGGREGATE_CACHE_TIMEOUT = 60 * 60 * 24
+
     # code starts here:
     def __init__(self):
+        self.redis_counter = RedisHitCounter(
+            'hitcounts-%s' % self.last_hit_counter_migration_type)
         self.migrater = self.make_hit_count_migrater()
 
     def make_hit_count_migrater(self):
         return HitCountMigrater(self.obj_field_name, self.hit_model,
                                 self.per_day_model,
                                 self.per_month_model,
-                                self.last_hit_counter_migration_type)
+                                self.last_hit_counter_migration_type,
+                                self.redis_counter)
 
     def add_hit(self, obj):
-        self.hit_model.objects.create(**{
-            self.obj_field_name: obj,
-            'datetime': now()})
+        if self.write_behind:
+            self.redis_counter.add_hit(obj.pk, now())
+        else:
+            self.hit_model.objects.create(**{
+                self.obj_field_name: obj,
+                'datetime': now()})
 
     def migrate(self):
         """Migrate hit counts for an object.
@@ -284,33 +504,61 @@ class HitCountManager(object):
     def get_counts(self, obj):
         """Get the hitcounts for an object.
 
+        The week/month/year counts come from the per-day/per-month tables and
+        are cached until the next migration.  The today count merges hits
+        from the hit table and from redis.
+
         returns a dict with keys for various counts (today, week, month, year)
         """
-        yesterday = now() - datetime.timedelta(days=1)
+        current_time = now()
+        yesterday = current_time - datetime.timedelta(days=1)
         counts = self._get_aggregate_counts(obj)
         counts['today'] = self._count_hits(obj, yesterday)
+        if self.write_behind:
+            counts['today'] += self.redis_counter.count_hits(
+                obj.pk, yesterday, current_time)
         return counts
 
+    def _get_last_migration_date(self):
+        cache_key = last_migration_cache_key(
+            self.last_hit_counter_migration_type)
+        date = cache.get(cache_key)
+        if date is None:
+            try:
+                date = models.LastHitCountMigration.objects.get(
+                    type=self.last_hit_counter_migration_type).date
+            except models.LastHitCountMigration.DoesNotExist:
+                return None
+            cache.set(cache_key, date)
+        return date
+
     def _get_aggregate_counts(self, obj):
-        try:
-            last_migration = models.LastHitCountMigration.objects.get(
-                type=self.last_hit_counter_migration_type)
-        except models.LastHitCountMigration.DoesNotExist:
+        last_migration_date = self._get_last_migration_date()
+        if last_migration_date is None:
             return {
                 'week': 0,
                 'month': 0,
                 'year': 0,
             }
-        last_week = last_migration.date - datetime.timedelta(days=7)
-        last_month = last_migration.date - datetime.timedelta(days=30)
-        last_year = last_migration.date.replace(
-            day=1, year=last_migration.date.year-1)
-
-        return {
+        cache_key = 'hitcounts-%s-%s-%s' % (
+            self.last_hit_counter_migration_type, obj.pk,
+            last_migration_date.isoformat())
+        counts = cache.get(cache_key)
+        if counts is not None:
+            return counts
+
+        last_week = last_migration_date - datetime.timedelta(days=7)
+        last_month = last_migration_date - datetime.timedelta(days=30)
+        last_year = last_migration_date.replace(
+            day=1, year=last_migration_date.year-1)
+
+        counts = {
             'week': self._total_per_day_counts(obj, last_week),
             'month': self._total_per_day_counts(obj, last_month),
             'year': self._total_per_month_counts(obj, last_year),
         }
+        cache.set(cache_key, counts, self.AGGREGATE_CACHE_TIMEOUT)
+        return counts
 
 class VideoHitCountManager(HitCountManager):
     """Track hits on video pages"""
@@ -324,7 +572,8 @@ class VideoHitCountManager(HitCountManager):
         return VideoHitCountMigrater(self.obj_field_name, self.hit_model,
                                      self.per_day_model,
                                      self.per_month_model,
-                                     self.last_hit_counter_migration_type)
+                                     self.last_hit_counter_migration_type,
+                                     self.redis_counter)
 
 class SubtitleViewCountManager(HitCountManager):
     """Track subtitle views for video languages."""
@@ -360,3 +360,131 @@ class SubtitleViewCountManagerTest(HitCountManagerTestBase):
         ]
 
     last_hit_count_migration_type = 'S'
+
+class WriteBehindTest(TestCase):
+    @test_utils.patch_for_test('statistic.hitcounts.now')
+    def setUp(self, mock_now):
+        self.mock_now = mock_now
+        self.count_manager = hitcounts.VideoHitCountManager()
+        self.count_manager.write_behind = True
+        self.count_manager.redis_counter.key_prefix = 'test-hitcounts-V'
+        self.clear_redis()
+        self.video = VideoFactory()
+        self.video2 = VideoFactory()
+
+    def tearDown(self):
+        self.clear_redis()
+
+    def clear_redis(self):
+        redis_counter = self.count_manager.redis_counter
+        redis_counter.restore_staged()
+        for day in redis_counter.days_to_drain(date(2100, 1, 1)):
+            redis_counter.stage_day(day)
+        redis_counter.delete_staged()
+
+    def add_hit(self, obj, when):
+        self.mock_now.return_value = when
+        self.count_manager.add_hit(obj)
+
+    def migrate(self, when):
+        self.mock_now.return_value = when
+        self.count_manager.migrate()
+
+    def check_per_day_summaries(self, video, dates_and_counts):
+        per_day_qs = (self.count_manager.per_day_model.objects
+                      .filter(video=video).order_by('date'))
+        self.assertEquals([(o.date, o.count) for o in per_day_qs],
+                          dates_and_counts)
+
+    def test_add_hit_doesnt_write_to_db(self):
+        self.add_hit(self.video, datetime(2013, 1, 1, 0))
+        self.add_hit(self.video, datetime(2013, 1, 1, 1))
+        self.assertEquals(
+            self.count_manager.hit_model.objects.count(), 0)
+
+    def test_today_count(self):
+        self.add_hit(self.video, datetime(2013, 1, 1, 0))
+        self.add_hit(self.video, datetime(2013, 1, 1, 23))
+        self.add_hit(self.video, datetime(2013, 1, 2, 1))
+        self.add_hit(self.video2, datetime(2013, 1, 2, 1))
+        # hits in the hit table should be counted as well
+        self.count_manager.hit_model.objects.create(
+            video=self.video, datetime=datetime(2013, 1, 2, 1))
+        self.mock_now.return_value = datetime(2013, 1, 2, 5)
+        self.assertEquals(self.count_manager.get_counts(self.video)['today'],
+                          3)
+
+    def test_migrate(self):
+        self.add_hit(self.video, datetime(2013, 1, 1, 0))
+        self.add_hit(self.video, datetime(2013, 1, 1, 1))
+        self.add_hit(self.video, datetime(2013, 1, 2, 1))
+        self.add_hit(self.video2, datetime(2013, 1, 1, 1))
+        # hits in the hit table should be merged with the redis counts
+        self.count_manager.hit_model.objects.create(
+            video=self.video, datetime=datetime(2013, 1, 1, 3))
+        self.migrate(datetime(2013, 1, 2, 5))
+        self.check_per_day_summaries(self.video, [(date(2013, 1, 1), 3)])
+        self.check_per_day_summaries(self.video2, [(date(2013, 1, 1), 1)])
+        self.assertEquals(Video.objects.get(id=self.video.id).view_count, 3)
+        self.assertEquals(Video.objects.get(id=self.video2.id).view_count, 1)
+
+        self.migrate(datetime(2013, 1, 3, 5))
+        self.check_per_day_summaries(self.video, [
+            (date(2013, 1, 1), 3),
+            (date(2013, 1, 2), 1),
+        ])
+        self.assertEquals(Video.objects.get(id=self.video.id).view_count, 4)
+
+    def test_migrate_deleted_object(self):
+        self.add_hit(self.video, datetime(2013, 1, 1, 0))
+        self.add_hit(self.video2, datetime(2013, 1, 1, 0))
+        self.video2.delete()
+        self.migrate(datetime(2013, 1, 2, 5))
+        self.check_per_day_summaries(self.video, [(date(2013, 1, 1), 1)])
+
+    def test_migrate_failure_keeps_counts(self):
+        self.add_hit(self.video, datetime(2013, 1, 1, 0))
+        self.add_hit(self.video, datetime(2013, 1, 1, 1))
+        redis_counter = self.count_manager.redis_counter
+        migrater = self.count_manager.migrater
+        with mock.patch.object(migrater, 'delete_old_rows') as mock_delete:
+            mock_delete.side_effect = ValueError()
+            self.assertRaises(ValueError, self.migrate,
+                              datetime(2013, 1, 2, 5))
+        # the transaction was rolled back, so the counts should still be
+        # staged in redis
+        self.assertEquals(len(redis_counter.connection.smembers(
+            redis_counter.staged_buckets_key())), 2)
+        # the next migration should merge them back in before draining
+        with mock.patch.object(redis_counter, 'stage_day') as mock_stage:
+            mock_stage.return_value = {}
+            self.migrate(datetime(2013, 1, 2, 6))
+        mock_stage.assert_called_once_with(date(2013, 1, 1))
+        self.assertEquals(redis_counter.count_hits(
+            self.video.pk, datetime(2013, 1, 1, 0), datetime(2013, 1, 1, 23)),
+            2)
+
+    def test_restore_staged_merges_counts(self):
+        redis_counter = self.count_manager.redis_counter
+        self.add_hit(self.video, datetime(2013, 1, 1, 0))
+        self.assertEquals(redis_counter.stage_day(date(2013, 1, 1)),
+                          {self.video.pk: 1})
+        self.assertEquals(redis_counter.days_to_drain(date(2013, 1, 2)), [])
+        # a late hit for the same hour creates a new bucket
+        self.add_hit(self.video, datetime(2013, 1, 1, 0))
+        redis_counter.restore_staged()
+        self.assertEquals(redis_counter.days_to_drain(date(2013, 1, 2)),
+                          [date(2013, 1, 1)])
+        self.assertEquals(redis_counter.count_hits(
+            self.video.pk, datetime(2013, 1, 1, 0), datetime(2013, 1, 1, 0)),
+            2)
+
+    def test_staged_counts_deleted_after_migrate(self):
+        self.add_hit(self.video, datetime(2013, 1, 1, 0))
+        self.migrate(datetime(2013, 1, 2, 5))
+        redis_counter = self.count_manager.redis_counter
+        self.assertEquals(redis_counter.connection.smembers(
+            redis_counter.staged_buckets_key()), set())
+        self.assertEquals(redis_counter.count_hits(
+            self.video.pk, datetime(2013, 1, 1, 0), datetime(2013, 1, 1, 0)),
+            0)
@@ -16,25 +16,209 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import collections
+import copy
+import threading
+import zlib
+
+from babelsubs.storage import SubtitleSet
 from django.core.cache import cache
 
-TIMEOUT = 60 * 60 * 24 * 5 # 5 days
+from utils.compress import gzip_string, gunzip_string
+
+# Parsed subtitle sets --------------------------------------------------------
+#
+# SubtitleVersions are immutable, so once we've parsed the subtitles for
+# a version we can keep them around forever.  We use 2 levels of caching:
+#
+#   - A bounded LRU cache of SubtitleSet objects for this process
+#   - The django cache, which stores the normalized DFXP, zlib-compressed.
+#     This skips the base64 step and the DFXP parser cleanups that
+#     load_from() does.
+#
+# SubtitleSets are mutable, so we always hand out a copy of the cached
+# object.  Copying the lxml tree is much cheaper than parsing the XML again.
+
+SUBTITLES_TIMEOUT = 60 * 60 * 24 * 30 # 30 days
+SUBTITLES_LRU_SIZE = 500
+
+class LRUCache(object):
+    """Simple thread-safe LRU cache with a fixed maximum size."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return None
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+_subtitles_lru = LRUCache(SUBTITLES_LRU_SIZE)
+
+def _subtitles_id(version_id):
+    return u"subtitleversion-%s-subtitles" % (version_id,)
+
+def get_subtitles(version, loader):
+    """Get the SubtitleSet for a saved version.
+
+    :param version: SubtitleVersion to fetch subtitles for
+    :param loader: function that takes no arguments and parses the subtitles
+        from the version's serialized_subtitles field.  It will only be
+        called if the subtitles aren't already cached.
+    :returns: SubtitleSet that the caller can modify freely
+    """
+    subtitles = _subtitles_lru.get(version.pk)
+    if subtitles is None:
+        subtitles = _get_subtitles_from_cache(version)
+        if subtitles is None:
+            subtitles = loader()
+            cache.set(_subtitles_id(version.pk),
+                      zlib.compress(subtitles.to_xml()),
+                      SUBTITLES_TIMEOUT)
+        _subtitles_lru.set(version.pk, subtitles)
+    return copy.deepcopy(subtitles)
+
+def _get_subtitles_from_cache(version):
+    data = cache.get(_subtitles_id(version.pk))
+    if data is None:
+        return None
+    return SubtitleSet(version.language_code,
+                       initial_data=zlib.decompress(data))
+
+def clear_subtitles_lru():
+    """Clear the per-process subtitles cache.
+
+    There's no need to call this in normal operation, since versions never
+    change.  It's useful for the unittests, which reuse primary keys.
+    """
+    _subtitles_lru.clear()
+
+# Rendered exports ------------------------------------------------------------
+#
+# Rendering subtitles to SRT/VTT/DFXP/etc. means parsing the DFXP and walking
+# the whole tree.  Since versions never change, the output for a given
+# (version, format) pair never changes either, so we cache the rendered bytes.
+#
+# Exports are stored gzip-compressed, which lets the download views send them
+# as-is to clients that accept gzip.  Like the parsed subtitles, we use
+# a per-process LRU on top of the django cache.  The LRU is bounded by the
+# total size of the exports rather than the number of them, since exports
+# can vary from a few bytes to megabytes.
+
+EXPORTS_TIMEOUT = 60 * 60 * 24 * 30 # 30 days
+EXPORTS_LRU_MAX_BYTES = 16 * 1024 * 1024
+# Don't store exports bigger than this in the django cache.  memcached won't
+# store items over 1MB anyways.
+EXPORTS_MAX_CACHED_SIZE = 1000 * 1000
+# Change this if the rendering code changes to invalidate the old exports
+EXPORTS_VERSION = 1
+
+class SizedLRUCache(LRUCache):
+    """LRU cache that evicts items based on the total size of the values.
+
+    :param max_bytes: max total size of the values
+    :param sizeof: function that calculates the size of a value
+    """
+
+    def __init__(self, max_bytes, sizeof=len):
+        LRUCache.__init__(self, None)
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.total_size = 0
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old_value = self._data.pop(key, None)
+            if old_value is not None:
+                self.total_size -= self.sizeof(old_value)
+            self._data[key] = value
+            self.total_size += size
+            while self.total_size > self.max_bytes:
+                key, evicted = self._data.popitem(last=False)
+                self.total_size -= self.sizeof(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.total_size = 0
+
+class SubtitleExport(object):
+    """Rendered subtitle data
+
+    Attributes:
+        etag: strong ETag for the export.  Exports never change, so this is
+            simply derived from the export key.
+        gzipped_data: gzip-compressed export data
+    """
+
+    def __init__(self, etag, gzipped_data):
+        self.etag = etag
+        self.gzipped_data = gzipped_data
+
+    @property
+    def data(self):
+        return gunzip_string(self.gzipped_data)
+
+    def __len__(self):
+        return len(self.gzipped_data)
+
+_exports_lru = SizedLRUCache(EXPORTS_LRU_MAX_BYTES)
 
+def _export_id(key):
+    return u"subtitle-export-%s-%s" % (EXPORTS_VERSION, key)
 
-def _lang_is_synced_id(language, public):
-    if public:
-        return u"language-%s-timing-complete-public" % (language.pk,)
-    else:
-        return u"language-%s-timing-complete-private" % (language.pk,)
+def get_export(key, renderer):
+    """Get a rendered export.
 
-def invalidate_language_cache(language):
-    cache.delete(_lang_is_synced_id(language, True))
-    cache.delete(_lang_is_synced_id(language, False))
+    :param key: string that identifies the export.  It must uniquely
+        determine the output of renderer, for example
+        "<version_pk>-<format>".
+    :param renderer: function that takes no arguments and returns the
+        rendered data.  It will only be called if the export isn't already
+        cached.
+    :returns: SubtitleExport
+    """
+    export = _exports_lru.get(key)
+    if export is None:
+        cache_id = _export_id(key)
+        export = cache.get(cache_id)
+        if export is None:
+            data = renderer()
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            export = SubtitleExport('%s-%s' % (EXPORTS_VERSION, key),
+                                    gzip_string(data))
+            if len(export) <= EXPORTS_MAX_CACHED_SIZE:
+                cache.set(cache_id, export, EXPORTS_TIMEOUT)
+        _exports_lru.set(key, export)
+    return export
 
-def get_is_synced(language, public):
-    cache_key = _lang_is_synced_id(language, public)
-    return cache.get(cache_key)
+def clear_exports_lru():
+    """Clear the per-process exports cache.
 
-def set_is_synced(language, public, value):
-    cache_key = _lang_is_synced_id(language, public)
-    cache.set(cache_key, value, TIMEOUT)
+    Like clear_subtitles_lru(), this is only needed for the unittests.
+    """
+    _exports_lru.clear()
@@ -0,0 +1,58 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""subtitles.exports -- render and serve subtitle downloads
+
+Rendered exports are cached using subtitles.cache.get_export(), so we only
+run babelsubs once per (version, format) pair.
+"""
+
+import hashlib
+
+import babelsubs
+
+from subtitles import cache
+from utils.http import conditional_gzip_response
+from utils.subtitles import dfxp_merge
+
+def get_version_export(version, format):
+    """Get a SubtitleExport for a version rendered in a format."""
+    def render():
+        return babelsubs.to(version.get_subtitles(), format,
+                            language=version.language_code)
+    return cache.get_export('%s-%s' % (version.pk, format), render)
+
+def get_merged_dfxp_export(versions):
+    """Get a SubtitleExport for several versions merged into 1 DFXP file.
+
+    :param versions: list of versions to merge, in the order to merge them.
+    """
+    version_ids = ','.join(str(v.pk) for v in versions)
+    def render():
+        return dfxp_merge([v.get_subtitles() for v in versions])
+    return cache.get_export(
+        'merged-%s' % hashlib.sha1(version_ids).hexdigest(), render)
+
+def export_response(request, export, mimetype="text/plain"):
+    """Create an HttpResponse for a SubtitleExport
+
+    See utils.http.conditional_gzip_response() for how we handle gzip and
+    If-None-Match.
+    """
+    return conditional_gzip_response(request, export.etag,
+                                     export.gzipped_data, mimetype)
@@ -0,0 +1,66 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+
+from subtitles.models import SubtitleVersion
+
+class Command(BaseCommand):
+    help = 'Calculate start_ms, end_ms, and duration_ms for old versions'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=500, help='Number of versions to fetch at once'),
+        make_option('--sleep', dest='sleep', type='float', default=0,
+                    help='Seconds to sleep between batches'),
+        make_option('--start', dest='start', type='int', default=0,
+                    help='Start with versions with a pk greater than this'),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = options['start']
+        total = 0
+        while True:
+            batch = list(SubtitleVersion.objects.full()
+                         .filter(pk__gt=last_pk, duration_ms__isnull=True)
+                         .order_by('pk')
+                         .only('pk', 'language_code', 'serialized_subtitles')
+                         [:batch_size])
+            if not batch:
+                break
+            for version in batch:
+                self.backfill_version(version)
+            total += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write("%s versions updated (last pk: %s)\n" %
+                              (total, last_pk))
+            reset_queries()
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+    def backfill_version(self, version):
+        version.set_timing(version._load_subtitles())
+        # Use update() rather than save(), since save() creates actions
+        SubtitleVersion.objects.full().filter(pk=version.pk).update(
+            start_ms=version.start_ms, end_ms=version.end_ms,
+            duration_ms=version.duration_ms)
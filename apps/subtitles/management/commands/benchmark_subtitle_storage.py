@@ -0,0 +1,63 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from subtitles import serialization
+from subtitles.models import SubtitleVersion
+from utils.compress import compress
+
+class Command(BaseCommand):
+    help = 'Compare the legacy and compact subtitle storage formats'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', dest='count', type='int', default=200,
+                    help='Number of versions to sample'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+                    help='Number of times to decode each version'),
+    )
+
+    def handle(self, *args, **options):
+        versions = (SubtitleVersion.objects.extant()
+                    .filter(subtitle_count__gt=0)
+                    .order_by('-id')[:options['count']])
+        samples = []
+        for version in versions:
+            subtitles = version._load_subtitles()
+            samples.append((version.language_code,
+                            compress(subtitles.to_xml()),
+                            serialization.serialize_subtitles(subtitles)))
+        if not samples:
+            self.stdout.write("No versions to benchmark\n")
+            return
+        self.stdout.write("%s versions sampled\n" % len(samples))
+        for index, label in ((1, 'dfxp'), (2, 'compact-v1')):
+            size = sum(len(sample[index]) for sample in samples)
+            start_time = time.time()
+            for i in xrange(options['repeat']):
+                for sample in samples:
+                    serialization.deserialize_subtitles(sample[index],
+                                                        sample[0])
+            elapsed = time.time() - start_time
+            self.stdout.write("%-12s total size: %10d bytes  "
+                              "decode: %0.3fms/version\n" % (
+                                  label, size, elapsed * 1000 /
+                                  (len(samples) * options['repeat'])))
@@ -0,0 +1,60 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+
+from subtitles.models import SubtitleLanguage
+
+class Command(BaseCommand):
+    help = 'Backfill the stored change stats for SubtitleVersions'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=100, help='Number of languages to fetch at once'),
+        make_option('--sleep', dest='sleep', type='float', default=0,
+                    help='Seconds to sleep between batches'),
+        make_option('--start', dest='start', type='int', default=0,
+                    help='Start with languages with a pk greater than this'),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = options['start']
+        count = 0
+        while True:
+            batch = list(SubtitleLanguage.objects
+                         .filter(pk__gt=last_pk)
+                         .order_by('pk')
+                         .only('pk')
+                         [:batch_size])
+            if not batch:
+                break
+            for language in batch:
+                language.calc_version_changes()
+            count += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write("%s languages processed (last pk: %s)\n" % (
+                count, last_pk))
+            reset_queries()
+            if options['sleep']:
+                time.sleep(options['sleep'])
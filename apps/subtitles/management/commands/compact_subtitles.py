@@ -0,0 +1,93 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+
+from subtitles import serialization
+from subtitles.models import SubtitleVersion
+
+class Command(BaseCommand):
+    help = 'Convert serialized_subtitles to the compact storage format'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=500, help='Number of versions to fetch at once'),
+        make_option('--sleep', dest='sleep', type='float', default=0,
+                    help='Seconds to sleep between batches'),
+        make_option('--start', dest='start', type='int', default=0,
+                    help='Start with versions with a pk greater than this'),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = options['start']
+        converted = total = 0
+        while True:
+            batch = list(SubtitleVersion.objects.full()
+                         .filter(pk__gt=last_pk).order_by('pk')
+                         .values_list('pk', 'subtitle_language',
+                                      'language_code',
+                                      'serialized_subtitles')[:batch_size])
+            if not batch:
+                break
+            for pk, language_id, language_code, data in batch:
+                if self.convert_version(pk, language_id, language_code,
+                                        data):
+                    converted += 1
+            total += len(batch)
+            last_pk = batch[-1][0]
+            self.stdout.write("%s versions checked, %s converted "
+                              "(last pk: %s)\n" % (total, converted, last_pk))
+            reset_queries()
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+    def convert_version(self, pk, language_id, language_code, data):
+        if (serialization.detect_format(data) !=
+            serialization.FORMAT_DFXP):
+            return False
+        if self.has_dependents(pk, language_id):
+            # Converting normalizes the XML, which would break the deltas
+            # that were encoded against it.
+            return False
+        subtitles = serialization.deserialize_subtitles(data, language_code)
+        subtitles.set_language(language_code)
+        new_data = serialization.serialize_subtitles(subtitles)
+        if serialization.detect_format(new_data) == serialization.FORMAT_DFXP:
+            # compact format can't handle these subtitles
+            return False
+        # Use update() rather than save(), since save() creates actions
+        SubtitleVersion.objects.full().filter(pk=pk).update(
+            serialized_subtitles=new_data)
+        return True
+
+    def has_dependents(self, pk, language_id):
+        """Check if any delta-encoded versions use a version as a base."""
+        deltas = (SubtitleVersion.objects.full()
+                  .filter(subtitle_language=language_id,
+                          serialized_subtitles__startswith=
+                          serialization.DELTA_V1_PREFIX)
+                  .values_list('serialized_subtitles', flat=True))
+        for data in deltas:
+            if pk in serialization.delta_chain(data):
+                return True
+        return False
@@ -0,0 +1,115 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+
+from subtitles import serialization
+from subtitles.models import SubtitleLanguage, SubtitleVersion
+
+class Command(BaseCommand):
+    help = 'Delta-encode the serialized_subtitles for existing languages'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=100, help='Number of languages to fetch at once'),
+        make_option('--sleep', dest='sleep', type='float', default=0,
+                    help='Seconds to sleep between batches'),
+        make_option('--start', dest='start', type='int', default=0,
+                    help='Start with languages with a pk greater than this'),
+        make_option('--keyframe-interval', dest='keyframe_interval',
+                    type='int', default=None,
+                    help='Maximum delta chain length (default: '
+                    'SUBTITLE_DELTA_KEYFRAME_INTERVAL)'),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = options['start']
+        self.keyframe_interval = (options['keyframe_interval'] or
+                                  getattr(settings,
+                                          'SUBTITLE_DELTA_KEYFRAME_INTERVAL',
+                                          10))
+        converted = total = 0
+        while True:
+            batch = list(SubtitleLanguage.objects
+                         .filter(pk__gt=last_pk)
+                         .order_by('pk')
+                         .values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            for language_id in batch:
+                converted += self.convert_language(language_id)
+            total += len(batch)
+            last_pk = batch[-1]
+            self.stdout.write("%s languages checked, %s versions converted "
+                              "(last pk: %s)\n" % (total, converted, last_pk))
+            reset_queries()
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+    def convert_language(self, language_id):
+        """Delta-encode each version against the previous one
+
+        :returns: number of versions that were converted
+        """
+        versions = list(SubtitleVersion.objects.full()
+                        .filter(subtitle_language=language_id)
+                        .order_by('version_number')
+                        .values_list('pk', 'serialized_subtitles'))
+        # serialized_subtitles for the versions we've seen, updated as we
+        # convert them
+        all_data = {}
+        def load_chain(version_ids):
+            missing = [pk for pk in version_ids if pk not in all_data]
+            if missing:
+                all_data.update(SubtitleVersion._load_delta_chain(missing))
+            return all_data
+        converted = 0
+        base = None
+        for pk, data in versions:
+            all_data[pk] = data
+            xml = serialization.decode_xml(data, load_chain)
+            if serialization.detect_format(data) == serialization.FORMAT_DFXP:
+                # Legacy DFXP isn't normalized, so it can't be the target of
+                # a delta.  Run compact_subtitles first.
+                new_data = data
+            else:
+                new_data = serialization.serialize_xml(
+                    xml, base, self.keyframe_interval)
+            if (new_data != data and
+                serialization.decode_xml(new_data, load_chain) == xml):
+                # Use update() rather than save(), since save() creates
+                # actions
+                SubtitleVersion.objects.full().filter(pk=pk).update(
+                    serialized_subtitles=new_data)
+                all_data[pk] = new_data
+                converted += 1
+            if (serialization.detect_format(all_data[pk]) ==
+                serialization.FORMAT_DFXP):
+                # compact_subtitles may rewrite this version later, so don't
+                # let anything depend on it.
+                base = None
+            else:
+                base = (pk, all_data[pk], xml)
+        return converted
@@ -0,0 +1,84 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+
+from subtitles.models import SubtitleLanguage
+
+class Command(BaseCommand):
+    help = 'Check the denormalized tip pointers for SubtitleLanguages'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--fix', dest='fix', action='store_true', default=False,
+                    help='Fix incorrect tip pointers'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=500, help='Number of languages to fetch at once'),
+        make_option('--sleep', dest='sleep', type='float', default=0,
+                    help='Seconds to sleep between batches'),
+        make_option('--start', dest='start', type='int', default=0,
+                    help='Start with languages with a pk greater than this'),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = options['start']
+        checked = bad = 0
+        while True:
+            batch = list(SubtitleLanguage.objects
+                         .filter(pk__gt=last_pk)
+                         .order_by('pk')
+                         .only('pk', 'tip_extant', 'tip_public',
+                               'tip_subtitle_count')
+                         [:batch_size])
+            if not batch:
+                break
+            for language in batch:
+                if not self.check_language(language):
+                    bad += 1
+                    if options['fix']:
+                        language.update_tip_pointers()
+            checked += len(batch)
+            last_pk = batch[-1].pk
+            reset_queries()
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write("%s languages checked, %s incorrect%s\n" % (
+            checked, bad, ' (fixed)' if options['fix'] and bad else ''))
+
+    def check_language(self, language):
+        """Check the tip pointers for a language
+
+        :returns: True if the pointers are correct
+        """
+        correct = language.calc_tip_pointers()
+        current = {
+            'tip_extant': language.tip_extant_id,
+            'tip_public': language.tip_public_id,
+            'tip_subtitle_count': language.tip_subtitle_count,
+        }
+        correct['tip_extant'] = getattr(correct['tip_extant'], 'pk', None)
+        correct['tip_public'] = getattr(correct['tip_public'], 'pk', None)
+        if correct == current:
+            return True
+        self.stdout.write("language %s: %s (should be %s)\n" % (
+            language.pk, current, correct))
+        return False
@@ -24,12 +24,13 @@ from datetime import datetime, date, timedelta
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, router
 from django.db.models import query, Q
 from django.utils import simplejson as json
 from django.utils.translation import ugettext_lazy as _
 
 from subtitles import cache
+from subtitles import serialization
 from subtitles import shims
 from auth.models import CustomUser as User
 from videos import metadata
@@ -37,11 +38,9 @@ from videos.models import Video, Action
 from babelsubs.storage import SubtitleSet
 from babelsubs.storage import calc_changes
 from babelsubs.generators.html import HTMLGenerator
-from babelsubs import load_from
 from subtitles import signals
 from videos.behaviors import make_video_title
 
-from utils.compress import compress, decompress
 from utils.redis_utils import RedisSimpleField
 from utils.subtitles import create_new_subtitles
 from utils.translation import is_rtl
@@ -142,9 +141,44 @@ def get_lineage(parents):
     return lineage
 
 
+# Timing functions ------------------------------------------------------------
+def calc_subtitle_timing(subtitles):
+    """Calculate the timing info for a SubtitleSet
+
+    :returns: (start_ms, end_ms) tuple.  start_ms is the first timestamp in
+        the subtitles and end_ms is the last.  Both will be None if none of
+        the subtitles are synced.
+    """
+    for sub in subtitles:
+        if sub.start_time is not None:
+            start_ms = sub.start_time
+            break
+        # we shouldn't have an end time set without a start time, but handle
+        # it just in case
+        if sub.end_time is not None:
+            start_ms = sub.end_time
+            break
+    else:
+        return None, None
+
+    for sub in reversed(subtitles):
+        if sub.end_time is not None:
+            end_ms = sub.end_time
+            break
+        # we shouldn't have an end time not set, but check for that just in
+        # case
+        if sub.start_time is not None:
+            end_ms = sub.start_time
+            break
+    else:
+        return None, None
+
+    return start_ms, end_ms
+
+
 class SubtitleLanguagageQuerySet(query.QuerySet):
     def fetch_and_join(self, public_tips=False, private_tips=False,
-                       video=None):
+                       video=None, videos=None):
         """Fetch languages and join them to related models.
 
         This method is an efficient way to fetch languages under a couple
@@ -158,29 +192,47 @@ class SubtitleLanguagageQuerySet(query.QuerySet):
         :param public_tips: set the public tip cache for fetched languages
         :param private_tips: set the private tip cache for fetched languages
         :param video: set the cached video for all languages/versions fetched
+        :param videos: dict mapping video ids to videos.  Use this instead of
+            video to set the cached videos when fetching languages for
+            multiple videos.
         :returns: list of SubtitleLanguage objects
         """
         langs = list(self)
         if video is not None:
             for lang in langs:
                 lang.video = video
+        elif videos is not None:
+            for lang in langs:
+                lang.video = videos[lang.video_id]
 
-        def join_tips(base_qs, cache_name):
-            qs = base_qs.filter(subtitle_language__in=langs)
-            version_map = dict((v.subtitle_language_id, v) for v in qs)
+        def join_tips(attname, cache_name):
+            version_ids = set(getattr(lang, attname) for lang in langs)
+            version_ids.discard(None)
+            if version_ids:
+                version_map = SubtitleVersion.objects.in_bulk(version_ids)
+            else:
+                version_map = {}
             for lang in langs:
-                version = version_map.get(lang.id)
+                version = version_map.get(getattr(lang, attname))
                 lang.set_tip_cache(cache_name, version)
                 if version is not None:
                     lang.optimize_loaded_version(version)
 
         if public_tips:
-            join_tips(SubtitleVersion.objects.public_tips(), 'public')
+            join_tips('tip_public_id', 'public')
         if private_tips:
-            join_tips(SubtitleVersion.objects.private_tips(), 'extant')
+            join_tips('tip_extant_id', 'extant')
 
         return langs
 
+    def update_tip_pointers(self):
+        """Call update_tip_pointers() for each language in this queryset.
+
+        Use this after changing versions with QuerySet.update().
+        """
+        for lang in self:
+            lang.update_tip_pointers()
+
 # SubtitleLanguages -----------------------------------------------------------
 class SubtitleLanguageManager(models.Manager):
     #  _   _                ______       ______
@@ -269,41 +321,11 @@ class SubtitleLanguageManager(models.Manager):
 
     def having_nonempty_tip(self):
         """Return a QS of SLs that have a tip version with 1 or more subtitles."""
-        return self.get_query_set().extra(where=[
-            """
-            EXISTS (
-                SELECT 1
-                FROM subtitles_subtitleversion AS sv
-                WHERE sv.version_number = (
-                    SELECT MAX(sv2.version_number)
-                    FROM subtitles_subtitleversion sv2
-                    WHERE sv2.subtitle_language_id=subtitles_subtitlelanguage.id
-                    AND sv2.visibility_override != 'deleted'
-                )
-                AND sv.subtitle_count > 0
-                AND sv.subtitle_language_id=subtitles_subtitlelanguage.id
-            )
-            """,
-        ])
+        return self.get_query_set().filter(tip_subtitle_count__gt=0)
 
     def not_having_nonempty_tip(self):
         """Return a QS of SLs that do not have a tip version with 1 or more subtitles."""
-        return self.get_query_set().extra(where=[
-            """
-            NOT EXISTS (
-                SELECT 1
-                FROM subtitles_subtitleversion AS sv
-                WHERE sv.version_number = (
-                    SELECT MAX(sv2.version_number)
-                    FROM subtitles_subtitleversion sv2
-                    WHERE sv2.subtitle_language_id=subtitles_subtitlelanguage.id
-                    AND sv2.visibility_override != 'deleted'
-                )
-                AND sv.subtitle_count > 0
-                AND sv.subtitle_language_id=subtitles_subtitlelanguage.id
-            )
-            """,
-        ])
+        return self.get_query_set().filter(tip_subtitle_count=0)
 
 
     def having_public_versions(self):
@@ -376,6 +398,21 @@ class SubtitleLanguage(models.Model):
     # been changed to be a standalone language.
     is_forked = models.BooleanField(default=False)
 
+    # Denormalized pointers to our tip versions.  These are kept up to date by
+    # update_tip_pointers(), which SubtitleVersion.save() calls.  If you
+    # change versions without calling save() (for example with
+    # QuerySet.update()), you need to call update_tip_pointers() yourself.
+    # The repair_tip_pointers command checks and fixes them.
+    tip_extant = models.ForeignKey('SubtitleVersion', null=True, blank=True,
+                                   editable=False, related_name='extant_tip_of',
+                                   on_delete=models.SET_NULL)
+    tip_public = models.ForeignKey('SubtitleVersion', null=True, blank=True,
+                                   editable=False, related_name='public_tip_of',
+                                   on_delete=models.SET_NULL)
+    # subtitle_count for tip_extant
+    tip_subtitle_count = models.PositiveIntegerField(default=0,
+                                                     editable=False)
+
     # Writelocking
     writelock_time = models.DateTimeField(null=True, blank=True,
                                           editable=False)
@@ -491,7 +528,39 @@ class SubtitleLanguage(models.Model):
         if creating and not self.created:
             self.created = datetime.now()
 
-        super(SubtitleLanguage, self).save(*args, **kwargs)
+        if creating or kwargs.get('force_insert'):
+            super(SubtitleLanguage, self).save(*args, **kwargs)
+        else:
+            self._save_without_tip_pointers(using=kwargs.get('using'))
+
+    TIP_POINTER_FIELDS = ('tip_extant', 'tip_public', 'tip_subtitle_count')
+
+    def _save_without_tip_pointers(self, using=None):
+        """Save an existing language without writing the tip pointer columns
+
+        SubtitleVersion.save() updates tip_extant, tip_public and
+        tip_subtitle_count with update_tip_pointers(), so our copies of those
+        may be stale.  We write every other column with a single UPDATE so
+        that we never overwrite the new values with the old ones.
+        """
+        using = using or router.db_for_write(self.__class__, instance=self)
+        models.signals.pre_save.send(sender=self.__class__, instance=self,
+                                     raw=False, using=using)
+        values = dict((f.name, getattr(self, f.attname))
+                      for f in self._meta.local_fields
+                      if not f.primary_key and
+                      f.name not in self.TIP_POINTER_FIELDS)
+        updated = (SubtitleLanguage.objects.using(using)
+                   .filter(pk=self.pk).update(**values))
+        if not updated:
+            # The row doesn't exist, fall back to a regular INSERT
+            super(SubtitleLanguage, self).save(using=using)
+            return
+        self._state.db = using
+        self._state.adding = False
+        models.signals.post_save.send(sender=self.__class__, instance=self,
+                                      created=False, raw=False,
+                                      using=using)
 
     def title_display(self):
         tip = self.get_tip()
@@ -525,11 +594,15 @@ class SubtitleLanguage(models.Model):
         if cache_name in self._tip_cache:
             return self._tip_cache[cache_name]
 
-        # cache name is conveniently the same as the SubtitleVersionManager
-        # attribute name.
-        versions = getattr(SubtitleVersion.objects, cache_name)()
-        versions = versions.filter(subtitle_language=self)
-        versions = versions.order_by('-version_number')
+        if public:
+            # Join through the tip pointer rather than using
+            # self.tip_public_id, since our copy of it may be stale.
+            versions = SubtitleVersion.objects.filter(public_tip_of=self)
+        elif full:
+            versions = SubtitleVersion.objects.full().filter(
+                subtitle_language=self).order_by('-version_number')
+        else:
+            versions = SubtitleVersion.objects.filter(extant_tip_of=self)
         versions = versions[:1]
 
         if versions:
@@ -591,6 +664,39 @@ class SubtitleLanguage(models.Model):
         """
         return [self.optimize_loaded_version(v) for v in versions]
 
+    def calc_version_changes(self, versions=None):
+        """Calculate the change stats for the versions of this language
+
+        This walks the extant history once, comparing each version with the
+        one before it, so each version's subtitles only get parsed once.  The
+        stats for versions that don't have them yet are saved to the DB.
+
+        :param versions: list of versions from this language to fill in.  The
+            objects get their time_change_ratio/text_change_ratio attributes
+            set in-place.  By default we update all extant versions.
+        """
+        if versions is not None:
+            if all(v.time_change_ratio is not None and
+                   v.text_change_ratio is not None for v in versions):
+                return
+            versions_by_id = dict((v.id, v) for v in versions)
+        else:
+            versions_by_id = {}
+        history = (self.subtitleversion_set.extant()
+                   .defer('serialized_subtitles')
+                   .order_by('version_number'))
+        if versions:
+            history = history.filter(version_number__lte=max(
+                v.version_number for v in versions))
+        previous_version = None
+        for version in history:
+            version = versions_by_id.get(version.id, version)
+            if (version.time_change_ratio is None or
+                version.text_change_ratio is None):
+                version.set_changes(previous_version)
+                version.save_changes()
+            previous_version = version
+
     def get_version_by_id(self, version_pk, public=False, full=False):
         """Get a version for this subtitle_language
 
@@ -633,6 +739,47 @@ class SubtitleLanguage(models.Model):
     def clear_tip_cache(self):
         self._tip_cache = {}
 
+    def calc_tip_pointers(self, for_update=False):
+        """Calculate the values for our denormalized tip fields
+
+        :param for_update: use locking reads for the versions.  These see the
+            latest committed versions rather than our transaction's snapshot.
+        :returns: dict mapping field names to values
+        """
+        def find_tip(qs):
+            qs = qs.filter(subtitle_language=self).order_by('-version_number')
+            if for_update:
+                qs = qs.select_for_update()
+            try:
+                return qs[:1][0]
+            except IndexError:
+                return None
+        tip_extant = find_tip(SubtitleVersion.objects.extant())
+        tip_public = find_tip(SubtitleVersion.objects.public())
+        return {
+            'tip_extant': tip_extant,
+            'tip_public': tip_public,
+            'tip_subtitle_count': (tip_extant.subtitle_count
+                                   if tip_extant else 0),
+        }
+
+    def update_tip_pointers(self):
+        """Recalculate tip_extant, tip_public and tip_subtitle_count
+
+        This only updates those columns in the DB, so it's safe to call even
+        if this object has other unsaved changes.
+        """
+        # Lock our row before reading the versions.  This serializes
+        # concurrent updates, so the last one to write sees every committed
+        # version and the pointers can't be left on an older version.
+        list(SubtitleLanguage.objects.select_for_update()
+             .filter(pk=self.pk).values_list('pk', flat=True))
+        values = self.calc_tip_pointers(for_update=True)
+        SubtitleLanguage.objects.filter(pk=self.pk).update(**values)
+        for name, value in values.items():
+            setattr(self, name, value)
+        self.clear_tip_cache()
+
     def first_public_version(self):
         """Returns the very fist version to be made public of none"""
         try:
@@ -655,9 +802,7 @@ class SubtitleLanguage(models.Model):
         if not version:
             return False
 
-        subtitles = version.get_subtitles()
-
-        return subtitles.fully_synced
+        return version.is_synced()
 
     def _sanity_check_parents(self, version, parents):
         r"""Check that the given parents are sane for an SV about to be created.
@@ -741,10 +886,12 @@ class SubtitleLanguage(models.Model):
         ensure_stringy(kwargs.get('title'))
         ensure_stringy(kwargs.get('description'))
         metadata = kwargs.pop('metadata', None)
+        subtitles = kwargs.pop('subtitles', None)
 
         sv = SubtitleVersion(*args, **kwargs)
 
-        sv.set_subtitles(kwargs.get('subtitles', None))
+        sv.set_subtitles(subtitles, base_version=tip)
+        sv.set_changes(self.get_tip(public=False))
         if metadata is not None:
             sv.update_metadata(metadata, commit=False)
             # save the video to commit the changes to it
@@ -757,7 +904,6 @@ class SubtitleLanguage(models.Model):
         for p in parents:
             sv.parents.add(p)
 
-        cache.invalidate_language_cache(self)
         self.clear_tip_cache()
         return sv
 
@@ -777,11 +923,8 @@ class SubtitleLanguage(models.Model):
         return self.get_metadata().convert_for_display()
 
     def is_synced(self, public=True):
-        value = cache.get_is_synced(self, public)
-        if value is None:
-            value = self.get_tip(public=public).is_synced()
-            cache.set_is_synced(self, public, value)
-        return value
+        tip = self.get_tip(public=public)
+        return tip is not None and tip.is_synced()
 
     def nuke_language(self):
         """Delete all SubtitleVersions for this language, as well as all
@@ -1139,25 +1282,10 @@ class SubtitleVersionManager(models.Manager):
                        'Use full(), extant(), or public() instead.')
 
     def private_tips(self):
-        tip_where = """\
-subtitles_subtitleversion.version_number = (
-    SELECT MAX(version_number)
-    FROM subtitles_subtitleversion sv2
-    WHERE sv2.subtitle_language_id =
-           subtitles_subtitleversion.subtitle_language_id AND
-           sv2.visibility_override != 'deleted')"""
-        return self.get_query_set().extra(where=[tip_where])
+        return self.get_query_set().filter(extant_tip_of__isnull=False)
 
     def public_tips(self):
-        public_tip_where = """\
-subtitles_subtitleversion.version_number = (
-    SELECT MAX(version_number)
-    FROM subtitles_subtitleversion sv2 
-    WHERE ((sv2.visibility = 'public' AND sv2.visibility_override = '') OR
-           sv2.visibility_override = 'public') AND
-           sv2.subtitle_language_id =
-           subtitles_subtitleversion.subtitle_language_id)"""
-        return self.get_query_set().extra(where=[public_tip_where])
+        return self.get_query_set().filter(public_tip_of__isnull=False)
 
     def subtitle_count(self):
         qs = self.get_query_set().extra(select={
@@ -1263,6 +1391,23 @@ class SubtitleVersion(models.Model):
     # Denormalized count of the number of subtitles this version contains, for
     # easier filtering later.
     subtitle_count = models.PositiveIntegerField(default=0)
+    # Denormalized timing info, for calculating minutes without parsing the
+    # subtitles.  start_ms/end_ms are the first and last timestamps, or None
+    # if no subtitles are synced.  duration_ms is None for versions that
+    # haven't been backfilled yet, use get_duration_ms() to handle that.
+    start_ms = models.IntegerField(null=True, blank=True, default=None)
+    end_ms = models.IntegerField(null=True, blank=True, default=None)
+    duration_ms = models.IntegerField(null=True, blank=True, default=None)
+    # Denormalized change stats, compared to the previous extant version.
+    # These are calculated when the version is created.  They are None for
+    # versions that haven't been backfilled yet, use get_changes() to handle
+    # that.
+    time_change_ratio = models.FloatField(null=True, blank=True, default=None)
+    text_change_ratio = models.FloatField(null=True, blank=True, default=None)
+    # Denormalized SubtitleSet.fully_synced, so that status checks don't need
+    # to parse the subtitles.  None for versions that haven't been backfilled
+    # yet, use is_synced() to handle that.
+    fully_synced = models.NullBooleanField(blank=True, default=None)
 
     created = models.DateTimeField(editable=False)
 
@@ -1270,9 +1415,10 @@ class SubtitleVersion(models.Model):
     meta_2_content = metadata.MetadataContentField()
     meta_3_content = metadata.MetadataContentField()
 
-    # Subtitles are stored in a text blob, serialized as base64'ed zipped XML
-    # (oh the joys of Django).  Use the subtitles property to get and set them.
-    # You shouldn't be touching this field.
+    # Subtitles are stored in a text blob, serialized as base64'ed zipped data
+    # (oh the joys of Django).  See subtitles.serialization for the formats.
+    # Use the subtitles property to get and set them.  You shouldn't be
+    # touching this field.
     serialized_subtitles = models.TextField()
 
     # Lineage is stored as a blob of JSON to save on DB rows.  You shouldn't
@@ -1303,15 +1449,41 @@ class SubtitleVersion(models.Model):
         """
         # We cache the parsed subs for speed.
         if self._subtitles == None:
-            self._subtitles = load_from(decompress(self.serialized_subtitles),
-                    type='dfxp').to_internal()
+            if self.pk:
+                # versions are immutable, so we can share the parsed
+                # subtitles between instances and processes.
+                self._subtitles = cache.get_subtitles(self,
+                                                      self._load_subtitles)
+            else:
+                self._subtitles = self._load_subtitles()
             # force the subtitles to have the correct language code.  For a
             # while we had a bug where we always set to to "en"
             self._subtitles.set_language(self.language_code)
 
         return self._subtitles
 
-    def set_subtitles(self, subtitles):
+    def _load_subtitles(self):
+        return serialization.deserialize_subtitles(
+            self.serialized_subtitles, self.language_code,
+            load_chain=SubtitleVersion._load_delta_chain)
+
+    @staticmethod
+    def _load_delta_chain(version_ids):
+        """Fetch serialized_subtitles for the versions in a delta chain."""
+        return dict(SubtitleVersion.objects.full()
+                    .filter(pk__in=version_ids)
+                    .values_list('pk', 'serialized_subtitles'))
+
+    def get_subtitles_xml(self):
+        """Get the exact XML stored for this version.
+
+        This is what delta-encoded versions get diffed against, so don't
+        generate it from get_subtitles(), which might not round-trip exactly.
+        """
+        return serialization.decode_xml(self.serialized_subtitles,
+                                        SubtitleVersion._load_delta_chain)
+
+    def set_subtitles(self, subtitles, base_version=None):
         """Set the SubtitleSet for this version.
 
         You have a few options here:
@@ -1322,6 +1494,10 @@ class SubtitleVersion(models.Model):
         * Passing a vanilla list (or any iterable) of subtitle tuples will
           create a SubtitleSet from that.
 
+        If base_version is given and SUBTITLE_DELTA_ENCODING is enabled, the
+        subtitles may be stored as a delta against that version (see
+        subtitles.serialization).
+
         """
         # TODO: Fix the language code to use the proper standard.
         if subtitles == None:
@@ -1339,12 +1515,40 @@ class SubtitleVersion(models.Model):
                                 % str(type(subtitles)))
 
         self.subtitle_count = len(subtitles)
-        self.serialized_subtitles = compress(subtitles.to_xml())
+        self.fully_synced = subtitles.fully_synced
+        self.set_timing(subtitles)
+        if (base_version is not None and
+            getattr(settings, 'SUBTITLE_DELTA_ENCODING', False)):
+            base = (base_version.pk, base_version.serialized_subtitles,
+                    base_version.get_subtitles_xml())
+        else:
+            base = None
+        self.serialized_subtitles = serialization.serialize_subtitles(
+            subtitles, base, getattr(settings,
+                                     'SUBTITLE_DELTA_KEYFRAME_INTERVAL', 10))
 
         # We cache the parsed subs for speed.
         self._subtitles = subtitles
 
 
+    def set_timing(self, subtitles):
+        """Update start_ms, end_ms, and duration_ms for a SubtitleSet."""
+        self.start_ms, self.end_ms = calc_subtitle_timing(subtitles)
+        if self.start_ms is not None:
+            self.duration_ms = self.end_ms - self.start_ms
+        else:
+            self.duration_ms = 0
+
+    def get_duration_ms(self):
+        """Get the duration of the subtitles in milliseconds.
+
+        For versions that haven't been backfilled yet, we calculate this from
+        the subtitles (but don't save it).
+        """
+        if self.duration_ms is None:
+            self.set_timing(self.get_subtitles())
+        return self.duration_ms
+
     def get_lineage(self):
         # We cache the parsed lineage for speed.
         if self._lineage == None:
@@ -1391,6 +1595,7 @@ class SubtitleVersion(models.Model):
 
         super(SubtitleVersion, self).__init__(*args, **kwargs)
 
+        self._saved_visibility = self._visibility_state()
         self._subtitles = None
         if has_subtitles:
             self.set_subtitles(subtitles)
@@ -1413,8 +1618,16 @@ class SubtitleVersion(models.Model):
                     "The version number of a rollback's source must be less "
                     "than version number of the rollback itself!")
 
+    def _visibility_state(self):
+        # Use __dict__ so that we don't fetch the fields if they're deferred.
+        # If they are, they can't have been changed.
+        return (self.__dict__.get('visibility'),
+                self.__dict__.get('visibility_override'))
+
     def save(self, *args, **kwargs):
         creating = not self.pk
+        visibility_changed = (self._visibility_state() !=
+                              self._saved_visibility)
 
         if creating and not self.created:
             self.created = datetime.now()
@@ -1437,7 +1650,30 @@ class SubtitleVersion(models.Model):
         else:
             Action.create_caption_handler(self, self.created)
 
-        return super(SubtitleVersion, self).save(*args, **kwargs)
+        super(SubtitleVersion, self).save(*args, **kwargs)
+        self._saved_visibility = self._visibility_state()
+        self.subtitle_language.update_tip_pointers()
+        if not creating and visibility_changed:
+            # Changing our visibility changes which version the following
+            # versions should be diffed against.
+            self.clear_following_changes()
+
+    def clear_following_changes(self):
+        """Clear the stored change stats that may depend on this version.
+
+        This clears the stats for the next extant version and any deleted
+        versions in between.  They will get recalculated the next time they
+        are needed.
+        """
+        following = self.sibling_set.full().filter(
+            version_number__gt=self.version_number)
+        next_extant = (self.sibling_set.extant()
+                       .filter(version_number__gt=self.version_number)
+                       .order_by('version_number')
+                       .values_list('version_number', flat=True)[:1])
+        if next_extant:
+            following = following.filter(version_number__lte=next_extant[0])
+        following.update(time_change_ratio=None, text_change_ratio=None)
 
 
     def get_ancestors(self):
@@ -1475,39 +1711,53 @@ class SubtitleVersion(models.Model):
         """
         # TODO: Time only changes aren't quite right.
 
-        if hasattr(self, '_time_change') and hasattr(self, '_text_change'):
-            return (self._time_change, self._text_change)
+        if (self.time_change_ratio is not None and
+            self.text_change_ratio is not None):
+            return (self.time_change_ratio, self.text_change_ratio)
+
+        self.set_changes(self.previous_version())
+        if self.pk:
+            self.save_changes()
+        return (self.time_change_ratio, self.text_change_ratio)
 
-        parent = self.previous_version()
+    def set_changes(self, parent):
+        """Calculate the change stats compared to parent.
 
+        This sets time_change_ratio and text_change_ratio, but doesn't save
+        them.  parent should be the previous extant version, or None if this
+        is the first one.
+        """
         if not parent:
-            return (1.0, 1.0)
+            self.time_change_ratio, self.text_change_ratio = (1.0, 1.0)
+            return
 
-        self._text_change, self._time_change = calc_changes(
+        self.text_change_ratio, self.time_change_ratio = calc_changes(
             parent.get_subtitles(), self.get_subtitles(),
             HTMLGenerator.MAPPINGS)
 
-        return self._time_change, self._text_change
+    def save_changes(self):
+        """Save the change stats without re-saving the whole version."""
+        SubtitleVersion.objects.filter(pk=self.pk).update(
+            time_change_ratio=self.time_change_ratio,
+            text_change_ratio=self.text_change_ratio)
 
     @property
     def time_change(self):
-        if not hasattr(self, '_time_change'):
-            self.get_changes()
+        time_change = self.get_changes()[0]
 
-        if not self._time_change:
+        if not time_change:
             return '0%'
         else:
-            return '%.0f%%' % (self._time_change * 100)
+            return '%.0f%%' % (time_change * 100)
 
     @property
     def text_change(self):
-        if not hasattr(self, '_text_change'):
-            self.get_changes()
+        text_change = self.get_changes()[1]
 
-        if not self._text_change:
+        if not text_change:
             return '0%'
         else:
-            return '%.0f%%' % (self._text_change * 100)
+            return '%.0f%%' % (text_change * 100)
 
     def is_tip(self, public=True):
         if public and not self.is_public():
@@ -1516,13 +1766,10 @@ class SubtitleVersion(models.Model):
             return False
 
         if public:
-            qs = SubtitleVersion.objects.public()
+            qs = SubtitleLanguage.objects.filter(tip_public=self)
         else:
-            qs = SubtitleVersion.objects.extant()
-
-        return not qs.filter(
-            subtitle_language_id=self.subtitle_language_id,
-            version_number__gt=self.version_number).exists()
+            qs = SubtitleLanguage.objects.filter(tip_extant=self)
+        return qs.exists()
 
     def is_private(self):
         if self.visibility_override in ('public', 'deleted'):
@@ -1723,7 +1970,17 @@ class SubtitleVersion(models.Model):
         return self.subtitle_count is not 0
 
     def is_synced(self):
-        return self.get_subtitles().fully_synced
+        """Check if all subtitles in this version have timings.
+
+        For versions that haven't been backfilled yet, we calculate this from
+        the subtitles and save it.
+        """
+        if self.fully_synced is None:
+            self.fully_synced = self.get_subtitles().fully_synced
+            if self.pk is not None:
+                SubtitleVersion.objects.full().filter(pk=self.pk).update(
+                    fully_synced=self.fully_synced)
+        return self.fully_synced
 
     def publish(self):
         """Make this version publicly viewable."""
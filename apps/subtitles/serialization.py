@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along
+# with this program.  If not, see http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Storage formats for SubtitleVersion.serialized_subtitles.
+
+We support 2 formats:
+
+FORMAT_DFXP (legacy)
+    base64(zlib(DFXP XML)).  This is what we stored for all versions created
+    before the compact format existed.
+
+FORMAT_COMPACT_V1
+    "#v1:" + base64(zlib(payload)).  The payload is a table of subtitle
+    timings followed by the DFXP XML with the begin/end attributes stripped
+    out of the <p> tags.  The timings are stored as zigzag-encoded varints,
+    delta-encoded against the previous subtitle, which compresses much
+    better than the clock-time strings.
+
+    The XML that we store comes from SubtitleSet.to_xml(), so it's already
+    normalized and we can load it directly with SubtitleSet(), skipping the
+    DFXP parser.
+
+FORMAT_DELTA_V1
+    "#d1:" + base64(zlib(payload)).  The XML is stored as a diff against the
+    XML of a base version (normally the parent).  We split the XML into
+    chunks at each <p> tag and the payload is a list of operations that
+    either copy a run of chunks from the base or insert new chunks.  The
+    payload starts with the ids of the versions in the delta chain (the base,
+    the base's base, etc.), so they can all be fetched in 1 query.  The chain
+    ends at a version stored in FORMAT_COMPACT_V1 (a keyframe) and its
+    length is limited by the keyframe_interval argument to
+    serialize_subtitles().  FORMAT_DFXP versions are never used as a base,
+    since compact_subtitles rewrites them.
+
+The column is still a TextField, so we need to keep the base64 armor.  The
+format is detected by the prefix, so the read path handles all formats
+transparently.  Use the compact_subtitles management command to convert
+existing versions and delta_encode_subtitles to delta-encode existing
+languages.
+"""
+
+import base64
+import difflib
+import re
+import zlib
+
+from babelsubs import load_from
+from babelsubs.storage import SubtitleSet
+
+from utils.compress import compress, decompress
+
+FORMAT_DFXP = 'dfxp'
+FORMAT_COMPACT_V1 = 'compact-v1'
+FORMAT_DELTA_V1 = 'delta-v1'
+
+COMPACT_V1_PREFIX = '#v1:'
+DELTA_V1_PREFIX = '#d1:'
+
+# Matches the opening tag of a <p> element.  lxml always escapes "<" and ">"
+# inside text and attribute values, so this can only match real tags.
+P_TAG_RE = re.compile(r'<(?:[\w.-]+:)?p(?=[\s/>])')
+BEGIN_ATTR_RE = re.compile(r' begin="(\d{2}):(\d{2}):(\d{2})\.(\d{3})"')
+END_ATTR_RE = re.compile(r' end="(\d{2}):(\d{2}):(\d{2})\.(\d{3})"')
+
+HAS_BEGIN = 1
+HAS_END = 2
+
+DELTA_COPY = 0
+DELTA_INSERT = 1
+
+class UnsupportedDocument(ValueError):
+    """The compact format can't represent a DFXP document exactly."""
+
+def detect_format(data):
+    if data.startswith(COMPACT_V1_PREFIX):
+        return FORMAT_COMPACT_V1
+    elif data.startswith(DELTA_V1_PREFIX):
+        return FORMAT_DELTA_V1
+    else:
+        return FORMAT_DFXP
+
+def serialize_subtitles(subtitles, base=None, keyframe_interval=10):
+    """Convert a SubtitleSet to the data for serialized_subtitles
+
+    We use FORMAT_COMPACT_V1 whenever it can represent the XML exactly and
+    fall back to FORMAT_DFXP otherwise.
+
+    If base is given, we also try FORMAT_DELTA_V1 and use it if it's
+    smaller.  base should be a (version_id, data, xml) tuple for the base
+    version, where xml is the output of decode_xml() for it.  We store a
+    keyframe instead if the delta chain would contain keyframe_interval
+    versions or more, or if the base uses FORMAT_DFXP.
+    """
+    xml = subtitles.to_xml()
+    if isinstance(xml, unicode):
+        xml = xml.encode('utf-8')
+    return serialize_xml(xml, base, keyframe_interval)
+
+def serialize_xml(xml, base=None, keyframe_interval=10):
+    """Convert XML from SubtitleSet.to_xml() to data for serialized_subtitles
+
+    This works like serialize_subtitles(), but takes the XML as a
+    bytestring.
+    """
+    try:
+        data = encode_compact(xml)
+    except UnsupportedDocument:
+        data = compress(xml)
+    if base is not None and detect_format(base[1]) != FORMAT_DFXP:
+        base_id, base_data, base_xml = base
+        chain = [base_id] + delta_chain(base_data)
+        if len(chain) < keyframe_interval:
+            delta_data = encode_delta(xml, chain, base_xml)
+            if len(delta_data) < len(data):
+                return delta_data
+    return data
+
+def deserialize_subtitles(data, language_code, load_chain=None):
+    """Convert data from serialized_subtitles to a SubtitleSet.
+
+    load_chain is needed for FORMAT_DELTA_V1, see decode_xml().
+    """
+    format = detect_format(data)
+    if format == FORMAT_COMPACT_V1:
+        return SubtitleSet(language_code, initial_data=decode_compact(data))
+    elif format == FORMAT_DELTA_V1:
+        return SubtitleSet(language_code,
+                           initial_data=decode_xml(data, load_chain))
+    else:
+        return load_from(decompress(data), type='dfxp').to_internal()
+
+def decode_xml(data, load_chain=None):
+    """Get the exact XML that was stored in serialized_subtitles
+
+    :param load_chain: function that takes a list of version ids and returns
+        a dict mapping them to their serialized_subtitles data.  This is
+        needed to decode FORMAT_DELTA_V1.
+    """
+    format = detect_format(data)
+    if format == FORMAT_COMPACT_V1:
+        return decode_compact(data)
+    elif format == FORMAT_DFXP:
+        return decompress(data)
+    chain, ops = _read_delta(data)
+    chain_data = dict(load_chain(chain))
+    # Walk back to the keyframe, then apply the deltas in order.  Follow the
+    # chain stored in each base rather than trusting ours, since
+    # delta_encode_subtitles may have re-encoded versions after data was
+    # written.  Normally the chains agree and we don't need another query.
+    pending_ops = [ops]
+    version_id = chain[0]
+    while True:
+        base_data = chain_data[version_id]
+        if detect_format(base_data) != FORMAT_DELTA_V1:
+            xml = decode_xml(base_data)
+            break
+        base_chain, base_ops = _read_delta(base_data)
+        pending_ops.append(base_ops)
+        missing = [pk for pk in base_chain if pk not in chain_data]
+        if missing:
+            chain_data.update(load_chain(missing))
+        version_id = base_chain[0]
+    for ops in reversed(pending_ops):
+        xml = _apply_delta_ops(xml, ops)
+    return xml
+
+def delta_chain(data):
+    """Get the ids of the versions that data depends on.
+
+    :returns: list of version ids, starting with the base version.  The
+        list is empty for data that doesn't use FORMAT_DELTA_V1.
+    """
+    if detect_format(data) != FORMAT_DELTA_V1:
+        return []
+    return _read_delta(data)[0]
+
+def encode_delta(xml, chain, base_xml):
+    """Encode XML using FORMAT_DELTA_V1
+
+    :param chain: ids of the versions in the delta chain, starting with the
+        base version
+    :param base_xml: XML for the base version
+    """
+    base_chunks = _split_chunks(base_xml)
+    chunks = _split_chunks(xml)
+    matcher = difflib.SequenceMatcher(None, base_chunks, chunks,
+                                      autojunk=False)
+    payload = []
+    _write_varint(payload, len(chain))
+    for version_id in chain:
+        _write_varint(payload, version_id)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            payload.append(chr(DELTA_COPY))
+            _write_varint(payload, i1)
+            _write_varint(payload, i2 - i1)
+        elif tag in ('replace', 'insert'):
+            payload.append(chr(DELTA_INSERT))
+            _write_varint(payload, j2 - j1)
+            for chunk in chunks[j1:j2]:
+                _write_varint(payload, len(chunk))
+                payload.append(chunk)
+    return DELTA_V1_PREFIX + base64.encodestring(
+        zlib.compress(''.join(payload)))
+
+def _read_delta(data):
+    """Parse FORMAT_DELTA_V1 data
+
+    :returns: (chain, ops) tuple.  ops is a list of (DELTA_COPY, start,
+        length) and (DELTA_INSERT, chunks) tuples.
+    """
+    payload = zlib.decompress(base64.decodestring(
+        data[len(DELTA_V1_PREFIX):]))
+    chain_length, pos = _read_varint(payload, 0)
+    chain = []
+    for i in xrange(chain_length):
+        version_id, pos = _read_varint(payload, pos)
+        chain.append(version_id)
+    ops = []
+    while pos < len(payload):
+        op = ord(payload[pos])
+        pos += 1
+        if op == DELTA_COPY:
+            start, pos = _read_varint(payload, pos)
+            length, pos = _read_varint(payload, pos)
+            ops.append((DELTA_COPY, start, length))
+        else:
+            count, pos = _read_varint(payload, pos)
+            chunks = []
+            for i in xrange(count):
+                length, pos = _read_varint(payload, pos)
+                chunks.append(payload[pos:pos+length])
+                pos += length
+            ops.append((DELTA_INSERT, chunks))
+    return chain, ops
+
+def _apply_delta_ops(base_xml, ops):
+    base_chunks = _split_chunks(base_xml)
+    parts = []
+    for op in ops:
+        if op[0] == DELTA_COPY:
+            parts.extend(base_chunks[op[1]:op[1]+op[2]])
+        else:
+            parts.extend(op[1])
+    return ''.join(parts)
+
+def _split_chunks(xml):
+    """Split XML into chunks at the start of each <p> tag."""
+    chunks = []
+    pos = 0
+    for match in P_TAG_RE.finditer(xml):
+        if match.start() > pos:
+            chunks.append(xml[pos:match.start()])
+            pos = match.start()
+    chunks.append(xml[pos:])
+    return chunks
+
+def encode_compact(xml):
+    """Encode DFXP XML using FORMAT_COMPACT_V1
+
+    :raises UnsupportedDocument: the XML can't be round-tripped exactly
+    """
+    if '<!--' in xml or '<![CDATA[' in xml or '<?' in xml[1:]:
+        # these could contain text that looks like a <p> tag
+        raise UnsupportedDocument()
+    timings = []
+    skeleton = []
+    pos = 0
+    for match in P_TAG_RE.finditer(xml):
+        skeleton.append(xml[pos:match.end()])
+        pos = match.end()
+        flags = 0
+        begin = end = None
+        begin_match = BEGIN_ATTR_RE.match(xml, pos)
+        if begin_match:
+            flags |= HAS_BEGIN
+            begin = _clock_to_ms(begin_match.groups())
+            pos = begin_match.end()
+        end_match = END_ATTR_RE.match(xml, pos)
+        if end_match:
+            flags |= HAS_END
+            end = _clock_to_ms(end_match.groups())
+            pos = end_match.end()
+        timings.append((flags, begin, end))
+    skeleton.append(xml[pos:])
+
+    payload = []
+    _write_varint(payload, len(timings))
+    last_time = 0
+    for flags, begin, end in timings:
+        payload.append(chr(flags))
+        if begin is not None:
+            _write_varint(payload, _zigzag(begin - last_time))
+            last_time = begin
+        if end is not None:
+            _write_varint(payload, _zigzag(end - last_time))
+            last_time = end
+    payload.append(''.join(skeleton))
+    data = COMPACT_V1_PREFIX + base64.encodestring(
+        zlib.compress(''.join(payload)))
+    if decode_compact(data) != xml:
+        raise UnsupportedDocument()
+    return data
+
+def decode_compact(data):
+    """Decode data from encode_compact() back to DFXP XML."""
+    payload = zlib.decompress(base64.decodestring(
+        data[len(COMPACT_V1_PREFIX):]))
+    count, pos = _read_varint(payload, 0)
+    timings = []
+    last_time = 0
+    for i in xrange(count):
+        flags = ord(payload[pos])
+        pos += 1
+        begin = end = None
+        if flags & HAS_BEGIN:
+            delta, pos = _read_varint(payload, pos)
+            begin = last_time = last_time + _unzigzag(delta)
+        if flags & HAS_END:
+            delta, pos = _read_varint(payload, pos)
+            end = last_time = last_time + _unzigzag(delta)
+        timings.append((begin, end))
+    skeleton = payload[pos:]
+
+    parts = []
+    skeleton_pos = 0
+    timing_iter = iter(timings)
+    for match in P_TAG_RE.finditer(skeleton):
+        parts.append(skeleton[skeleton_pos:match.end()])
+        skeleton_pos = match.end()
+        begin, end = timing_iter.next()
+        if begin is not None:
+            parts.append(' begin="%s"' % _ms_to_clock(begin))
+        if end is not None:
+            parts.append(' end="%s"' % _ms_to_clock(end))
+    parts.append(skeleton[skeleton_pos:])
+    return ''.join(parts)
+
+def _clock_to_ms(groups):
+    hours, minutes, seconds, milliseconds = [int(g) for g in groups]
+    return (((hours * 60) + minutes) * 60 + seconds) * 1000 + milliseconds
+
+def _ms_to_clock(ms):
+    seconds, milliseconds = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%02d:%02d:%02d.%03d' % (hours, minutes, seconds, milliseconds)
+
+def _zigzag(value):
+    return (value << 1) if value >= 0 else ((-value << 1) - 1)
+
+def _unzigzag(value):
+    return (value >> 1) if not (value & 1) else -((value + 1) >> 1)
+
+def _write_varint(output, value):
+    while value > 0x7f:
+        output.append(chr((value & 0x7f) | 0x80))
+        value >>= 7
+    output.append(chr(value))
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = ord(data[pos])
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not (byte & 0x80):
+            return value, pos
+        shift += 7
@@ -22,19 +22,24 @@
 from __future__ import absolute_import 
 
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
+from django.core.management import call_command
+from django.db import IntegrityError, models
+from django.db.models import query
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from babelsubs.storage import SubtitleSet
+import mock
 
 from auth.models import CustomUser as User
-from subtitles import pipeline
+from subtitles import cache, pipeline, serialization
 from subtitles.models import SubtitleLanguage, SubtitleVersion
 from subtitles.tests.utils import (
     make_video, make_video_2, make_video_3, make_sl, refresh, ids, parent_ids,
     ancestor_ids
 )
 from teams.models import Team, TeamMember, TeamVideo
+from utils.compress import compress
 from utils.factories import *
 
 class TestSubtitleLanguage(TestCase):
@@ -524,6 +529,79 @@ class TestSubtitleVersion(TestCase):
         sv4 = refresh(sv4)
         self.assertEqual(200, sv4.subtitle_count)
 
+    def test_timing(self):
+        sv1 = self.sl_en.add_version(subtitles=[])
+        sv2 = self.sl_en.add_version(subtitles=[(None, None, "a"),
+                                                (100, 200, "b"),
+                                                (300, 400, "c"),
+                                                (None, None, "d")])
+        sv3 = self.sl_en.add_version(subtitles=[(None, None, "a")])
+
+        sv1 = refresh(sv1)
+        sv2 = refresh(sv2)
+        sv3 = refresh(sv3)
+
+        self.assertEqual((None, None, 0),
+                         (sv1.start_ms, sv1.end_ms, sv1.duration_ms))
+        self.assertEqual((100, 400, 300),
+                         (sv2.start_ms, sv2.end_ms, sv2.duration_ms))
+        self.assertEqual((None, None, 0),
+                         (sv3.start_ms, sv3.end_ms, sv3.duration_ms))
+
+    def test_get_duration_ms_not_backfilled(self):
+        sv = self.sl_en.add_version(subtitles=[(100, 200, "a"),
+                                               (300, 1400, "b")])
+        SubtitleVersion.objects.full().filter(pk=sv.pk).update(duration_ms=None)
+        self.assertEqual(1300, refresh(sv).get_duration_ms())
+
+    def test_fully_synced(self):
+        sv1 = self.sl_en.add_version(subtitles=[(100, 200, "a"),
+                                                (None, None, "b")])
+        sv2 = self.sl_en.add_version(subtitles=[(100, 200, "a"),
+                                                (300, 400, "b")])
+        self.assertEqual(refresh(sv1).fully_synced, False)
+        self.assertEqual(refresh(sv2).fully_synced, True)
+        # is_synced() should use the stored value rather than parse the
+        # subtitles
+        with mock.patch('subtitles.models.SubtitleVersion.get_subtitles') \
+                as mock_get_subtitles:
+            self.assertEqual(refresh(sv1).is_synced(), False)
+            self.assertEqual(refresh(sv2).is_synced(), True)
+            self.assertEqual(self.sl_en.is_synced(public=False), True)
+            self.assertEqual(mock_get_subtitles.call_count, 0)
+
+    def test_is_synced_not_backfilled(self):
+        sv = self.sl_en.add_version(subtitles=[(100, 200, "a"),
+                                               (None, None, "b")])
+        SubtitleVersion.objects.full().filter(pk=sv.pk).update(
+            fully_synced=None)
+        self.assertEqual(refresh(sv).is_synced(), False)
+        # is_synced() should save the value that it calculated
+        self.assertEqual(refresh(sv).fully_synced, False)
+
+    def test_parsed_subtitles_cache(self):
+        s0 = (100, 200, "a")
+        s1 = (300, 400, "b")
+        sv = self.sl_en.add_version(subtitles=[s0, s1])
+        expected = SubtitleSet.from_list('en', [s0, s1])
+
+        # The first load parses the subtitles and populates the cache.  After
+        # that, we shouldn't touch serialized_subtitles again.
+        self.assertEqual(refresh(sv).get_subtitles(), expected)
+        with mock.patch('subtitles.serialization.deserialize_subtitles') as \
+                mock_deserialize:
+            self.assertEqual(refresh(sv).get_subtitles(), expected)
+            # clearing the LRU should make us load from the django cache
+            cache.clear_subtitles_lru()
+            self.assertEqual(refresh(sv).get_subtitles(), expected)
+            self.assertEqual(mock_deserialize.call_count, 0)
+
+    def test_parsed_subtitles_cache_returns_copies(self):
+        sv = self.sl_en.add_version(subtitles=[(100, 200, "a")])
+        subtitles = refresh(sv).get_subtitles()
+        subtitles.append_subtitle(300, 400, "b")
+        self.assertEqual(len(refresh(sv).get_subtitles()), 1)
+
     def test_sibling_set(self):
         def _assert_siblings(sv, *vns):
             siblings = sv.sibling_set.full().order_by('version_number')
@@ -1766,6 +1844,292 @@ class TestSubtitleLanguageTipQueries(TestCase):
             self.versions['v2', 'fr', 1],
         ]), ordered=False)
 
+class TestTipPointers(TestCase):
+    def setUp(self):
+        self.video = VideoFactory(primary_audio_language_code='en')
+        self.v1 = pipeline.add_subtitles(self.video, 'en', [
+            (100, 200, 'one'),
+        ], visibility='public')
+        self.v2 = pipeline.add_subtitles(self.video, 'en', [
+            (100, 200, 'one'),
+            (200, 300, 'two'),
+        ], visibility='private')
+        self.lang = refresh(self.v1.subtitle_language)
+
+    def check_pointers(self, tip_extant, tip_public, tip_subtitle_count):
+        lang = refresh(self.lang)
+        self.assertEquals(lang.tip_extant_id, tip_extant.id
+                          if tip_extant else None)
+        self.assertEquals(lang.tip_public_id, tip_public.id
+                          if tip_public else None)
+        self.assertEquals(lang.tip_subtitle_count, tip_subtitle_count)
+
+    def test_add_version(self):
+        self.check_pointers(self.v2, self.v1, 2)
+
+    def test_visibility_changes(self):
+        self.v2.visibility = 'public'
+        self.v2.save()
+        self.check_pointers(self.v2, self.v2, 2)
+        self.v2.visibility_override = 'deleted'
+        self.v2.save()
+        self.check_pointers(self.v1, self.v1, 1)
+        self.v1.visibility_override = 'private'
+        self.v1.save()
+        self.check_pointers(self.v1, None, 1)
+
+    def test_queryset_update(self):
+        SubtitleVersion.objects.filter(pk=self.v2.pk).update(
+            visibility='public')
+        self.check_pointers(self.v2, self.v1, 2)
+        SubtitleLanguage.objects.filter(pk=self.lang.pk).update_tip_pointers()
+        self.check_pointers(self.v2, self.v2, 2)
+
+    def test_get_tip(self):
+        lang = refresh(self.lang)
+        self.assertEquals(lang.get_tip(public=True).id, self.v1.id)
+        self.assertEquals(lang.get_tip(public=False).id, self.v2.id)
+        self.assertEquals(lang.get_tip(full=True).id, self.v2.id)
+
+    def test_fetch_and_join(self):
+        langs = (SubtitleLanguage.objects.filter(video=self.video)
+                 .fetch_and_join(public_tips=True, private_tips=True))
+        self.assertEquals(langs[0]._tip_cache['public'].id, self.v1.id)
+        self.assertEquals(langs[0]._tip_cache['extant'].id, self.v2.id)
+
+    def test_save_stale_language(self):
+        # Saving a SubtitleLanguage that was loaded before a new version was
+        # added shouldn't write the old tip pointers back to the DB
+        stale_lang = refresh(self.lang)
+        v3 = pipeline.add_subtitles(self.video, 'en', [
+            (100, 200, 'one'),
+            (200, 300, 'two'),
+            (300, 400, 'three'),
+        ], visibility='public')
+        stale_lang.subtitles_complete = True
+        stale_lang.save()
+        self.check_pointers(v3, v3, 3)
+        self.assertEquals(refresh(self.lang).subtitles_complete, True)
+
+    def test_save_single_query(self):
+        # Saving an existing language should be a single UPDATE, without
+        # reloading the tip pointers first
+        lang = refresh(self.lang)
+        lang.subtitles_complete = True
+        with self.assertNumQueries(1):
+            lang.save()
+        self.assertEquals(refresh(self.lang).subtitles_complete, True)
+        self.check_pointers(self.v2, self.v1, 2)
+
+    def test_save_sends_signals(self):
+        calls = []
+        def handler(sender, instance, created, **kwargs):
+            calls.append((instance, created))
+        models.signals.post_save.connect(handler, SubtitleLanguage)
+        try:
+            self.lang.save()
+        finally:
+            models.signals.post_save.disconnect(handler, SubtitleLanguage)
+        self.assertEquals(calls, [(self.lang, False)])
+
+    def test_update_tip_pointers_locks(self):
+        # update_tip_pointers() should lock the language row and read the
+        # versions with locking reads, so concurrent updates are serialized
+        lang = refresh(self.lang)
+        with mock.patch.object(query.QuerySet, 'select_for_update',
+                               autospec=True,
+                               side_effect=lambda qs, **kwargs: qs) as sfu:
+            lang.update_tip_pointers()
+        locked_models = [call[0][0].model for call in sfu.call_args_list]
+        self.assertEquals(locked_models[0], SubtitleLanguage)
+        self.assertEquals(locked_models[1:],
+                          [SubtitleVersion, SubtitleVersion])
+        self.check_pointers(self.v2, self.v1, 2)
+
+    def test_repair_command(self):
+        SubtitleLanguage.objects.filter(pk=self.lang.pk).update(
+            tip_extant=None, tip_public=None, tip_subtitle_count=0)
+        call_command('repair_tip_pointers')
+        self.check_pointers(None, None, 0)
+        call_command('repair_tip_pointers', fix=True)
+        self.check_pointers(self.v2, self.v1, 2)
+
+class TestVersionChanges(TestCase):
+    def setUp(self):
+        self.video = VideoFactory(primary_audio_language_code='en')
+        self.v1 = pipeline.add_subtitles(self.video, 'en', [
+            (0, 1000, 'Hello there'),
+        ])
+        self.v2 = pipeline.add_subtitles(self.video, 'en', [
+            (0, 1000, 'Hello there'),
+            (2000, 3000, 'How are you?'),
+        ])
+        self.v3 = pipeline.add_subtitles(self.video, 'en', [
+            (0, 1000, 'Hello there.'),
+            (2000, 3000, 'How are you?'),
+        ])
+        self.lang = self.v1.subtitle_language
+
+    def check_changes(self, version, time_change, text_change):
+        version = refresh(version)
+        self.assertAlmostEqual(version.time_change_ratio, time_change)
+        self.assertAlmostEqual(version.text_change_ratio, text_change)
+
+    def check_all_changes(self):
+        self.check_changes(self.v1, 1.0, 1.0)
+        self.check_changes(self.v2, 1/3.0, 1/3.0)
+        self.check_changes(self.v3, 0.0, 0.5)
+
+    def clear_changes(self):
+        SubtitleVersion.objects.full().update(time_change_ratio=None,
+                                              text_change_ratio=None)
+
+    def test_stored_on_create(self):
+        self.check_all_changes()
+        version = refresh(self.v3)
+        with self.assertNumQueries(0):
+            self.assertEquals(version.get_changes(), (0.0, 0.5))
+
+    def test_calc_version_changes(self):
+        self.clear_changes()
+        self.lang.calc_version_changes()
+        self.check_all_changes()
+
+    def test_calc_version_changes_in_place(self):
+        self.clear_changes()
+        versions = [refresh(self.v3), refresh(self.v2)]
+        self.lang.calc_version_changes(versions)
+        self.assertEquals(versions[0].get_changes(), (0.0, 0.5))
+        self.assertAlmostEqual(versions[1].time_change_ratio, 1/3.0)
+        self.check_all_changes()
+
+    def test_delete_clears_following_changes(self):
+        self.v2.visibility_override = 'deleted'
+        self.v2.save()
+        v3 = refresh(self.v3)
+        self.assertEquals(v3.time_change_ratio, None)
+        self.assertAlmostEqual(v3.get_changes()[0], 1/3.0)
+        self.check_changes(self.v3, 1/3.0, 1.0)
+
+    def test_save_keeps_following_changes(self):
+        # saving without changing the visibility shouldn't clear anything
+        v2 = refresh(self.v2)
+        v2.note = 'new note'
+        with mock.patch.object(SubtitleVersion,
+                               'clear_following_changes') as mock_clear:
+            v2.save()
+            v2.visibility = 'private'
+            v2.save()
+            v2.save()
+        self.assertEquals(mock_clear.call_count, 1)
+        self.check_changes(self.v3, 0.0, 0.5)
+
+    def test_backfill_command(self):
+        self.clear_changes()
+        call_command('calc_version_changes')
+        self.check_all_changes()
+
+@override_settings(SUBTITLE_DELTA_ENCODING=True,
+                   SUBTITLE_DELTA_KEYFRAME_INTERVAL=3)
+class TestDeltaStorage(TestCase):
+    def setUp(self):
+        self.video = VideoFactory(primary_audio_language_code='en')
+
+    def make_subtitles(self, changed_index):
+        return [
+            (i * 1000, i * 1000 + 500,
+             'Changed' if i == changed_index else 'Subtitle %s' % i)
+            for i in xrange(100)
+        ]
+
+    def add_versions(self, count):
+        return [pipeline.add_subtitles(self.video, 'en',
+                                       self.make_subtitles(i))
+                for i in xrange(count)]
+
+    def check_subtitles(self, versions):
+        for i, version in enumerate(versions):
+            version = refresh(version)
+            self.assertEquals(version._load_subtitles().to_xml(),
+                              version.get_subtitles().to_xml())
+            items = list(version._load_subtitles().subtitle_items())
+            self.assertEquals(items[i].text, 'Changed')
+
+    def formats(self, versions):
+        return [serialization.detect_format(refresh(v).serialized_subtitles)
+                for v in versions]
+
+    def test_add_versions(self):
+        versions = self.add_versions(4)
+        self.assertEquals(self.formats(versions), [
+            serialization.FORMAT_COMPACT_V1,
+            serialization.FORMAT_DELTA_V1,
+            serialization.FORMAT_DELTA_V1,
+            serialization.FORMAT_COMPACT_V1,
+        ])
+        self.check_subtitles(versions)
+
+    def test_convert_command(self):
+        with self.settings(SUBTITLE_DELTA_ENCODING=False):
+            versions = self.add_versions(4)
+        self.assertEquals(self.formats(versions),
+                          [serialization.FORMAT_COMPACT_V1] * 4)
+        call_command('delta_encode_subtitles')
+        self.assertEquals(self.formats(versions), [
+            serialization.FORMAT_COMPACT_V1,
+            serialization.FORMAT_DELTA_V1,
+            serialization.FORMAT_DELTA_V1,
+            serialization.FORMAT_COMPACT_V1,
+        ])
+        self.check_subtitles(versions)
+
+    def test_convert_command_larger_keyframe_interval(self):
+        versions = self.add_versions(5)
+        call_command('delta_encode_subtitles', keyframe_interval=10)
+        self.assertEquals(self.formats(versions),
+                          [serialization.FORMAT_COMPACT_V1] +
+                          [serialization.FORMAT_DELTA_V1] * 4)
+        self.check_subtitles(versions)
+
+    def make_legacy(self, version):
+        SubtitleVersion.objects.full().filter(pk=version.pk).update(
+            serialized_subtitles=compress(version.get_subtitles().to_xml()))
+
+    def test_legacy_base(self):
+        version = pipeline.add_subtitles(self.video, 'en',
+                                         self.make_subtitles(0))
+        self.make_legacy(version)
+        versions = [version] + [
+            pipeline.add_subtitles(self.video, 'en', self.make_subtitles(i))
+            for i in xrange(1, 3)
+        ]
+        call_command('delta_encode_subtitles')
+        self.assertEquals(self.formats(versions), [
+            serialization.FORMAT_DFXP,
+            serialization.FORMAT_COMPACT_V1,
+            serialization.FORMAT_DELTA_V1,
+        ])
+        call_command('compact_subtitles')
+        self.assertEquals(self.formats(versions)[0],
+                          serialization.FORMAT_COMPACT_V1)
+        self.check_subtitles(versions)
+
+    def test_compact_command_skips_delta_bases(self):
+        versions = self.add_versions(2)
+        xml = refresh(versions[1]).get_subtitles_xml()
+        self.make_legacy(versions[0])
+        # simulate a delta that was encoded against the legacy data
+        base_xml = refresh(versions[0]).get_subtitles_xml()
+        SubtitleVersion.objects.full().filter(pk=versions[1].pk).update(
+            serialized_subtitles=serialization.encode_delta(
+                xml, [versions[0].pk], base_xml))
+        call_command('compact_subtitles')
+        self.assertEquals(self.formats(versions), [
+            serialization.FORMAT_DFXP,
+            serialization.FORMAT_DELTA_V1,
+        ])
+        self.check_subtitles(versions)
+
 class TestSubtitleLanguageCaching(TestCase):
     def setUp(self):
         self.video = VideoFactory()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from __future__ import absolute_import
+
+from django.test import TestCase
+
+from babelsubs.storage import SubtitleSet
+
+from subtitles import serialization
+from utils.compress import compress
+
+class SerializationTest(TestCase):
+    def make_subtitles(self):
+        subtitles = SubtitleSet('en')
+        subtitles.append_subtitle(0, 1000, u'Hello')
+        subtitles.append_subtitle(1500, 2500, u'<b>bold</b> ☃ & more',
+                                  escape=False)
+        subtitles.append_subtitle(2500, 2000, u'overlapping')
+        subtitles.append_subtitle(None, None, u'unsynced')
+        subtitles.append_subtitle(3600 * 1000 * 5, 3600 * 1000 * 5 + 1, u'Late',
+                                  new_paragraph=True)
+        return subtitles
+
+    def test_compact_round_trip(self):
+        subtitles = self.make_subtitles()
+        data = serialization.serialize_subtitles(subtitles)
+        self.assertEqual(serialization.detect_format(data),
+                         serialization.FORMAT_COMPACT_V1)
+        self.assertEqual(serialization.decode_compact(data),
+                         subtitles.to_xml())
+        self.assertEqual(serialization.deserialize_subtitles(data, 'en'),
+                         subtitles)
+
+    def test_empty_subtitles(self):
+        subtitles = SubtitleSet('en')
+        data = serialization.serialize_subtitles(subtitles)
+        self.assertEqual(serialization.deserialize_subtitles(data, 'en'),
+                         subtitles)
+
+    def test_legacy_format(self):
+        subtitles = self.make_subtitles()
+        data = compress(subtitles.to_xml())
+        self.assertEqual(serialization.detect_format(data),
+                         serialization.FORMAT_DFXP)
+        self.assertEqual(serialization.deserialize_subtitles(data, 'en'),
+                         subtitles)
+
+    def test_unsupported_document(self):
+        xml = ('<tt xmlns="http://www.w3.org/ns/ttml"><body><div>'
+               '<!-- <p begin="00:00:01.000"> -->'
+               '<p begin="00:00:01.000" end="00:00:02.000">a</p>'
+               '</div></body></tt>')
+        self.assertRaises(serialization.UnsupportedDocument,
+                          serialization.encode_compact, xml)
+
+    def test_compact_is_smaller(self):
+        subtitles = SubtitleSet('en')
+        for i in xrange(500):
+            subtitles.append_subtitle(i * 1537, i * 1537 + 1211,
+                                      u'Subtitle number %s' % i)
+        self.assert_(len(serialization.serialize_subtitles(subtitles)) <
+                     len(compress(subtitles.to_xml())))
+
+class DeltaSerializationTest(TestCase):
+    def make_subtitles(self, changed_index=None):
+        subtitles = SubtitleSet('en')
+        for i in xrange(200):
+            if i == changed_index:
+                text = u'Changed subtitle'
+            else:
+                text = u'Subtitle number %s with some text: %s' % (
+                    i, i * 7919 % 1009)
+            subtitles.append_subtitle(i * 1537, i * 1537 + 1211, text)
+        return subtitles
+
+    def make_base(self, version_id, data):
+        return (version_id, data, serialization.decode_xml(data))
+
+    def test_delta_round_trip(self):
+        base_data = serialization.serialize_subtitles(self.make_subtitles())
+        subtitles = self.make_subtitles(changed_index=50)
+        data = serialization.serialize_subtitles(
+            subtitles, self.make_base(1, base_data))
+        self.assertEqual(serialization.detect_format(data),
+                         serialization.FORMAT_DELTA_V1)
+        self.assert_(len(data) < len(serialization.serialize_subtitles(
+            subtitles)))
+        self.assertEqual(serialization.delta_chain(data), [1])
+        load_chain = lambda ids: {1: base_data}
+        self.assertEqual(serialization.decode_xml(data, load_chain),
+                         subtitles.to_xml())
+        self.assertEqual(serialization.deserialize_subtitles(
+            data, 'en', load_chain), subtitles)
+
+    def test_delta_chain(self):
+        all_data = {1: serialization.serialize_subtitles(
+            self.make_subtitles())}
+        load_chain = lambda ids: all_data
+        for version_id in xrange(2, 5):
+            base_data = all_data[version_id - 1]
+            base = (version_id - 1, base_data,
+                    serialization.decode_xml(base_data, load_chain))
+            all_data[version_id] = serialization.serialize_subtitles(
+                self.make_subtitles(changed_index=version_id), base)
+        self.assertEqual(serialization.delta_chain(all_data[4]), [3, 2, 1])
+        self.assertEqual(serialization.decode_xml(all_data[4], load_chain),
+                         self.make_subtitles(changed_index=4).to_xml())
+
+    def test_keyframe_interval(self):
+        all_data = {1: serialization.serialize_subtitles(
+            self.make_subtitles())}
+        load_chain = lambda ids: all_data
+        for version_id in xrange(2, 8):
+            base_data = all_data[version_id - 1]
+            base = (version_id - 1, base_data,
+                    serialization.decode_xml(base_data, load_chain))
+            all_data[version_id] = serialization.serialize_subtitles(
+                self.make_subtitles(changed_index=version_id), base,
+                keyframe_interval=3)
+        formats = [serialization.detect_format(all_data[i])
+                   for i in xrange(1, 8)]
+        self.assertEqual(formats, [
+            serialization.FORMAT_COMPACT_V1,
+            serialization.FORMAT_DELTA_V1,
+            serialization.FORMAT_DELTA_V1,
+            serialization.FORMAT_COMPACT_V1,
+            serialization.FORMAT_DELTA_V1,
+            serialization.FORMAT_DELTA_V1,
+            serialization.FORMAT_COMPACT_V1,
+        ])
+
+    def test_delta_not_used_if_larger(self):
+        base_data = serialization.serialize_subtitles(SubtitleSet('en'))
+        subtitles = self.make_subtitles()
+        data = serialization.serialize_subtitles(
+            subtitles, self.make_base(1, base_data))
+        self.assertEqual(serialization.detect_format(data),
+                         serialization.FORMAT_COMPACT_V1)
+
+    def test_dfxp_base_not_used(self):
+        # compact_subtitles rewrites FORMAT_DFXP versions, which would break
+        # any deltas against them.
+        base_data = compress(self.make_subtitles().to_xml())
+        data = serialization.serialize_subtitles(
+            self.make_subtitles(changed_index=50),
+            self.make_base(1, base_data))
+        self.assertEqual(serialization.detect_format(data),
+                         serialization.FORMAT_COMPACT_V1)
+
+    def test_reencoded_keyframe(self):
+        all_data = {1: serialization.serialize_subtitles(
+            self.make_subtitles())}
+        load_chain = lambda ids: all_data
+        def add_version(version_id, keyframe_interval):
+            base_data = all_data[version_id - 1]
+            base = (version_id - 1, base_data,
+                    serialization.decode_xml(base_data, load_chain))
+            all_data[version_id] = serialization.serialize_subtitles(
+                self.make_subtitles(changed_index=version_id), base,
+                keyframe_interval=keyframe_interval)
+        for version_id in xrange(2, 6):
+            add_version(version_id, 3)
+        self.assertEqual(serialization.delta_chain(all_data[5]), [4])
+        # re-encode the keyframe with a larger interval, like
+        # delta_encode_subtitles does.  Version 5 should still decode.
+        add_version(4, 10)
+        self.assertEqual(serialization.delta_chain(all_data[4]), [3, 2, 1])
+        self.assertEqual(serialization.decode_xml(all_data[5], load_chain),
+                         self.make_subtitles(changed_index=5).to_xml())
@@ -34,6 +34,7 @@ from django.shortcuts import render_to_response, get_object_or_404, redirect
 from django.template.defaultfilters import urlize, linebreaks, force_escape
 from django.views.decorators.clickjacking import xframe_options_exempt
 
+from subtitles import exports
 from subtitles import shims
 from subtitles.workflows import get_workflow
 from subtitles.models import SubtitleLanguage, SubtitleVersion
@@ -312,23 +313,23 @@ def download(request, video_id, language_code, filename, format,
     if not format in babelsubs.get_available_formats():
         raise HttpResponseServerError("Format not found")
 
-    subs_text = babelsubs.to(version.get_subtitles(), format,
-                             language=version.language_code)
     # since this is a downlaod, we can afford not to escape tags, specially
     # true since speaker change is denoted by '>>' and that would get entirely
     # stripped out
-    response = HttpResponse(subs_text, mimetype="text/plain")
+    response = exports.export_response(
+        request, exports.get_version_export(version, format))
     response['Content-Disposition'] = 'attachment'
     return response
 
 
 def download_all(request, video_id, filename):
     video = get_object_or_404(Video, video_id=video_id)
-    merged_dfxp = video.get_merged_dfxp()
+    tips = video.get_merged_dfxp_versions()
 
-    if merged_dfxp is None:
+    if not tips:
         raise Http404()
 
-    response = HttpResponse(merged_dfxp, mimetype="text/plain")
+    response = exports.export_response(
+        request, exports.get_merged_dfxp_export(tips))
     response['Content-Disposition'] = 'attachment'
     return response
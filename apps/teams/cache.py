@@ -64,3 +64,19 @@ def get_preferred_langs(team):
         cache.set(cache_key, value, TIMEOUT)
     return value
 
+
+def _team_workflow_map_id(team_id):
+    return u"%s-workflow-map" % team_id
+
+def get_workflow_map(team_id):
+    """Get the WorkflowMap for a team."""
+    cache_key = _team_workflow_map_id(team_id)
+    value = cache.get(cache_key)
+    if value is None:
+        from teams.models import WorkflowMap
+        value = WorkflowMap.build(team_id)
+        cache.set(cache_key, value, TIMEOUT)
+    return value
+
+def invalidate_workflow_map(team_id):
+    cache.delete(_team_workflow_map_id(team_id))
@@ -0,0 +1,72 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from teams import cache as team_cache
+from teams.models import Team, TeamVideo, Workflow
+
+class Command(BaseCommand):
+    args = '<team-slug>'
+    help = 'Time workflow lookups for the videos in a team'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', dest='count', type='int', default=10000,
+                    help='Number of team videos to look up'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: benchmark_workflows <team-slug>')
+        try:
+            team = Team.objects.get(slug=args[0])
+        except Team.DoesNotExist:
+            raise CommandError('No team with slug %s' % args[0])
+        team_videos = list(TeamVideo.objects.filter(team=team)
+                           .select_related('team')[:options['count']])
+        if not team_videos:
+            self.stdout.write("No team videos to benchmark\n")
+            return
+        self.stdout.write("%s team videos\n" % len(team_videos))
+        self.run_benchmark('uncached', team_videos, invalidate=True)
+        self.run_benchmark('cached', team_videos, invalidate=False)
+
+    def run_benchmark(self, label, team_videos, invalidate):
+        team_cache.invalidate_workflow_map(team_videos[0].team_id)
+        old_use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        queries_before = len(connection.queries)
+        start_time = time.time()
+        try:
+            for team_video in team_videos:
+                if invalidate:
+                    team_cache.invalidate_workflow_map(team_video.team_id)
+                if hasattr(team_video, '_cached_workflow'):
+                    del team_video._cached_workflow
+                Workflow.get_for_team_video(team_video)
+            elapsed = time.time() - start_time
+            query_count = len(connection.queries) - queries_before
+        finally:
+            connection.use_debug_cursor = old_use_debug_cursor
+        self.stdout.write("%-10s %0.3fms/lookup  %d queries\n" % (
+            label, elapsed * 1000 / len(team_videos), query_count))
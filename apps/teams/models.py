@@ -18,6 +18,7 @@
 from collections import defaultdict
 from itertools import groupby
 from math import ceil
+import copy
 import csv
 import datetime
 import logging
@@ -48,6 +49,8 @@ from teams.permissions_const import (
     TEAM_PERMISSIONS, PROJECT_PERMISSIONS, ROLE_OWNER, ROLE_ADMIN, ROLE_MANAGER,
     ROLE_CONTRIBUTOR
 )
+from teams import cache as team_cache
+from teams import permissioncontext
 from teams import tasks
 from teams import workflows
 from utils import DEFAULT_PROTOCOL
@@ -310,7 +313,7 @@ class Team(models.Model):
         TODO: Refactor this behaviour into something less confusing.
 
         """
-        return Workflow.get_for_target(self.id, 'team')
+        return Workflow.get_for_team(self)
 
     @property
     def auth_provider(self):
@@ -363,6 +366,9 @@ class Team(models.Model):
         if not user.is_authenticated():
             return None
 
+        context = permissioncontext.get_context(user)
+        if context is not None:
+            return context.get_member(self)
         if user.id in self._member_cache:
             return self._member_cache[user.id]
         try:
@@ -393,6 +399,10 @@ class Team(models.Model):
         """
         if not user or not user.is_authenticated():
             return False
+        context = permissioncontext.get_context(user)
+        if context is not None:
+            member = context.get_member(self)
+            return member is not None and (not role or member.role == role)
         qs = self.members.filter(user=user)
         if role:
             qs = qs.filter(role=role)
@@ -881,6 +891,7 @@ class TeamVideo(models.Model):
             video = self.video
 
             video.newsubtitleversion_set.extant().update(visibility='public')
+            video.newsubtitlelanguage_set.all().update_tip_pointers()
             video.is_public = new_team.is_visible
             video.moderated_by = new_team if new_team.moderates_videos() else None
             video.save()
@@ -1034,6 +1045,7 @@ def team_video_delete(sender, instance, **kwargs):
         # we need to publish all unpublished subs for this video:
         NewSubtitleVersion.objects.filter(video=video,
                 visibility='private').update(visibility='public')
+        video.newsubtitlelanguage_set.all().update_tip_pointers()
 
         video.is_public = True
         video.moderated_by = None
@@ -1243,6 +1255,18 @@ class MembershipNarrowing(models.Model):
 
         return super(MembershipNarrowing, self).save(*args, **kwargs)
 
+def clear_permission_context(sender, instance, **kwargs):
+    permissioncontext.clear()
+
+post_save.connect(clear_permission_context, TeamMember,
+                  dispatch_uid='teams.members.clear-permission-context')
+post_delete.connect(clear_permission_context, TeamMember,
+                    dispatch_uid='teams.members.clear-permission-context')
+post_save.connect(clear_permission_context, MembershipNarrowing,
+                  dispatch_uid='teams.narrowings.clear-permission-context')
+post_delete.connect(clear_permission_context, MembershipNarrowing,
+                    dispatch_uid='teams.narrowings.clear-permission-context')
+
 class TeamSubtitleNote(SubtitleNoteBase):
     team = models.ForeignKey(Team, related_name='+')
 
@@ -1479,21 +1503,6 @@ class Workflow(models.Model):
         unique_together = ('team', 'project', 'team_video')
 
 
-    @classmethod
-    def _get_target_team(cls, id, type):
-        """Return the team for the given target.
-
-        The target is identified by id (its PK as an integer) and type (a string
-        of 'team_video', 'project', or 'team').
-
-        """
-        if type == 'team_video':
-            return TeamVideo.objects.select_related('team').get(pk=id).team
-        elif type == 'project':
-            return Project.objects.select_related('team').get(pk=id).team
-        else:
-            return Team.objects.get(pk=id)
-
     @classmethod
     def get_for_target(cls, id, type, workflows=None):
         '''Return the most specific Workflow for the given target.
@@ -1504,21 +1513,27 @@ class Workflow(models.Model):
         the TeamVideo's team.  This will let you look it up yourself once and
         use it in many of these calls to avoid hitting the DB each time.
 
-        If workflows is not given it will be looked up with one DB query.
+        If workflows is not given it will be looked up in the team's cached
+        WorkflowMap.
 
         '''
         if not workflows:
-            team = Workflow._get_target_team(id, type)
-            workflows = list(Workflow.objects.filter(team=team.id)
-                                             .select_related('project', 'team',
-                                                             'team_video'))
-        else:
-            team = workflows[0].team
+            if type == 'team_video':
+                team_video = TeamVideo.objects.select_related('team').get(
+                    pk=id)
+                return Workflow._get_from_map(
+                    team_video.team_id, team_video.id, team_video.project_id,
+                    team=team_video.team)
+            elif type == 'project':
+                project = Project.objects.select_related('team').get(pk=id)
+                return Workflow._get_from_map(project.team_id, None,
+                                              project.id, team=project.team)
+            else:
+                return Workflow.get_for_team(Team.objects.get(pk=id))
 
-        default_workflow = Workflow(team=team)
+        team = workflows[0].team
 
-        if not workflows:
-            return default_workflow
+        default_workflow = Workflow(team=team)
 
         if type == 'team_video':
             try:
@@ -1547,6 +1562,26 @@ class Workflow(models.Model):
         return [w for w in workflows
                 if (not w.project) and (not w.team_video)][0]
 
+    @classmethod
+    def _get_from_map(cls, team_id, team_video_id=None, project_id=None,
+                      team=None):
+        """Get the most specific workflow using the cached WorkflowMap.
+
+        If team is given, it will be set as the team for the workflow,
+        otherwise it will be fetched lazily.
+        """
+        workflow = team_cache.get_workflow_map(team_id).lookup(team_video_id,
+                                                               project_id)
+        if workflow is None:
+            workflow = Workflow(team_id=team_id)
+        if team is not None:
+            workflow.team = team
+        return workflow
+
+    @classmethod
+    def get_for_team(cls, team):
+        """Return the Workflow for a team."""
+        return Workflow._get_from_map(team.id, team=team)
 
     @classmethod
     def get_for_team_video(cls, team_video, workflows=None):
@@ -1556,7 +1591,8 @@ class Workflow(models.Model):
         for the TeamVideo's team.  This will let you look it up yourself once
         and use it in many of these calls to avoid hitting the DB each time.
 
-        If workflows is not given it will be looked up with one DB query.
+        If workflows is not given it will be looked up in the team's cached
+        WorkflowMap.
 
         NOTE: This function caches the workflow for performance reasons.  If the
         workflow changes within the space of a single request that
@@ -1564,8 +1600,13 @@ class Workflow(models.Model):
 
         '''
         if not hasattr(team_video, '_cached_workflow'):
-            team_video._cached_workflow = Workflow.get_for_target(
-                    team_video.id, 'team_video', workflows)
+            if workflows:
+                team_video._cached_workflow = Workflow.get_for_target(
+                        team_video.id, 'team_video', workflows)
+            else:
+                team_video._cached_workflow = Workflow._get_from_map(
+                    team_video.team_id, team_video.id, team_video.project_id,
+                    team=getattr(team_video, TeamVideo.team.cache_name, None))
         return team_video._cached_workflow
 
     @classmethod
@@ -1576,28 +1617,28 @@ class Workflow(models.Model):
         for the Project's team.  This will let you look it up yourself once
         and use it in many of these calls to avoid hitting the DB each time.
 
-        If workflows is not given it will be looked up with one DB query.
+        If workflows is not given it will be looked up in the team's cached
+        WorkflowMap.
 
         '''
-        return Workflow.get_for_target(project.id, 'project', workflows)
+        if workflows:
+            return Workflow.get_for_target(project.id, 'project', workflows)
+        return Workflow._get_from_map(
+            project.team_id, None, project.id,
+            team=getattr(project, Project.team.cache_name, None))
 
     @classmethod
     def add_to_team_videos(cls, team_videos):
         '''Add the appropriate Workflow objects to each TeamVideo as .workflow.
 
-        This will only perform one DB query, and it will add the most specific
-        workflow possible to each TeamVideo.
+        This uses the cached WorkflowMap for the team, so it won't perform any
+        DB queries if the map is cached.
 
         This only exists for performance reasons.
 
         '''
-        if not team_videos:
-            return []
-
-        workflows = list(Workflow.objects.filter(team=team_videos[0].team))
-
         for tv in team_videos:
-            tv.workflow = Workflow.get_for_team_video(tv, workflows)
+            tv.workflow = Workflow.get_for_team_video(tv)
 
 
     def get_specific_target(self):
@@ -1633,6 +1674,78 @@ class Workflow(models.Model):
         return (self.requires_review_or_approval or self.autocreate_subtitle
                 or self.autocreate_translate)
 
+class WorkflowMap(object):
+    """All the workflows for a team, indexed for quick lookups.
+
+    We store these in the django cache (see teams.cache.get_workflow_map()),
+    so looking up the workflow for a team video doesn't need any DB queries.
+    The cache is invalidated when a Workflow, Project, or Team is saved or
+    deleted.
+    """
+    def __init__(self, team_id, workflow_enabled, workflows,
+                 enabled_project_ids):
+        self.team_id = team_id
+        self.workflow_enabled = workflow_enabled
+        self.team_video_workflows = {}
+        self.project_workflows = {}
+        self.team_workflow = None
+        for workflow in workflows:
+            if workflow.team_video_id:
+                self.team_video_workflows[workflow.team_video_id] = workflow
+            elif workflow.project_id:
+                if workflow.project_id in enabled_project_ids:
+                    self.project_workflows[workflow.project_id] = workflow
+            else:
+                self.team_workflow = workflow
+
+    @classmethod
+    def build(cls, team_id):
+        workflow_enabled = (Team.objects.filter(pk=team_id)
+                            .values_list('workflow_enabled', flat=True))
+        enabled_project_ids = set(Project.objects
+                                  .filter(team=team_id, workflow_enabled=True)
+                                  .values_list('id', flat=True))
+        return cls(team_id, bool(workflow_enabled and workflow_enabled[0]),
+                   list(Workflow.objects.filter(team=team_id)),
+                   enabled_project_ids)
+
+    def lookup(self, team_video_id=None, project_id=None):
+        """Find the most specific workflow
+
+        Team video workflows take precedence over project workflows, which
+        take precedence over the team workflow.
+
+        :returns: Workflow object, or None if the default workflow should be
+        used.  The Workflow objects are copies, so it's safe to modify them.
+        """
+        if team_video_id in self.team_video_workflows:
+            workflow = self.team_video_workflows[team_video_id]
+        elif project_id in self.project_workflows:
+            workflow = self.project_workflows[project_id]
+        elif self.workflow_enabled and self.team_workflow is not None:
+            workflow = self.team_workflow
+        else:
+            return None
+        return copy.copy(workflow)
+
+def invalidate_workflow_map(sender, instance, **kwargs):
+    if sender is Team:
+        team_cache.invalidate_workflow_map(instance.id)
+    else:
+        team_cache.invalidate_workflow_map(instance.team_id)
+
+post_save.connect(invalidate_workflow_map, Team,
+                  dispatch_uid='teams.team.invalidate-workflow-map')
+post_delete.connect(invalidate_workflow_map, Team,
+                    dispatch_uid='teams.team.invalidate-workflow-map')
+post_save.connect(invalidate_workflow_map, Project,
+                  dispatch_uid='teams.project.invalidate-workflow-map')
+post_delete.connect(invalidate_workflow_map, Project,
+                    dispatch_uid='teams.project.invalidate-workflow-map')
+post_save.connect(invalidate_workflow_map, Workflow,
+                  dispatch_uid='teams.workflow.invalidate-workflow-map')
+post_delete.connect(invalidate_workflow_map, Workflow,
+                    dispatch_uid='teams.workflow.invalidate-workflow-map')
 
 # Tasks
 class TaskManager(models.Manager):
@@ -2713,17 +2826,67 @@ class BillingReport(models.Model):
                 self.start_date.strftime('%Y-%m-%d'),
                 self.end_date.strftime('%Y-%m-%d'))
 
+    # Number of approve tasks to handle at once when generating rows
+    CHUNK_SIZE = 500
+
     def _get_approved_tasks(self):
         return Task.objects.complete_approve().filter(
             approved=Task.APPROVED_IDS['Approved'],
             team__in=self.teams.all(),
             completed__range=(self.start_date, self.end_date))
 
+    def _iter_approved_task_chunks(self):
+        """Iterate through the approved tasks for this report in chunks.
+
+        Yields lists of tasks with the related objects that we use for the
+        report already loaded.
+        """
+        qs = (self._get_approved_tasks()
+              .select_related('team', 'team_video__video', 'assignee',
+                              'new_subtitle_version')
+              .order_by('pk'))
+        last_pk = 0
+        while True:
+            chunk = list(qs.filter(pk__gt=last_pk)[:self.CHUNK_SIZE])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1].pk
+
+    def _latest_completed_tasks(self, qs, approve_tasks):
+        """Find the latest completed task for each approve task
+
+        This handles all the approve tasks with 1 query, which is much faster
+        than running a query for each task.
+
+        :param qs: Task QuerySet to look for tasks in
+        :param approve_tasks: list of approve tasks
+        :returns: dict mapping (team_video_id, language) to tasks
+        """
+        team_video_ids = set(t.team_video_id for t in approve_tasks)
+        rv = {}
+        for task in (qs.filter(team_video__in=team_video_ids)
+                     .select_related('assignee').order_by('completed')):
+            rv[task.team_video_id, task.language] = task
+        return rv
+
+    def _video_title(self, video):
+        # title_display() needs a couple queries and we often have several
+        # rows for the same video, so cache the titles
+        if not hasattr(self, '_video_title_cache'):
+            self._video_title_cache = {}
+        if video.id not in self._video_title_cache:
+            self._video_title_cache[video.id] = video.title_display()
+        return self._video_title_cache[video.id]
+
+    def _minutes(self, version):
+        return get_minutes_for_version(version, False)
+
     def _report_date(self, datetime):
         return datetime.strftime('%Y-%m-%d %H:%M:%S')
 
-    def generate_rows_type_approval(self):
-        header = (
+    def iter_rows_type_approval(self):
+        yield (
             'Team',
             'Video Title',
             'Video ID',
@@ -2734,30 +2897,30 @@ class BillingReport(models.Model):
             'Approver',
             'Date',
         )
-        rows = [header]
-        for approve_task in self._get_approved_tasks():
-            video = approve_task.team_video.video
-            version = approve_task.new_subtitle_version
-            language = version.subtitle_language
-            subtitle_task = (Task.objects.complete_subtitle_or_translate()
-                             .filter(team_video=approve_task.team_video,
-                                     language=approve_task.language)
-                             .order_by('-completed'))[0]
-            rows.append((
-                approve_task.team.name,
-                video.title_display(),
-                video.video_id,
-                approve_task.language,
-                get_minutes_for_version(version, False),
-                language.is_primary_audio_language(),
-                subtitle_task.type==Task.TYPE_IDS['Translate'],
-                unicode(approve_task.assignee),
-                self._report_date(approve_task.completed),
-            ))
-        return rows
-
-    def generate_rows_type_approval_for_users(self):
-        header = (
+        for approve_tasks in self._iter_approved_task_chunks():
+            subtitle_tasks = self._latest_completed_tasks(
+                Task.objects.complete_subtitle_or_translate(), approve_tasks)
+            for approve_task in approve_tasks:
+                video = approve_task.team_video.video
+                version = approve_task.new_subtitle_version
+                subtitle_task = subtitle_tasks.get(
+                    (approve_task.team_video_id, approve_task.language))
+                yield (
+                    approve_task.team.name,
+                    self._video_title(video),
+                    video.video_id,
+                    approve_task.language,
+                    self._minutes(version),
+                    (video.primary_audio_language_code ==
+                     version.language_code),
+                    (subtitle_task is not None and
+                     subtitle_task.type == Task.TYPE_IDS['Translate']),
+                    unicode(approve_task.assignee),
+                    self._report_date(approve_task.completed),
+                )
+
+    def iter_rows_type_approval_for_users(self):
+        yield (
             'User',
             'Task Type',
             'Team',
@@ -2771,101 +2934,100 @@ class BillingReport(models.Model):
             'Date',
             'Pay Rate',
         )
+        # The rows are sorted by user, so this report can't be streamed
+        # completely.  The rows are just tuples though, the expensive part is
+        # loading the tasks and versions, which we do in chunks.
         data_rows = []
-        for approve_task in self._get_approved_tasks():
-            video = approve_task.team_video.video
-            version = approve_task.get_subtitle_version()
-            language = version.subtitle_language
-
-            all_tasks = [approve_task]
-            try:
-                all_tasks.append((Task.objects.complete_subtitle_or_translate()
-                                  .filter(team_video=approve_task.team_video,
-                                          language=approve_task.language)
-                                  .order_by('-completed'))[0])
-            except IndexError:
-                # no subtitling task, probably the review task was manually
-                # created.
-                pass
-            try:
-                all_tasks.append((Task.objects.complete_review()
-                                  .filter(team_video=approve_task.team_video,
-                                          language=approve_task.language)
-                                  .order_by('-completed'))[0])
-            except IndexError:
-                # review not enabled
-                pass
-
-            for task in all_tasks:
-                data_rows.append((
-                    unicode(task.assignee),
-                    task.get_type_display(),
-                    approve_task.team.name,
-                    video.title_display(),
-                    video.video_id,
-                    language.language_code,
-                    get_minutes_for_version(version, False),
-                    language.is_primary_audio_language(),
-                    unicode(approve_task.assignee),
-                    unicode(task.body),
-                    self._report_date(task.completed),
-                    task.assignee.pay_rate_code,
-                ))
+        for approve_tasks in self._iter_approved_task_chunks():
+            subtitle_tasks = self._latest_completed_tasks(
+                Task.objects.complete_subtitle_or_translate(), approve_tasks)
+            review_tasks = self._latest_completed_tasks(
+                Task.objects.complete_review(), approve_tasks)
+            for approve_task in approve_tasks:
+                video = approve_task.team_video.video
+                version = approve_task.get_subtitle_version()
+                key = (approve_task.team_video_id, approve_task.language)
+
+                all_tasks = [approve_task]
+                # If there's no subtitling task, the review task was probably
+                # manually created.  If there's no review task, review is
+                # probably not enabled.
+                for task in (subtitle_tasks.get(key), review_tasks.get(key)):
+                    if task is not None:
+                        all_tasks.append(task)
+
+                for task in all_tasks:
+                    data_rows.append((
+                        unicode(task.assignee),
+                        task.get_type_display(),
+                        approve_task.team.name,
+                        self._video_title(video),
+                        video.video_id,
+                        version.language_code,
+                        self._minutes(version),
+                        (video.primary_audio_language_code ==
+                         version.language_code),
+                        unicode(approve_task.assignee),
+                        unicode(task.body),
+                        self._report_date(task.completed),
+                        task.assignee.pay_rate_code,
+                    ))
 
         data_rows.sort(key=lambda row: row[0])
-        return [header] + data_rows
+        for row in data_rows:
+            yield row
 
-    def generate_rows_type_billing_record(self):
-        rows = []
+    def iter_rows_type_billing_record(self):
         for i,team in enumerate(self.teams.all()):
-            rows = rows + BillingRecord.objects.csv_report_for_team(team,
-                self.start_date, self.end_date, add_header=i == 0)
-        return rows
+            for row in BillingRecord.objects.csv_report_for_team(team,
+                self.start_date, self.end_date, add_header=i == 0):
+                yield row
 
-    def generate_rows(self):
+    def iter_rows(self):
+        """Iterate through the rows for this report, including the header."""
         if self.type == BillingReport.TYPE_BILLING_RECORD:
-            rows = self.generate_rows_type_billing_record()
+            return self.iter_rows_type_billing_record()
         elif self.type == BillingReport.TYPE_APPROVAL:
-            rows = self.generate_rows_type_approval()
+            return self.iter_rows_type_approval()
         elif self.type == BillingReport.TYPE_APPROVAL_FOR_USERS:
-            rows = self.generate_rows_type_approval_for_users()
+            return self.iter_rows_type_approval_for_users()
         else:
             raise ValueError("Unknown type: %s" % self.type)
-        return rows
 
-    def convert_unicode_to_utf8(self, rows):
+    def generate_rows(self):
+        return list(self.iter_rows())
+
+    def convert_unicode_to_utf8(self, row):
         def _convert(value):
             if isinstance(value, unicode):
                 return value.encode("utf-8")
             else:
                 return value
-        return [tuple(_convert(v) for v in row) for row in rows]
+        return tuple(_convert(v) for v in row)
 
     def process(self):
         """
-        Generate the correct rows (including headers), saves it to a tempo file,
-        then set's that file to the csv_file property, which if , using the S3
-        storage will take care of exporting it to s3.
+        Generate the correct rows (including headers), and write them to a temp
+        file as we go.  Then set that file to the csv_file property, which if
+        using the S3 storage will take care of exporting it to s3.
         """
         try:
-            rows = self.generate_rows()
+            self.csv_file = self.make_csv_file(self.iter_rows())
         except StandardError:
             logger.error("Error generating billing report: (id: %s)", self.id)
             self.csv_file = None
-        else:
-            self.csv_file = self.make_csv_file(rows)
         self.processed = datetime.datetime.utcnow()
         self.save()
 
     def make_csv_file(self, rows):
-        rows = self.convert_unicode_to_utf8(rows)
         fn = '/tmp/bill-%s-teams-%s-%s-%s-%s.csv' % (
             self.teams.all().count(),
             self.start_str, self.end_str,
             self.get_type_display(), self.pk)
         with open(fn, 'w') as f:
             writer = csv.writer(f)
-            writer.writerows(rows)
+            for row in rows:
+                writer.writerow(self.convert_unicode_to_utf8(row))
 
         return File(open(fn, 'r'))
 
@@ -3062,36 +3224,7 @@ def get_minutes_for_version(version, round_up_to_integer):
     """
     Return the number of minutes the subtitles specified in version
     """
-    subs = version.get_subtitles()
-
-    if len(subs) == 0:
-        return 0
-
-    for sub in subs:
-        if sub.start_time is not None:
-            start_time = sub.start_time
-            break
-        # we shouldn't have an end time set without a start time, but handle
-        # it just in case
-        if sub.end_time is not None:
-            start_time = sub.end_time
-            break
-    else:
-        return 0
-
-    for sub in reversed(subs):
-        if sub.end_time is not None:
-            end_time = sub.end_time
-            break
-        # we shouldn't have an end time not set, but check for that just in
-        # case
-        if sub.start_time is not None:
-            end_time = sub.start_time
-            break
-    else:
-        return 0
-
-    duration_seconds =  (end_time - start_time) / 1000.0
+    duration_seconds = version.get_duration_ms() / 1000.0
     minutes = duration_seconds/60.0
     if round_up_to_integer:
         minutes = int(ceil(minutes))
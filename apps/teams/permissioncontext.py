@@ -0,0 +1,123 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""teams.permissioncontext -- Request-scoped cache for team memberships.
+
+Permission checks need the TeamMember and narrowings for the user, which
+normally means a couple queries for each check.  Pages that list tasks or
+videos can run dozens of checks per row.
+
+Inside a permission_context() block, the memberships for the user are loaded
+once per team and then reused.  This is opt-in: wrap the code yourself, or
+use the with_permission_context decorator for views.  Changes to TeamMember
+or MembershipNarrowing objects clear the cache, so the results don't change.
+"""
+
+from contextlib import contextmanager
+import functools
+import threading
+
+_local = threading.local()
+
+class PermissionContext(object):
+    def __init__(self, user):
+        self.user = user
+        # maps team ids to TeamMember objects, or None for non-members
+        self.members = {}
+
+    def load_teams(self, teams):
+        """Load the memberships for a list of teams.
+
+        This uses 2 queries, no matter how many teams we are loading.
+        """
+        from teams.models import MembershipNarrowing, TeamMember
+
+        teams = dict((team.id, team) for team in teams
+                     if team.id not in self.members)
+        if not teams:
+            return
+        for team_id in teams:
+            self.members[team_id] = None
+        members = {}
+        for member in TeamMember.objects.filter(user=self.user,
+                                                team__in=teams.keys()):
+            member.team = teams[member.team_id]
+            member._cached_narrowings = []
+            members[member.id] = member
+            self.members[member.team_id] = member
+        if members:
+            narrowings = (MembershipNarrowing.objects
+                          .filter(member__in=members.keys())
+                          .select_related('project'))
+            for narrowing in narrowings:
+                members[narrowing.member_id]._cached_narrowings.append(
+                    narrowing)
+
+    def get_member(self, team):
+        """Get the TeamMember for our user, or None."""
+        if team.id not in self.members:
+            self.load_teams([team])
+        return self.members[team.id]
+
+    def clear(self):
+        self.members = {}
+
+def get_context(user):
+    """Get the active PermissionContext for a user.
+
+    Returns None if there is no active context, or it's for a different
+    user.
+    """
+    context = getattr(_local, 'context', None)
+    if (context is not None and user is not None and
+        user.is_authenticated() and context.user.id == user.id):
+        return context
+    return None
+
+def clear():
+    """Clear the active PermissionContext, if any."""
+    context = getattr(_local, 'context', None)
+    if context is not None:
+        context.clear()
+
+@contextmanager
+def permission_context(user, teams=None):
+    """Cache team memberships for user inside the block
+
+    :param user: User to cache memberships for
+    :param teams: list of teams to preload memberships for
+    """
+    old_context = getattr(_local, 'context', None)
+    if user is not None and user.is_authenticated():
+        _local.context = PermissionContext(user)
+        if teams:
+            _local.context.load_teams(teams)
+    else:
+        _local.context = None
+    try:
+        yield _local.context
+    finally:
+        _local.context = old_context
+
+def with_permission_context(view_func):
+    """View decorator that runs the view inside permission_context()."""
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with permission_context(request.user):
+            return view_func(request, *args, **kwargs)
+    return wrapper
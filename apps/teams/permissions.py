@@ -461,7 +461,7 @@ def can_view_tasks_tab(team, user):
     if not user or not user.is_authenticated():
         return False
 
-    return team.members.filter(user=user).exists()
+    return team.is_member(user)
 
 def can_invite(team, user):
     """Return whether the given user can send an invite for the given team."""
@@ -16,8 +16,12 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from collections import defaultdict
+import itertools
+
 from django.conf import settings
 from django.db.models import Count
+from django.db.models.query import QuerySet
 from haystack import site
 from haystack.backends import SQ
 from haystack.indexes import (
@@ -27,12 +31,34 @@ from haystack.indexes import (
 from haystack.query import SearchQuerySet
 from teams import models
 from subtitles.models import SubtitleLanguage
+from videos.models import VideoUrl
 
 from haystack.exceptions import AlreadyRegistered
 
 
 LANGUAGES_DICT = dict(settings.ALL_LANGUAGES)
 
+# Number of team videos to fetch related data for at once when indexing
+PREFETCH_CHUNK_SIZE = 100
+
+class TeamVideoIndexQuerySet(QuerySet):
+    """QuerySet that prefetches the data needed to index team videos.
+
+    update_index passes slices of index_queryset() to backend.update(), which
+    calls prepare() for each team video.  This class calls prefetch_many()
+    for each chunk of results as they are iterated through.
+    """
+    def iterator(self):
+        index = site.get_index(models.TeamVideo)
+        team_videos = super(TeamVideoIndexQuerySet, self).iterator()
+        while True:
+            chunk = list(itertools.islice(team_videos, PREFETCH_CHUNK_SIZE))
+            if not chunk:
+                return
+            index.prefetch_many(chunk)
+            for team_video in chunk:
+                yield team_video
+
 
 class TeamVideoLanguagesIndex(SearchIndex):
     text = CharField(
@@ -86,14 +112,66 @@ class TeamVideoLanguagesIndex(SearchIndex):
     # * Fully translated, if a translation
     num_completed_langs = IntegerField()
 
+    def index_queryset(self):
+        return (TeamVideoIndexQuerySet(models.TeamVideo)
+                .select_related('team', 'video', 'project'))
+
+    def prefetch_many(self, team_videos):
+        """Fetch the related data that prepare() needs for team videos
+
+        This uses a fixed number of queries, no matter how many team videos
+        there are.  The data is cached on the objects, so that prepare()
+        doesn't need to run any queries for them.  It assumes that the team,
+        video, and project are already loaded (see index_queryset()).
+        """
+        team_videos = [tv for tv in team_videos
+                       if not hasattr(tv, '_search_index_data')]
+        if not team_videos:
+            return
+        videos = dict((tv.video_id, tv.video) for tv in team_videos)
+
+        languages = defaultdict(list)
+        for lang in (SubtitleLanguage.objects.filter(video__in=videos.keys())
+                     .fetch_and_join(public_tips=True, private_tips=True,
+                                     videos=videos)):
+            languages[lang.video_id].append(lang)
+
+        video_urls = dict(VideoUrl.objects
+                          .filter(video__in=videos.keys(), primary=True)
+                          .values_list('video_id', 'url'))
+
+        task_counts = dict(models.Task.objects.incomplete()
+                           .filter(team_video__in=team_videos)
+                           .values_list('team_video')
+                           .annotate(Count('id')).order_by())
+
+        for tv in team_videos:
+            tv.video.set_prefetched_languages(languages[tv.video_id])
+            tv._search_index_data = {
+                'video_url': video_urls.get(tv.video_id),
+                'task_count': task_counts.get(tv.id, 0),
+            }
+
+    def prepare_many(self, team_videos):
+        """Prepare the data for several team videos
+
+        :returns: list of prepared data dicts
+        """
+        team_videos = list(team_videos)
+        self.prefetch_many(team_videos)
+        return [self.prepare(tv) for tv in team_videos]
+
     def prepare(self, obj):
+        if not hasattr(obj, '_search_index_data'):
+            self.prefetch_many([obj])
+        prefetched = obj._search_index_data
         self.prepared_data = super(TeamVideoLanguagesIndex, self).prepare(obj)
         self.prepared_data['team_id'] = obj.team.id
         self.prepared_data['team_video_pk'] = obj.id
         self.prepared_data['video_pk'] = obj.video.id
         self.prepared_data['video_id'] = obj.video.video_id
         self.prepared_data['video_title'] = obj.video.title.strip()
-        self.prepared_data['video_url'] = obj.video.get_video_url()
+        self.prepared_data['video_url'] = prefetched['video_url']
 
         original_sl = obj.video.subtitle_language()
 
@@ -115,10 +193,14 @@ class TeamVideoLanguagesIndex(SearchIndex):
         self.prepared_data['project_slug'] = obj.project.slug
         self.prepared_data['team_video_create_date'] = obj.created
 
-        completed_sls = list(obj.video.completed_subtitle_languages())
-        all_sls = obj.video.newsubtitlelanguage_set.having_nonempty_tip()
+        all_sls = sorted(obj.video.all_subtitle_languages(),
+                         key=lambda sl: sl.language_code)
+        completed_sls = [sl for sl in all_sls
+                         if sl.is_complete_and_synced(public=True)]
+        nonempty_tip_sls = [sl for sl in all_sls
+                            if sl.get_tip() and sl.get_tip().subtitle_count > 0]
 
-        self.prepared_data['num_total_langs'] = all_sls.count()
+        self.prepared_data['num_total_langs'] = len(nonempty_tip_sls)
         self.prepared_data['num_completed_langs'] = len(completed_sls)
 
         self.prepared_data['video_completed_langs'] = \
@@ -126,12 +208,14 @@ class TeamVideoLanguagesIndex(SearchIndex):
         self.prepared_data['video_completed_lang_urls'] = \
             [sl.get_absolute_url() for sl in completed_sls]
 
-        self.prepared_data['task_count'] = models.Task.objects.incomplete().filter(team_video=obj).count()
+        self.prepared_data['task_count'] = prefetched['task_count']
 
-        team_video = obj.video.get_team_video()
+        self.prepared_data['is_public'] = obj.team.is_visible
+        self.prepared_data["owned_by_team_id"] = obj.team.id
 
-        self.prepared_data['is_public'] =  team_video.team.is_visible 
-        self.prepared_data["owned_by_team_id"] = team_video.team.id if team_video else None
+        # Don't let the prefetched data go stale if obj gets indexed again
+        del obj._search_index_data
+        obj.video.clear_language_cache()
 
         return self.prepared_data
 
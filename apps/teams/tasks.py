@@ -9,8 +9,8 @@ from django.conf import settings
 from django.contrib.sites.models import Site
 from django.db.models import F
 from django.utils.translation import ugettext_lazy as _
-from haystack import site
 
+from utils import celery_search_index
 from utils import send_templated_email
 from utils.metrics import Gauge, Meter
 from widget.video_cache import (
@@ -140,16 +140,15 @@ def _notify_teams_of_new_videos(team_qs):
 
 @task()
 def update_one_team_video(team_video_id):
-    """Update the Solr index for the given team video."""
+    """Update the Solr index for the given team video.
+
+    If search index updates are batched, this just queues the update.
+    """
     from teams.models import TeamVideo
-    try:
-        team_video = TeamVideo.objects.get(id=team_video_id)
-    except TeamVideo.DoesNotExist:
-        return
-
-    tv_search_index = site.get_index(TeamVideo)
-    tv_search_index.backend.update(
-        tv_search_index, [team_video])
+    if celery_search_index.BATCH_UPDATES:
+        celery_search_index.queue_index_update(TeamVideo, team_video_id)
+    else:
+        celery_search_index.update_objects(TeamVideo, [team_video_id])
 
 
 @task()
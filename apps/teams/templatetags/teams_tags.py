@@ -474,7 +474,7 @@ def can_create_any_task_for_teamvideo(context, team_video, user):
 
 @register.filter
 def review_enabled(team):
-    w = Workflow.get_for_target(team.id, 'team')
+    w = Workflow.get_for_team(team)
 
     if w.review_enabled:
         return True
@@ -490,7 +490,7 @@ def review_enabled(team):
 
 @register.filter
 def approve_enabled(team):
-    w = Workflow.get_for_target(team.id, 'team')
+    w = Workflow.get_for_team(team)
 
     if w.approve_enabled:
         return True
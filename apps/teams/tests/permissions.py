@@ -38,8 +38,10 @@ from teams.permissions import (
     can_create_task_translate, can_join_team, can_edit_video, can_approve,
     roles_user_can_invite, can_add_video_somewhere, can_assign_tasks,
     can_create_and_edit_translations, save_role, can_remove_video,
-    can_delete_team, can_delete_video, can_post_edit_subtitles
+    can_delete_team, can_delete_video, can_post_edit_subtitles,
+    get_role_for_target
 )
+from teams.permissioncontext import permission_context
 
 
 TOTAL_LANGS = len(SUPPORTED_LANGUAGE_CODES)
@@ -945,6 +947,52 @@ class TestRules(BaseTestPermission):
         langs = can_create_task_translate(self.nonproject_video, outsider)
         self.assertEqual(langs, [])
 
+class PermissionContextTest(BaseTestPermission):
+    def check_perms(self):
+        return [
+            get_role_for_target(self.user, self.team),
+            get_role_for_target(self.user, self.team, self.test_project),
+            get_role_for_target(self.user, self.team, self.test_project,
+                                'en'),
+            can_assign_tasks(self.team, self.user, self.test_project),
+            can_view_tasks_tab(self.team, self.user),
+            self.team.is_member(self.user),
+            self.team.is_manager(self.user),
+        ]
+
+    def test_same_results(self):
+        def check():
+            self.uncache_team_member()
+            without_context = self.check_perms()
+            with permission_context(self.user):
+                self.assertEquals(self.check_perms(), without_context)
+
+        check()
+        with self.role(ROLE_MANAGER):
+            check()
+        with self.role(ROLE_MANAGER, project=self.test_project):
+            check()
+        with self.role(ROLE_ADMIN, lang='fr'):
+            check()
+
+    def test_no_queries_after_load(self):
+        with self.role(ROLE_MANAGER, project=self.test_project):
+            self.uncache_team_member()
+            with permission_context(self.user, teams=[self.team]):
+                self.assertNumQueries(0, self.check_perms)
+
+    def test_membership_changes(self):
+        with permission_context(self.user, teams=[self.team]):
+            self.assertFalse(self.team.is_member(self.user))
+            with self.role(ROLE_ADMIN):
+                self.assertTrue(self.team.is_admin(self.user))
+            self.assertFalse(self.team.is_member(self.user))
+
+    def test_other_users(self):
+        with permission_context(self.user, teams=[self.team]):
+            self.assertTrue(self.team.is_owner(self.owner_account))
+            self.assertFalse(self.team.is_owner(self.user))
+
 class RolePermissionsTest(BaseTestPermission):
     """ Test a permission using role-based checking
 
@@ -18,6 +18,7 @@
 
 from __future__ import absolute_import
 
+from django.db import connection
 from django.test import TestCase
 from haystack import site
 
@@ -58,3 +59,45 @@ class SearchRecordTest(TestCase):
         self.assertEquals(
             set(self.get_prepared_data()['video_completed_langs']),
             set(['en', 'fr']))
+
+    def test_prepare_many(self):
+        team_video2 = TeamVideoFactory(team=self.team)
+        pipeline.add_subtitles(self.video, 'en', None, complete=True)
+        pipeline.add_subtitles(team_video2.video, 'fr', None, complete=True)
+        pipeline.add_subtitles(team_video2.video, 'es', None, complete=False)
+        index = site.get_index(TeamVideo)
+        team_videos = list(index.index_queryset()
+                           .filter(pk__in=[self.team_video.pk,
+                                           team_video2.pk])
+                           .order_by('pk'))
+        prepared_many = index.prepare_many(team_videos)
+        prepared_one = [index.prepare(tv) for tv in
+                        TeamVideo.objects.filter(pk__in=[self.team_video.pk,
+                                                         team_video2.pk])
+                        .order_by('pk')]
+        self.assertEquals(prepared_many, prepared_one)
+        self.assertEquals(prepared_many[1]['video_completed_langs'], ['fr'])
+
+    def count_queries(self, func):
+        connection.use_debug_cursor = True
+        try:
+            start = len(connection.queries)
+            func()
+            return len(connection.queries) - start
+        finally:
+            connection.use_debug_cursor = False
+
+    def test_prepare_many_query_count(self):
+        # the number of queries shouldn't depend on the number of team videos
+        index = site.get_index(TeamVideo)
+        def prepare_team_videos():
+            index.prepare_many(index.index_queryset()
+                               .filter(team=self.team))
+        for team_video in TeamVideo.objects.all():
+            pipeline.add_subtitles(team_video.video, 'en', None)
+        query_count = self.count_queries(prepare_team_videos)
+        for i in xrange(3):
+            team_video = TeamVideoFactory(team=self.team)
+            pipeline.add_subtitles(team_video.video, 'en', None)
+        self.assertEquals(self.count_queries(prepare_team_videos),
+                          query_count)
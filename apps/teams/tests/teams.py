@@ -25,7 +25,7 @@ from teams import tasks
 from teams.models import (
     Team, Invite, TeamVideo, Application, TeamMember,
     TeamLanguagePreference, Partner, TeamNotificationSetting,
-    InviteExpiredException
+    InviteExpiredException, Workflow
 )
 from teams.permissions import add_role
 from teams.rpc import TeamsApiClass
@@ -281,6 +281,56 @@ class TeamVideoTest(TestCase):
         self.assertEquals('public', sub.visibility)
 
 
+class WorkflowLookupTest(TestCase):
+    def setUp(self):
+        self.team = TeamFactory(workflow_enabled=True)
+        self.project = ProjectFactory(team=self.team, workflow_enabled=True)
+        self.team_video = TeamVideoFactory(team=self.team,
+                                           added_by=UserFactory(),
+                                           project=self.project)
+        self.team_workflow = WorkflowFactory(team=self.team)
+        self.project_workflow = WorkflowFactory(team=self.team,
+                                                project=self.project)
+        self.team_video_workflow = WorkflowFactory(
+            team=self.team, project=self.project, team_video=self.team_video)
+
+    def lookup(self):
+        team_video = TeamVideo.objects.select_related('team').get(
+            pk=self.team_video.pk)
+        return Workflow.get_for_team_video(team_video)
+
+    def test_precedence(self):
+        self.assertEquals(self.lookup().pk, self.team_video_workflow.pk)
+        self.team_video_workflow.delete()
+        self.assertEquals(self.lookup().pk, self.project_workflow.pk)
+        self.project.workflow_enabled = False
+        self.project.save()
+        self.assertEquals(self.lookup().pk, self.team_workflow.pk)
+        self.team.workflow_enabled = False
+        self.team.save()
+        workflow = self.lookup()
+        self.assertEquals(workflow.pk, None)
+        self.assertEquals(workflow.team, self.team)
+
+    def test_invalidate_on_workflow_save(self):
+        self.assertEquals(self.lookup().review_allowed, 30)
+        self.team_video_workflow.review_allowed = 20
+        self.team_video_workflow.save()
+        self.assertEquals(self.lookup().review_allowed, 20)
+
+    def test_no_queries_when_cached(self):
+        team_video = TeamVideo.objects.select_related('team').get(
+            pk=self.team_video.pk)
+        Workflow.get_for_team(self.team)
+        with self.assertNumQueries(0):
+            workflow = Workflow.get_for_team_video(team_video)
+        self.assertEquals(workflow.pk, self.team_video_workflow.pk)
+
+    def test_get_for_team(self):
+        self.assertEquals(self.team.get_workflow().pk, self.team_workflow.pk)
+        self.assertEquals(Workflow.get_for_target(self.team.id, 'team').pk,
+                          self.team_workflow.pk)
+
 class TeamsTest(TestCase):
 
     def setUp(self):
@@ -66,6 +66,7 @@ from teams.permissions import (
     can_perform_task_for, can_delete_team, can_delete_video, can_remove_video,
     can_delete_language, can_move_videos, can_sort_by_primary_language
 )
+from teams.permissioncontext import with_permission_context
 from teams.signals import api_teamvideo_new
 from teams.tasks import (
     invalidate_video_caches, invalidate_video_moderation_caches,
@@ -440,6 +441,7 @@ def _get_videos_for_detail_page(team, user, query, project, language_code,
 
 # Videos
 @timefn
+@with_permission_context
 @render_to('teams/videos-list.html')
 def detail(request, slug, project_slug=None, languages=None):
     team = get_team_for_view(slug, request.user)
@@ -536,9 +538,6 @@ def detail(request, slug, project_slug=None, languages=None):
     team_video_md_list, pagination_info = paginate(qs, per_page, request.GET.get('page'))
     extra_context.update(pagination_info)
     extra_context['team_video_md_list'] = team_video_md_list
-    extra_context['team_workflows'] = list(
-        Workflow.objects.filter(team=team.id)
-                        .select_related('project', 'team', 'team_video'))
 
     if not filtered and not query:
         if project:
@@ -721,9 +720,6 @@ def move_videos(request, slug, project_slug=None, languages=None):
     team_video_md_list, pagination_info = paginate(qs, per_page, request.GET.get('page'))
     extra_context.update(pagination_info)
     extra_context['team_video_md_list'] = team_video_md_list
-    extra_context['team_workflows'] = list(
-        Workflow.objects.filter(team=team.id)
-                        .select_related('project', 'team', 'team_video'))
 
     if not filtered and not query:
         if project:
@@ -1570,6 +1566,7 @@ def old_dashboard(request, team):
     return context
 
 @timefn
+@with_permission_context
 @render_to('teams/tasks.html')
 def team_tasks(request, slug, project_slug=None):
     team = get_team_for_view(slug, request.user)
@@ -18,18 +18,37 @@
 
 """videos.feed_parser.import -- Import videos from a feed."""
 
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.template.defaultfilters import slugify
+
 from .parser import FeedParser
+from videos.types.youtube import YoutubeVideoType
+
+BULK_IMPORT = getattr(settings, 'FEED_IMPORT_BULK', True)
+# Max number of threads to use to fetch video info in bulk mode
+FETCH_THREADS = getattr(settings, 'FEED_IMPORT_FETCH_THREADS', 8)
+# Max number of videos to insert at once in bulk mode
+INSERT_CHUNK_SIZE = 100
 
 class VideoImporter(object):
     """Import videos from a feed URL."""
-    def __init__(self, url, user):
+    def __init__(self, url, user, bulk=None):
         """Create a VideoImporter
 
         :param url: feed url
         :param user: User that creates videos for
+        :param bulk: Use bulk mode.  Bulk mode fetches the video info
+            concurrently and creates the videos using bulk inserts, rather
+            than calling Video.get_or_create_for_url() for each item.
+            Defaults to the FEED_IMPORT_BULK setting.
         """
         self.url = url
         self.user = user
+        self.bulk = bulk if bulk is not None else BULK_IMPORT
         self.checked_entries = 0
         self.last_link = ''
 
@@ -78,11 +97,24 @@ class VideoImporter(object):
                             .filter(url__in=urls)
                             .values_list('url', flat=True))
 
+        new_items = []
         for vt, info, entry in items:
             if vt and vt.convert_to_video_url() not in existing_urls:
-                self._create_video(vt, info, entry)
+                new_items.append((vt, info, entry))
             self.checked_entries += 1
 
+        YoutubeVideoType.prefetch_video_info([
+            vt for vt, info, entry in new_items
+            if isinstance(vt, YoutubeVideoType)
+        ])
+
+        if self.bulk:
+            for i in xrange(0, len(new_items), INSERT_CHUNK_SIZE):
+                self._bulk_create_videos(new_items[i:i+INSERT_CHUNK_SIZE])
+        else:
+            for vt, info, entry in new_items:
+                self._create_video(vt, info, entry)
+
     def _create_video(self, video_type, info, entry):
         from videos.models import Video
         video, created = Video.get_or_create_for_url(
@@ -95,3 +127,111 @@ class VideoImporter(object):
                     setattr(video, name, value)
                 video.save()
             self._created_videos.append(video)
+
+    def _bulk_create_videos(self, items):
+        """Create videos for a list of feed items in bulk
+
+        This does the same work as Video.get_or_create_for_url(), but with a
+        constant number of queries and tasks for the whole list.
+        """
+        from videos.models import Action, Video, VideoUrl, create_video_id
+        from videos.tasks import save_thumbnails_in_s3
+        from utils.celery_search_index import queue_index_updates
+
+        # feeds can list the same URL twice, only import it once
+        seen_urls = set()
+        unique_items = []
+        for vt, info, entry in items:
+            url = vt.convert_to_video_url()
+            if url not in seen_urls:
+                seen_urls.add(url)
+                unique_items.append((url, vt, info))
+        if not unique_items:
+            return
+
+        fetched = self._fetch_video_info([vt for url, vt, info in
+                                          unique_items])
+        now = datetime.now()
+        videos = []
+        video_urls = []
+        for (url, vt, info), (video, owner_username) in zip(unique_items,
+                                                            fetched):
+            if video.title:
+                video.slug = slugify(video.title)
+            video.user = self.user
+            if info:
+                for name, value in info.items():
+                    setattr(video, name, value)
+            # bulk_create() doesn't send the pre_save signal
+            create_video_id(Video, video)
+            videos.append(video)
+            video_urls.append(VideoUrl(
+                url=url, type=vt.abbreviation, videoid=vt.video_id or '',
+                original=True, primary=True, added_by=self.user,
+                owner_username=owner_username, created=now))
+
+        with transaction.commit_on_success():
+            Video.objects.bulk_create(videos)
+            # bulk_create() doesn't set the primary keys
+            pk_map = dict(Video.objects
+                          .filter(video_id__in=[v.video_id for v in videos])
+                          .values_list('video_id', 'id'))
+            for video, video_url in zip(videos, video_urls):
+                video.pk = pk_map[video.video_id]
+                video_url.video = video
+            VideoUrl.objects.bulk_create(video_urls)
+            Action.objects.bulk_create([
+                Action(video=video, user=self.user,
+                       action_type=Action.ADD_VIDEO, created=video.created)
+                for video in videos
+            ])
+            if self.user and self.user.notify_by_message:
+                self._bulk_add_follower(videos)
+
+        video_ids = [video.pk for video in videos]
+        save_thumbnails_in_s3.delay(video_ids)
+        queue_index_updates(Video, video_ids)
+        self._created_videos.extend(videos)
+
+    def _fetch_video_info(self, video_types):
+        """Fetch the remote info for a list of video types concurrently
+
+        :returns: list of (video, owner_username) tuples.  video is an unsaved
+        Video with the values from set_values() filled in.
+        """
+        if not video_types:
+            return []
+        pool = ThreadPool(min(FETCH_THREADS, len(video_types)))
+        try:
+            return pool.map(_fetch_video_info, video_types)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _bulk_add_follower(self, videos):
+        # This is what video.followers.add(self.user) does, including
+        # the work done by the m2m_changed handler.
+        from videos.models import Video
+        Video.followers.through.objects.bulk_create([
+            Video.followers.through(video_id=video.pk,
+                                    customuser_id=self.user.pk)
+            for video in videos
+        ])
+        self.user.videos.through.objects.bulk_create([
+            self.user.videos.through(video_id=video.pk,
+                                     customuser_id=self.user.pk)
+            for video in videos
+        ])
+
+def _fetch_video_info(vt):
+    from videos.models import Video
+    try:
+        video = Video()
+        kwargs = {}
+        if vt.CAN_IMPORT_SUBTITLES:
+            kwargs['fetch_subs_async'] = True
+        vt.set_values(video, **kwargs)
+        return video, vt.owner_username()
+    finally:
+        # close the DB connection if set_values() opened one in this thread
+        connection.close()
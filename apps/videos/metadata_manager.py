@@ -20,56 +20,69 @@ from datetime import datetime
 from utils.metrics import Timer
 
 def update_metadata(video_pk):
+    """Update the denormalized fields for a video.
+
+    We calculate all the fields from the tip of each language, then save the
+    fields that changed with a single UPDATE.  We don't call video.save(), to
+    avoid writing every column and firing the post_save signal handlers.
+    """
     from videos.models import Video
     with Timer('metadata-update-time'):
         video = Video.objects.get(pk=video_pk)
-        video.edited = datetime.now()
-        video.save()
-        _update_is_public(video)
-        _update_is_was_subtitled(video)
-        _update_languages_count(video)
-        _update_complete_date(video)
+        changes = _calc_changes(video, _fetch_tips(video))
+        changes['edited'] = datetime.now()
+        Video.objects.filter(pk=video.pk).update(**changes)
+        for name, value in changes.items():
+            setattr(video, name, value)
         _invalidate_cache(video)
 
-def _update_is_was_subtitled(video):
-    from subtitles.models import SubtitleLanguage
-    language_code = video.primary_audio_language_code
-    has_version = (SubtitleLanguage.objects.having_nonempty_tip()
-                                           .filter(video=video, 
-                                                   language_code=language_code)
-                                           .exists())
+def _fetch_tips(video):
+    """Fetch the tip version for each language of a video.
 
-    if not has_version:
-        if video.is_subtitled:
-            video.is_subtitled = False
-            video.save()
-    else:
-        if not video.is_subtitled or not video.was_subtitled:
-            video.is_subtitled = True
-            video.was_subtitled = True
-            video.save()
+    This uses the same tip definition as
+    SubtitleLanguage.objects.having_nonempty_tip() and
+    SubtitleLanguage.is_complete_and_synced().
+    """
+    from subtitles.models import SubtitleVersion
+    return list(SubtitleVersion.objects.private_tips()
+                .filter(video=video)
+                .select_related('subtitle_language'))
 
-def _update_languages_count(video):
-    video.languages_count = video.newsubtitlelanguage_set.having_nonempty_tip().count()
-    video.save()
+def _calc_changes(video, tips):
+    """Calculate the changes to the denormalized fields for a video
 
-def _update_complete_date(video):
-    is_complete = video.is_complete
+    :returns: dict mapping field names to the new values for the fields that
+        changed
+    """
+    nonempty_tips = [tip for tip in tips if tip.subtitle_count > 0]
+    is_subtitled = any(tip.language_code == video.primary_audio_language_code
+                       for tip in nonempty_tips)
+    is_complete = any(tip.subtitle_language.subtitles_complete and
+                      tip.is_synced() for tip in tips)
+
+    values = {
+        'is_public': _calc_is_public(video),
+        'is_subtitled': is_subtitled,
+        'was_subtitled': video.was_subtitled or is_subtitled,
+        'languages_count': len(nonempty_tips),
+    }
     if is_complete and video.complete_date is None:
-        video.complete_date = datetime.now()
-        video.save()
+        values['complete_date'] = datetime.now()
     elif not is_complete and video.complete_date is not None:
-        video.complete_date = None
-        video.save()
+        values['complete_date'] = None
+
+    return dict((name, value) for name, value in values.items()
+                if getattr(video, name) != value)
 
 def _invalidate_cache(video):
     from widget import video_cache
     video_cache.invalidate_cache(video.video_id)
 
-def _update_is_public(video):
-    team_video = video.get_team_video()
-    if team_video:
-        video.is_public = team_video.team.is_visible
+def _calc_is_public(video):
+    from teams.models import TeamVideo
+    team_visible = list(TeamVideo.objects.filter(video=video)
+                        .values_list('team__is_visible', flat=True))
+    if team_visible:
+        return team_visible[0]
     else:
-        video.is_public = True
-    video.save()
+        return True
@@ -140,6 +140,8 @@ class SubtitleLanguageFetcher(object):
     def fetch_one_language(self, video, language_code):
         if language_code in self.cache:
             return self.cache[language_code]
+        if self.all_languages_fetched:
+            return None
         try:
             lang = (video.newsubtitlelanguage_set
                     .get(language_code=language_code))
@@ -174,6 +176,13 @@ class SubtitleLanguageFetcher(object):
         if languages is None:
             self.all_languages_fetched = True
 
+    def set_all_languages(self, video, languages):
+        self.cache = {}
+        for lang in languages:
+            lang.video = video
+            self.cache[lang.language_code] = lang
+        self.all_languages_fetched = True
+
     def clear_cache(self):
         self.cache = {}
         self.all_languages_fetched = False
@@ -249,9 +258,9 @@ class Video(models.Model):
         return title
 
     def update_search_index(self):
-        """Queue a Celery task that will update this video's Solr entry."""
-        from utils.celery_search_index import update_search_index
-        update_search_index.delay(self.__class__, self.pk)
+        """Queue an update to this video's Solr entry."""
+        from utils.celery_search_index import queue_index_update
+        queue_index_update(self.__class__, self.pk)
 
     @property
     def views(self):
@@ -677,6 +686,17 @@ class Video(models.Model):
                                                   with_public_tips,
                                                   with_private_tips)
 
+    def set_prefetched_languages(self, languages):
+        """Cache languages for this video that were fetched elsewhere
+
+        This is useful when fetching languages for many videos at once.
+        subtitle_language() and all_subtitle_languages() will use these
+        languages instead of running queries.
+
+        :languages: list of all the SubtitleLanguages for this video.
+        """
+        self._language_fetcher.set_all_languages(self, languages)
+
     def clear_language_cache(self):
         self._language_fetcher.clear_cache()
 
@@ -684,21 +704,29 @@ class Video(models.Model):
         """Return all SubtitleLanguages for this video with the given language code."""
         return self.newsubtitlelanguage_set.filter(language_code=language_code)
 
-    def get_merged_dfxp(self):
-        """Get a DFXP file containing subtitles for all languages."""
+    def get_merged_dfxp_versions(self):
+        """Get the versions to merge for get_merged_dfxp().
+
+        This is the public tip for each language, with the primary audio
+        language first.
+        """
         self.prefetch_languages(with_public_tips=True)
 
-        subtitle_sets = []
+        versions = []
         for language in self.all_subtitle_languages():
             tip = language.get_public_tip()
             if tip is not None:
                 if language.is_primary_audio_language():
-                    subtitle_sets.insert(0, tip.get_subtitles())
+                    versions.insert(0, tip)
                 else:
-                    subtitle_sets.append(tip.get_subtitles())
+                    versions.append(tip)
+        return versions
 
-        if len(subtitle_sets) > 0:
-            return dfxp_merge(subtitle_sets)
+    def get_merged_dfxp(self):
+        """Get a DFXP file containing subtitles for all languages."""
+        versions = self.get_merged_dfxp_versions()
+        if len(versions) > 0:
+            return dfxp_merge([v.get_subtitles() for v in versions])
         else:
             return None
 
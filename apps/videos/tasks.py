@@ -25,7 +25,6 @@ from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.files.base import ContentFile
 from django.db.models import ObjectDoesNotExist
-from haystack import site
 from raven.contrib.django.models import client
 import requests
 
@@ -33,6 +32,7 @@ from babelsubs.storage import diff as diff_subtitles
 from messages.models import Message
 from messages import tasks
 from utils import send_templated_email, DEFAULT_PROTOCOL
+from utils.celery_search_index import queue_index_update
 from utils.metrics import Gauge, Meter
 from videos.models import VideoFeed, Video, VIDEO_TYPE_YOUTUBE, VideoUrl
 from subtitles.models import (
@@ -88,7 +88,18 @@ def save_thumbnail_in_s3(video_id):
         video = Video.objects.get(pk=video_id)
     except Video.DoesNotExist:
         return
+    _save_thumbnail_in_s3(video)
 
+@task
+def save_thumbnails_in_s3(video_ids):
+    """Version of save_thumbnail_in_s3 that handles multiple videos."""
+    for video in Video.objects.filter(pk__in=video_ids):
+        try:
+            _save_thumbnail_in_s3(video)
+        except Exception:
+            client.create_from_exception()
+
+def _save_thumbnail_in_s3(video):
     if video.thumbnail and not video.s3_thumbnail:
         response = requests.get(video.thumbnail, timeout=15)
         content = ContentFile(response.content)
@@ -154,8 +165,7 @@ def video_changed_tasks(video_pk, new_version_id=None):
     tv = video.get_team_video()
 
     if tv:
-        tv_search_index = site.get_index(TeamVideo)
-        tv_search_index.backend.update(tv_search_index, [tv])
+        queue_index_update(TeamVideo, tv.pk)
 
     video.update_search_index()
 
@@ -20,10 +20,15 @@
 import urllib
 import urlparse
 
+import gzip
+from cStringIO import StringIO
+
 from babelsubs.parsers.dfxp import DFXPParser
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+import mock
 
+from subtitles import cache
 from subtitles.templatetags import new_subtitles_tags
 from videos.models import Video
 from videos.tests.data import (
@@ -92,3 +97,80 @@ class DFXPTest(TestCase):
         self.assertEqual(end, 200)
         self.assertEqual(content, 'Here we go!')
 
+
+class ExportCacheTest(TestCase):
+    def setUp(self):
+        self.video = get_video()
+        self.sl_en = make_subtitle_language(self.video, 'en')
+        self.version = make_subtitle_version(
+            self.sl_en, [(100, 200, 'Here we go!')], title='title')
+        self.url = new_subtitles_tags.subtitle_download_url(self.version,
+                                                            'srt')
+
+    def test_render_once(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        # the second request should use the cached export
+        with mock.patch('babelsubs.to') as mock_to:
+            res2 = self.client.get(self.url)
+            cache.clear_exports_lru()
+            res3 = self.client.get(self.url)
+        self.assertEqual(mock_to.call_count, 0)
+        self.assertEqual(res2.content, res.content)
+        self.assertEqual(res3.content, res.content)
+        self.assert_('Here we go!' in res.content)
+
+    def test_etag(self):
+        res = self.client.get(self.url)
+        etag = res['ETag']
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+        # different formats should have different etags
+        other_url = new_subtitles_tags.subtitle_download_url(self.version,
+                                                             'vtt')
+        res = self.client.get(other_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_gzip(self):
+        plain = self.client.get(self.url)
+        res = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+        self.assertNotEqual(res['ETag'], plain['ETag'])
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(res.content)).read(),
+                         plain.content)
+        res = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assert_(not res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, plain.content)
+
+    def test_download_all(self):
+        url = reverse('subtitles:download_all', kwargs={
+            'video_id': self.video.video_id,
+            'filename': 'subtitles',
+        })
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.content, self.video.get_merged_dfxp())
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, 304)
+
+class SizedLRUCacheTest(TestCase):
+    def test_eviction(self):
+        lru = cache.SizedLRUCache(10)
+        lru.set('a', 'aaaa')
+        lru.set('b', 'bbbb')
+        self.assertEqual(lru.total_size, 8)
+        lru.get('a')
+        # adding c should evict b, since it was the least recently used
+        lru.set('c', 'cccc')
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual(lru.get('a'), 'aaaa')
+        self.assertEqual(lru.get('c'), 'cccc')
+        self.assertEqual(lru.total_size, 8)
+        # values bigger than the max size are never stored
+        lru.set('d', 'd' * 11)
+        self.assertEqual(lru.get('d'), None)
+        self.assertEqual(lru.total_size, 8)
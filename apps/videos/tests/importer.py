@@ -71,8 +71,9 @@ class VideoImporterTestCase(TestCase):
             }
         self.mock_feedparser_class.return_value = self.feed_parser
 
-    def run_import_videos(self, import_next=False):
-        import_obj = importer.VideoImporter(self.feed_url(), self.user)
+    def run_import_videos(self, import_next=False, bulk=None):
+        import_obj = importer.VideoImporter(self.feed_url(), self.user,
+                                            bulk=bulk)
         self.import_videos_rv = import_obj.import_videos(import_next)
 
     def check_videos(self, *feed_item_names):
@@ -145,6 +146,40 @@ class VideoImporterTestCase(TestCase):
             VideoUrl.objects.get(url=self.url('item-4')).video,
         ])
 
+    def test_import_without_bulk(self):
+        self.setup_feed_items([
+            ('item-1', {'title': 'foo'}),
+            ('item-2', {}),
+        ])
+        self.run_import_videos(bulk=False)
+        self.check_videos('item-1', 'item-2')
+        video1 = VideoUrl.objects.get(url=self.url('item-1')).video
+        self.assertEquals(video1.title, 'foo')
+
+    def test_bulk_import(self):
+        self.setup_feed_items([
+            ('item-1', {'title': 'foo'}),
+            ('item-2', {}),
+            ('item-2', {}),
+        ])
+        test_utils.save_thumbnails_in_s3.delay.reset_mock()
+        self.run_import_videos(bulk=True)
+        self.check_videos('item-1', 'item-2')
+        video_ids = [v.id for v in self.import_videos_rv]
+        # thumbnails should be saved using 1 task for all videos
+        test_utils.save_thumbnails_in_s3.delay.assert_called_once_with(
+            video_ids)
+        for video in self.import_videos_rv:
+            video_url = video.get_primary_videourl_obj()
+            self.assertEquals(video_url.added_by, self.user)
+            self.assertEquals(video_url.type, 'H')
+            self.assert_(video_url.primary)
+            self.assert_(video_url.original)
+            self.assertEquals(list(video.followers.all()), [self.user])
+            self.assertEquals(video.action_set.count(), 1)
+        self.assertEquals(set(self.user.videos.all()),
+                          set(self.import_videos_rv))
+
     def test_import_extra_links_from_youtube(self):
         # test importing extra items from youtube.
         #
@@ -93,6 +93,18 @@ class TestVideo(TestCase):
         self.assertEqual(cache_id_2, cache_id_3)
         self.assertEqual(Video.objects.count(), 1)
 
+    def test_widget_cache_invalidation(self):
+        test_utils.invalidate_widget_video_cache.run_original_for_test()
+        video = get_video(1)
+        video_id = video.video_id
+        self.assertEqual(video_cache.get_is_moderated(video_id), False)
+        # invalidating the cache should only need to bump the generation
+        with mock.patch('widget.video_cache.cache.delete') as mock_delete:
+            video_cache.invalidate_cache(video_id)
+            self.assertEqual(mock_delete.call_count, 0)
+        with mock.patch.object(Video, 'is_moderated', True):
+            self.assertEqual(video_cache.get_is_moderated(video_id), True)
+
     def test_video_title(self):
         video = get_video(url='http://www.youtube.com/watch?v=pQ9qX8lcaBQ')
 
@@ -213,6 +225,18 @@ class TestModelsSaving(TestCase):
         video = _refresh(video)
         self.assertIsNotNone(video.complete_date)
 
+    def test_update_metadata_doesnt_call_save(self):
+        from videos import metadata_manager
+        video = get_video()
+        sl_en = make_subtitle_language(video, 'en')
+        make_subtitle_version(sl_en, [(100, 200, "foo")])
+        with mock.patch.object(Video, 'save') as mock_save:
+            metadata_manager.update_metadata(video.pk)
+            self.assertEqual(mock_save.call_count, 0)
+        video = Video.objects.get(pk=video.pk)
+        self.assertEqual(video.languages_count, 1)
+        self.assertNotEqual(video.edited, None)
+
 class TestSubtitleLanguageCaching(TestCase):
     def setUp(self):
         self.videos, self.langs, self.versions = bulk_subs({
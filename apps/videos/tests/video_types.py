@@ -98,6 +98,25 @@ class YoutubeVideoTypeTest(TestCase):
         # issue in the future
         self.assertEqual(vu.owner_username, None)
 
+    @test_utils.patch_for_test('utils.youtube.get_video_info')
+    @test_utils.patch_for_test('utils.youtube.get_video_infos')
+    def test_prefetch_video_info(self, mock_get_video_infos,
+                                 mock_get_video_info):
+        video_info = youtube.VideoInfo('test-channel-id', 'title',
+                                       'description', 100,
+                                       'http://example.com/thumb.png')
+        mock_get_video_infos.return_value = {'abc': video_info}
+        vt1 = YoutubeVideoType('http://www.youtube.com/watch?v=abc')
+        vt2 = YoutubeVideoType('http://www.youtube.com/watch?v=def')
+        YoutubeVideoType.prefetch_video_info([vt1, vt2])
+        mock_get_video_infos.assert_called_with(['abc', 'def'])
+        # vt1 should use the prefetched info, vt2 wasn't returned so it
+        # should fetch it itself.
+        self.assertEqual(vt1.get_video_info(), video_info)
+        self.assertEqual(mock_get_video_info.call_count, 0)
+        vt2.get_video_info()
+        mock_get_video_info.assert_called_with('def')
+
     def test_matches_video_url(self):
         for item in self.data:
             self.assertTrue(self.vt.matches_video_url(item['url']))
@@ -625,3 +625,24 @@ class MakeLanguageListTestCase(TestCase):
             ('French', 'incomplete', ['incomplete'], fr.get_absolute_url()),
             ('Japanese', 'needs-timing', ['incomplete'], ja.get_absolute_url()),
         ])
+
+    def test_query_count(self):
+        self.setup_team()
+        for language_code in ('en', 'ar', 'de', 'es', 'fr'):
+            self.add_completed_subtitles(language_code, [
+                (0, 1000, "Hello, ", {'new_paragraph':True}),
+                (1500, 2500, "World"),
+            ])
+        for language_code in ('ja', 'pt'):
+            self.add_not_completed_subtitles(language_code, [
+                (0, 1000, "Hello, ", {'new_paragraph':True}),
+                (None, None, "World"),
+            ])
+        video = Video.objects.get(pk=self.video.pk)
+        video.prefetch_languages(with_public_tips=True,
+                                 with_private_tips=True)
+        # We should only need 2 queries to build the list, no matter how many
+        # languages there are: 1 for the team video and 1 for the tasks.
+        with self.assertNumQueries(2):
+            language_list = views.LanguageList(video)
+        self.assertEquals(len(language_list), 7)
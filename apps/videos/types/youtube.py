@@ -72,6 +72,25 @@ class YoutubeVideoType(VideoType):
             self._video_info = youtube.get_video_info(self.video_id)
         return self._video_info
 
+    @classmethod
+    def prefetch_video_info(cls, video_types):
+        """Fetch the video info for several YoutubeVideoTypes at once.
+
+        This uses youtube.get_video_infos() to fetch the info in batches
+        rather than making an API request for each video.  If there's an
+        error, we just let get_video_info() try again for each video.
+        """
+        if not video_types:
+            return
+        try:
+            video_infos = youtube.get_video_infos(
+                [vt.video_id for vt in video_types])
+        except youtube.APIError:
+            return
+        for vt in video_types:
+            if vt.video_id in video_infos:
+                vt._video_info = video_infos[vt.video_id]
+
     def set_values(self, video, fetch_subs_async=True):
         try:
             video_info = self.get_video_info()
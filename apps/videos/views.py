@@ -98,19 +98,34 @@ AVAILABLE_SUBTITLE_FORMATS_FOR_DISPLAY = [
 LanguageListItem = namedtuple("LanguageListItem", "name status tags url")
 
 class LanguageList(object):
-    """List of languages for the video pages."""
+    """List of languages for the video pages.
+
+    This is built with a constant number of queries, regardless of how many
+    languages the video has.  Callers should call
+    video.prefetch_languages(with_public_tips=True, with_private_tips=True)
+    first, so that the languages and tips are already cached.  Synced status
+    comes from the stored SubtitleVersion.fully_synced column and the
+    incomplete tasks for the team video are fetched with a single query.
+    """
 
     def __init__(self, video):
-        original_languages = []
-        other_languages = []
+        languages = []
         for lang in video.all_subtitle_languages():
             public_tip = lang.get_tip(public=False)
             if public_tip is None or public_tip.subtitle_count == 0:
                 # no versions in this language yet
                 continue
+            languages.append(lang)
+
+        team_video = video.get_team_video()
+        task_types = self._fetch_task_types(team_video, languages)
+
+        original_languages = []
+        other_languages = []
+        for lang in languages:
             language_name = lang.get_language_code_display()
             status = self._calc_status(lang)
-            tags = self._calc_tags(lang)
+            tags = self._calc_tags(lang, task_types)
             url = lang.get_absolute_url()
             item = LanguageListItem(language_name, status, tags, url)
             if lang.language_code == video.primary_audio_language_code:
@@ -121,6 +136,25 @@ class LanguageList(object):
         other_languages.sort(key=lambda li: li.name)
         self.items = original_languages + other_languages
 
+    def _fetch_task_types(self, team_video, languages):
+        """Get the type of the first incomplete task for each language
+
+        We only need this for completed languages in team videos.
+
+        :returns: dict mapping language codes to task types
+        """
+        language_codes = [lang.language_code for lang in languages
+                          if lang.subtitles_complete]
+        if team_video is None or not language_codes:
+            return {}
+        task_types = {}
+        for language_code, task_type in (
+            Task.objects.incomplete()
+            .filter(team_video=team_video, language__in=language_codes)
+            .values_list('language', 'type')):
+            task_types.setdefault(language_code, task_type)
+        return task_types
+
     def _calc_status(self, lang):
         if lang.subtitles_complete:
             if lang.has_public_version():
@@ -133,32 +167,24 @@ class LanguageList(object):
             else:
                 return 'needs-timing'
 
-    def _calc_tags(self, lang):
+    def _calc_tags(self, lang, task_types):
         tags = []
         if lang.is_primary_audio_language():
             tags.append(ugettext(u'original'))
 
-        team_video = lang.video.get_team_video()
-
         if not lang.subtitles_complete:
             tags.append(ugettext(u'incomplete'))
-        elif team_video is not None:
+        elif lang.language_code in task_types:
             # subtiltes are complete, check if they are under review/approval.
-            incomplete_tasks = (Task.objects.incomplete()
-                                            .filter(team_video=team_video,
-                                                    language=lang.language_code))
-            for t in incomplete_tasks:
-                if t.type == Task.TYPE_IDS['Review']:
-                    tags.append(ugettext(u'needs review'))
-                    break
-                elif t.type == Task.TYPE_IDS['Approve']:
-                    tags.append(ugettext(u'needs approval'))
-                    break
-                else:
-                    # subtitles are complete, but there's a subtitle/translate
-                    # task for them.  They must have gotten sent back.
-                    tags.append(ugettext(u'needs editing'))
-                    break
+            task_type = task_types[lang.language_code]
+            if task_type == Task.TYPE_IDS['Review']:
+                tags.append(ugettext(u'needs review'))
+            elif task_type == Task.TYPE_IDS['Approve']:
+                tags.append(ugettext(u'needs approval'))
+            else:
+                # subtitles are complete, but there's a subtitle/translate
+                # task for them.  They must have gotten sent back.
+                tags.append(ugettext(u'needs editing'))
         return tags
 
     def __iter__(self):
@@ -656,6 +682,7 @@ class LanguagePageContextRevisions(LanguagePageContext):
             revisions_qs, self.REVISIONS_PER_PAGE, request.GET.get('page'))
         self.update(pagination_info)
         self['revisions'] = language.optimize_versions(revisions)
+        language.calc_version_changes(self['revisions'])
 
 class LanguagePageContextSyncHistory(LanguagePageContext):
     def setup_tab(self, request, video, language, version):
@@ -16,8 +16,8 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 import datetime
+import time
 
-from django.conf import settings
 from django.core.cache import cache
 from django.utils.hashcompat import sha_constructor
 from django.utils.translation import (
@@ -71,40 +71,35 @@ def associate_extra_url(video_url, video_id):
 
 
 # Invalidation
-def invalidate_cache(video_id):
-    cache.delete(_video_urls_key(video_id))
+#
+# Most of the keys for a video include a generation number.  To invalidate
+# them, we just increment the generation and let the old entries age out of
+# the cache.
+#
+# The generation starts at the current time in milliseconds.  That way if
+# the generation key gets evicted, the new generation won't match any
+# of the old ones.
+GENERATION_TIMEOUT = TIMEOUT * 2
+
+def _new_generation():
+    return int(time.time() * 1000)
+
+def _video_generation(video_id):
+    cache_key = _video_generation_key(video_id)
+    generation = cache.get(cache_key)
+    if generation is None:
+        generation = _new_generation()
+        if not cache.add(cache_key, generation, GENERATION_TIMEOUT):
+            # another process set the generation before us, use that one
+            generation = cache.get(cache_key, generation)
+    return generation
 
+def invalidate_cache(video_id):
     try:
-        from videos.models import Video
-        video = Video.objects.get(video_id=video_id)
-        for l in video.newsubtitlelanguage_set.all():
-            cache.delete(_subtitles_dict_key(video_id, l.pk))
-    except Video.DoesNotExist:
-        pass
-
-    for language in settings.ALL_LANGUAGES:
-        cache.delete(_subtitle_language_pk_key(video_id, language[0]))
-
-    cache.delete(_subtitle_language_pk_key(video_id, None))
-    cache.delete(_subtitles_dict_key(video_id, None))
-    cache.delete(_subtitles_count_key(video_id))
-    cache.delete(_video_languages_key(video_id))
-    cache.delete(_video_languages_verbose_key(video_id))
-    cache.delete(_video_is_moderated_key(video_id))
-    cache.delete(_video_visibility_policy_key(video_id))
-    cache.delete(_video_filename_key(video_id))
-
-    from videos.models import Video
-    try:
-        video = Video.objects.get(video_id=video_id)
-        for url in video.videourl_set.all():
-            cache.delete(_video_id_key(url.url))
-
-        team_video = video.get_team_video()
-
-        if team_video:
-            cache.delete(_video_completed_languages(team_video.id))
-    except Video.DoesNotExist:
+        cache.incr(_video_generation_key(video_id))
+    except ValueError:
+        # No generation is stored, which means nothing has been cached for
+        # the video since the last time the generation key expired.
         pass
 
 def invalidate_video_id(video_url):
@@ -118,47 +113,77 @@ def invalidate_video_visibility(video_id):
 
 def on_video_url_save(sender, instance, **kwargs):
     if instance.video_id:
+        invalidate_video_id(instance.url)
         invalidate_cache(instance.video.video_id)
 
 def on_video_url_delete(sender, instance, **kwargs):
+    invalidate_video_id(instance.url)
     if instance.video and instance.video.video_id:
         invalidate_cache(instance.video.video_id)
 
+def _video_generation_key(video_id):
+    return 'widget_video_generation_{0}'.format(video_id)
+
 def _video_id_key(video_url):
     return 'video_id_{0}'.format(sha_constructor(video_url).hexdigest())
 
 def _video_urls_key(video_id):
-    return 'widget_video_urls_{0}'.format(video_id)
+    return 'widget_video_urls_{0}_{1}'.format(
+        video_id, _video_generation(video_id))
 
 def _subtitles_dict_key(video_id, language_pk, version_no=None):
-    return 'widget_subtitles_{0}{1}{2}'.format(video_id, language_pk, version_no)
+    return 'widget_subtitles_{0}{1}{2}_{3}'.format(
+        video_id, language_pk, version_no, _video_generation(video_id))
 
 def _subtitles_count_key(video_id):
-    return "subtitle_count_{0}".format(video_id)
+    return "subtitle_count_{0}_{1}".format(
+        video_id, _video_generation(video_id))
 
 def _video_languages_key(video_id):
-    return "widget_video_languages_{0}".format(video_id)
+    return "widget_video_languages_{0}_{1}".format(
+        video_id, _video_generation(video_id))
 
 def _video_languages_verbose_key(video_id):
-    return "widget_video_languages_verbose_{0}".format(video_id)
+    return "widget_video_languages_verbose_{0}_{1}".format(
+        video_id, _video_generation(video_id))
 
-def _video_completed_languages(video_id):
-    return "video_completed_verbose_{0}".format(video_id)
+def _video_completed_languages(team_video_id):
+    video_id = _team_video_video_id(team_video_id)
+    return "video_completed_verbose_{0}_{1}".format(
+        team_video_id, _video_generation(video_id))
+
+def _team_video_video_id(team_video_id):
+    # team videos never change their video, so it's safe to cache this
+    cache_key = "team_video_video_id_{0}".format(team_video_id)
+    value = cache.get(cache_key)
+    if value is None:
+        from teams.models import TeamVideo
+        video_ids = list(TeamVideo.objects.filter(id=team_video_id)
+                         .values_list('video__video_id', flat=True))
+        if not video_ids:
+            return None
+        value = video_ids[0]
+        cache.set(cache_key, value, TIMEOUT)
+    return value
 
 def _video_writelocked_langs_key(video_id):
     return "writelocked_langs_{0}".format(video_id)
 
 def _subtitle_language_pk_key(video_id, language_code):
-    return "sl_pk_{0}{1}".format(video_id, language_code)
+    return "sl_pk_{0}{1}_{2}".format(
+        video_id, language_code, _video_generation(video_id))
 
 def _video_is_moderated_key(video_id):
-    return 'widget_video_is_moderated_{0}'.format(video_id)
+    return 'widget_video_is_moderated_{0}_{1}'.format(
+        video_id, _video_generation(video_id))
 
 def _video_filename_key(video_id):
-    return 'widget_video_filename_{0}'.format(video_id)
+    return 'widget_video_filename_{0}_{1}'.format(
+        video_id, _video_generation(video_id))
 
 def _video_visibility_policy_key(video_id):
-    return 'widget_video_vis_key_{0}'.format(video_id)
+    return 'widget_video_vis_key_{0}_{1}'.format(
+        video_id, _video_generation(video_id))
 
 
 def pk_for_default_language(video_id, language_code):
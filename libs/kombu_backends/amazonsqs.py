@@ -1,9 +1,22 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 from kombu.transport import virtual
 from boto.sqs.connection import SQSConnection
 from django.conf import settings
 from boto import exception as boto_exceptions
 
 LOG_AMAZON_BROKER = getattr(settings, 'LOG_AMAZON_BROKER', False)
+# How long to long-poll for messages.  This is split between the queues that
+# we're consuming from.
+SQS_WAIT_TIME_SECONDS = getattr(settings, 'SQS_WAIT_TIME_SECONDS', 20)
+# How long we keep received messages in our buffer.  This needs to be well
+# under the visibility timeout of the queues (30 seconds by default),
+# otherwise SQS will make the messages visible again and they will get
+# delivered twice.
+SQS_MAX_BUFFER_SECONDS = getattr(settings, 'SQS_MAX_BUFFER_SECONDS', 10)
 
 try:
     from termcolor import cprint
@@ -25,7 +38,102 @@ EVENT_QUEUE_NAME = 'celeryev'
 from utils.redis_utils import default_connection
 from statistic.log_methods import LogNativeMethodsMetaclass, RedisLogBackend
 
-class SQSLoggingConnection(SQSConnection):
+# SQS limits for batch requests
+MAX_BATCH_MESSAGES = 10
+MAX_BATCH_BYTES = 256 * 1024
+# Key in the request params that BatchRequestsMixin.make_request() uses for
+# the API version.  It's removed before sending the request.
+API_VERSION_PARAM = '__api_version__'
+
+class BatchResults(object):
+    """Parses the response for SendMessageBatch and DeleteMessageBatch
+
+    results and errors are lists of dicts, with the data for each
+    *BatchResultEntry/BatchResultErrorEntry element.
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.results = []
+        self.errors = []
+        self.current = None
+
+    def startElement(self, name, attrs, connection):
+        if name == 'BatchResultErrorEntry':
+            self.current = {}
+            self.errors.append(self.current)
+        elif name.endswith('BatchResultEntry'):
+            self.current = {}
+            self.results.append(self.current)
+        return None
+
+    def endElement(self, name, value, connection):
+        if name.endswith('BatchResultEntry'):
+            self.current = None
+        elif self.current is not None:
+            self.current[name] = value
+
+class BatchRequestsMixin(object):
+    """Adds batch requests and long polling to SQSConnection
+
+    Our version of boto predates these, so we build the requests ourselves.
+    They need a newer API version than the one boto uses.  We only use it for
+    these requests, the rest of the requests stay on boto's version.
+    """
+    BATCH_API_VERSION = '2012-11-05'
+
+    def make_request(self, action, params=None, path='/', verb='GET'):
+        if not params or API_VERSION_PARAM not in params:
+            return super(BatchRequestsMixin, self).make_request(
+                action, params, path, verb)
+        # This is AWSQueryConnection.make_request(), but with the version
+        # taken from params.
+        params = params.copy()
+        api_version = params.pop(API_VERSION_PARAM)
+        http_request = self.build_base_http_request(verb, path, None,
+                                                    params, {}, '',
+                                                    self.server_name())
+        http_request.params['Action'] = action
+        http_request.params['Version'] = api_version
+        return self._mexe(http_request)
+
+    def receive_message_batch(self, queue, number_messages,
+                              wait_time_seconds=0):
+        params = {
+            API_VERSION_PARAM: self.BATCH_API_VERSION,
+            'MaxNumberOfMessages': number_messages,
+        }
+        if wait_time_seconds:
+            params['WaitTimeSeconds'] = wait_time_seconds
+        return self.get_list('ReceiveMessage', params,
+                             [('Message', queue.message_class)],
+                             queue.id, queue)
+
+    def delete_message_batch(self, queue, messages):
+        params = {API_VERSION_PARAM: self.BATCH_API_VERSION}
+        for i, message in enumerate(messages):
+            prefix = 'DeleteMessageBatchRequestEntry.%d' % (i + 1)
+            params[prefix + '.Id'] = str(i)
+            params[prefix + '.ReceiptHandle'] = message.receipt_handle
+        return self.get_object('DeleteMessageBatch', params, BatchResults,
+                               queue.id, verb='POST')
+
+    def send_message_batch(self, queue, bodies):
+        """Send multiple messages
+
+        :param bodies: list of encoded message bodies
+        """
+        params = {API_VERSION_PARAM: self.BATCH_API_VERSION}
+        for i, body in enumerate(bodies):
+            prefix = 'SendMessageBatchRequestEntry.%d' % (i + 1)
+            params[prefix + '.Id'] = str(i)
+            params[prefix + '.MessageBody'] = body
+        return self.get_object('SendMessageBatch', params, BatchResults,
+                               queue.id, verb='POST')
+
+class BatchSQSConnection(BatchRequestsMixin, SQSConnection):
+    pass
+
+class SQSLoggingConnection(BatchRequestsMixin, SQSConnection):
     __metaclass__ = LogNativeMethodsMetaclass
 
     logger_backend = RedisLogBackend(default_connection)
@@ -33,7 +141,58 @@ class SQSLoggingConnection(SQSConnection):
 if LOG_AMAZON_BROKER:
     DEFAULT_CONNECTION = SQSLoggingConnection
 else:
-    DEFAULT_CONNECTION = SQSConnection
+    DEFAULT_CONNECTION = BatchSQSConnection
+
+def batch_chunks(bodies):
+    """Split message bodies into chunks that fit into a batch request."""
+    chunk = []
+    chunk_size = 0
+    for body in bodies:
+        if chunk and (len(chunk) >= MAX_BATCH_MESSAGES or
+                      chunk_size + len(body) > MAX_BATCH_BYTES):
+            yield chunk
+            chunk = []
+            chunk_size = 0
+        chunk.append(body)
+        chunk_size += len(body)
+    if chunk:
+        yield chunk
+
+_local = threading.local()
+
+@contextmanager
+def batch_sends():
+    """Send the messages published inside the block in batches
+
+    Use this when publishing a lot of tasks at once, for example:
+
+        with batch_sends():
+            for ids in batches:
+                my_task.delay(ids)
+
+    Messages are buffered and sent using SendMessageBatch when the block
+    exits.  If we're not using the SQS backend, this has no effect.
+    """
+    if getattr(_local, 'pending_sends', None) is not None:
+        # nested call, the outer block will send the messages
+        yield
+        return
+    _local.pending_sends = []
+    try:
+        yield
+    finally:
+        pending_sends = _local.pending_sends
+        _local.pending_sends = None
+        by_queue = {}
+        order = []
+        for channel, queue, body in pending_sends:
+            key = (channel, queue)
+            if key not in by_queue:
+                by_queue[key] = []
+                order.append(key)
+            by_queue[key].append(body)
+        for channel, queue in order:
+            channel._put_many(queue, by_queue[channel, queue])
 
 class Channel(virtual.Channel):
 
@@ -46,6 +205,13 @@ class Channel(virtual.Channel):
     def __init__(self, connection, **kwargs):
         self.queue_prefix = connection.client.virtual_host or ''
         self.queue_cache = {}
+        # messages that we've received, but not delivered yet
+        self.message_buffers = {}
+        # when we received the messages in each buffer
+        self.buffer_times = {}
+        # messages that we've delivered, but not deleted from SQS yet
+        self.pending_deletes = {}
+        self.wait_time_seconds = SQS_WAIT_TIME_SECONDS
         super(Channel, self).__init__(connection, **kwargs)
 
     def _lookup(self, exchange, routing_key, default="ae.undeliver"):
@@ -73,32 +239,102 @@ class Channel(virtual.Channel):
         return super(Channel, self)._lookup(exchange, routing_key, default)
 
     def _get(self, queue, timeout=None):
-        """Get next message from `queue`."""
-        DEBUG and pr('>>> Channel._get: %s' % queue)
-        q = self._get_queue(queue)
-        m = q.read()
+        """Get next message from `queue`.
 
-        if m:
-            q.delete_message(m)
-            return deserialize(m.get_body())
-        raise Empty()
+        We receive messages in batches and deliver them from a local buffer.
+        Delivered messages get deleted from SQS with a single request once
+        the buffer is used up or SQS_MAX_BUFFER_SECONDS have passed, so if
+        the process dies we only lose the messages that were delivered.
+        """
+        DEBUG and pr('>>> Channel._get: %s' % queue)
+        self._expire_buffers()
+        buf = self.message_buffers.get(queue)
+        if not buf:
+            buf = deque(self._receive(queue))
+            if not buf:
+                raise Empty()
+            self.message_buffers[queue] = buf
+            self.buffer_times[queue] = time.time()
+
+        m = buf.popleft()
+        self.pending_deletes.setdefault(queue, []).append(m)
+        if not buf:
+            self._flush_deletes(queue)
+        return deserialize(m.get_body())
+
+    def _expire_buffers(self):
+        """Drop buffers that are older than SQS_MAX_BUFFER_SECONDS
+
+        We delete the messages that we delivered from them.  The rest will
+        become visible again after their visibility timeout, since we never
+        delivered them they won't run twice.
+        """
+        expire_time = time.time() - SQS_MAX_BUFFER_SECONDS
+        for queue, received_at in self.buffer_times.items():
+            if received_at <= expire_time:
+                self._drop_buffer(queue)
+
+    def _drop_buffer(self, queue):
+        self._flush_deletes(queue)
+        self.message_buffers.pop(queue, None)
+        self.buffer_times.pop(queue, None)
+
+    def _flush_deletes(self, queue):
+        messages = self.pending_deletes.pop(queue, None)
+        if messages:
+            self.client.delete_message_batch(self._get_queue(queue),
+                                             messages)
+
+    def drain_events(self, timeout=None):
+        # The virtual channel doesn't call _get() when the consumer's
+        # prefetch limit is reached, so check for old buffers here too.
+        self._expire_buffers()
+        return super(Channel, self).drain_events(timeout)
+
+    def _receive(self, queue):
+        if queue in self._active_queues:
+            # _poll() cycles through the active queues, so split the wait
+            # time between them.
+            wait_time = self.wait_time_seconds // len(self._active_queues)
+        else:
+            wait_time = 0
+        return self.client.receive_message_batch(
+            self._get_queue(queue), MAX_BATCH_MESSAGES, wait_time)
 
     def _put(self, queue, message, **kwargs):
         """Put `message` onto `queue`."""
         DEBUG and pr('>>> Channel._put: %s, %s' % (queue, message))
+        pending_sends = getattr(_local, 'pending_sends', None)
+        if pending_sends is not None:
+            pending_sends.append((self, queue, serialize(message)))
+            return
         q = self._get_queue(queue)
         m = q.new_message(serialize(message))
         q.write(m)
 
+    def _put_many(self, queue, bodies):
+        """Put serialized messages onto `queue` using batch requests."""
+        DEBUG and pr('>>> Channel._put_many: %s, %s' % (queue, len(bodies)))
+        q = self._get_queue(queue)
+        encoded = [q.new_message(body).get_body_encoded() for body in bodies]
+        for chunk in batch_chunks(encoded):
+            result = self.client.send_message_batch(q, chunk)
+            for error in result.errors:
+                # Retry failed messages individually, this raises an
+                # exception if it fails again.
+                self.client.send_message(q, chunk[int(error['Id'])])
+
     def _purge(self, queue):
         """Remove all messages from `queue`."""
         DEBUG and pr('>>> Channel._purge: %s' % queue)
+        self._drop_buffer(queue)
         return self._get_queue(queue).clear()
 
     def _size(self, queue):
         """Return the number of messages in `queue` as an :class:`int`."""
         DEBUG and pr('>>> Channel._size: %s' % queue)
-        return self._get_queue(queue).count()
+        return (self._get_queue(queue).count() +
+                len(self.message_buffers.get(queue, ())))
 
     def _delete(self, queue):
         """Delete `queue`.
@@ -158,6 +394,14 @@ class Channel(virtual.Channel):
         DEBUG and pr('>>> Channel._poll: %s' % cycle)
         return cycle.get()
 
+    def close(self):
+        # Delete the messages that we've delivered.  Any messages that are
+        # still in our buffers will become visible again once their
+        # visibility timeout expires.
+        for queue in self.message_buffers.keys():
+            self._drop_buffer(queue)
+        super(Channel, self).close()
+
     def _create_client(self):
         DEBUG and pr('>>> Channel._create_client')
         access_key = self.connection.client.userid
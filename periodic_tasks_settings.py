@@ -79,6 +79,10 @@ CELERYBEAT_SCHEDULE = {
         'task': 'videos.tasks.gauge_billing_records',
         'schedule': timedelta(seconds=60),
     },
+    'flush_index_updates': {
+        'task': 'utils.celery_search_index.flush_index_updates',
+        'schedule': timedelta(seconds=30),
+    },
 }
 
 # try adding periodic tasks from our integration repo
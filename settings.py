@@ -261,6 +261,29 @@ HAYSTACK_SITECONF = 'search_site'
 HAYSTACK_SEARCH_ENGINE = 'solr'
 HAYSTACK_SOLR_URL = 'http://127.0.0.1:8983/solr'
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 20
+# Buffer search index updates in redis and send them to solr in batches.  See
+# utils.celery_search_index.
+SEARCH_INDEX_BATCH_UPDATES = True
+SEARCH_INDEX_BATCH_SIZE = 250
+
+# Count hits in redis instead of inserting a row for each one.  See
+# statistic.hitcounts.
+HITCOUNTS_WRITE_BEHIND = True
+
+# Import feed videos using bulk inserts, fetching the video info with this
+# many threads.  See videos.feed_parser.importer.
+FEED_IMPORT_BULK = True
+FEED_IMPORT_FETCH_THREADS = 8
+
+# Store new SubtitleVersions as deltas against their parent when that's
+# smaller, with a full copy at least every SUBTITLE_DELTA_KEYFRAME_INTERVAL
+# versions.  See subtitles.serialization.
+SUBTITLE_DELTA_ENCODING = False
+SUBTITLE_DELTA_KEYFRAME_INTERVAL = 10
+
+# Number of videos to sync in parallel when syncing all subtitles for an
+# external account.  See externalsites.syncengine.
+EXTERNAL_SYNC_THREADS = 8
 SOLR_ROOT = rel('..', 'buildout', 'parts', 'solr', 'example')
 
 # socialauth-related
@@ -334,6 +357,9 @@ DEFAULT_BUCKET = ''
 AWS_USER_DATA_BUCKET_NAME  = ''
 STATIC_MEDIA_USES_S3 = USE_AMAZON_S3 = False
 STATIC_MEDIA_COMPRESSED = True
+# How long browsers/proxies can cache bundles served by the local server
+# before revalidating them with the ETag
+STATIC_MEDIA_BUNDLE_MAX_AGE = 300
 
 AVATAR_MAX_SIZE = 500*1024
 THUMBNAILS_SIZE = (
@@ -36,6 +36,10 @@ DEFAULT_PROTOCOL = 'https'
 TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 NOSE_PLUGINS = ['utils.test_utils.UnisubsTestPlugin']
 CELERY_ALWAYS_EAGER = True
+SEARCH_INDEX_BATCH_UPDATES = False
+HITCOUNTS_WRITE_BEHIND = False
+# Worker threads can't see the test transaction
+EXTERNAL_SYNC_THREADS = 1
 
 # Use MD5 password hashing, other algorithms are purposefully slow to increase
 # security.  Also include the SHA1 hasher since some of the tests use it.
@@ -47,5 +47,7 @@ def lock(name):
     """Context manager that manages an app-wide lock."""
     cursor = connection.cursor()
     acquire_lock(cursor, name)
-    yield
-    release_lock(cursor, name)
+    try:
+        yield
+    finally:
+        release_lock(cursor, name)
@@ -1,7 +1,21 @@
+"""Search index updates
+
+Updates to the search index go through queue_index_update(), which adds the
+object to a redis sorted set.  The flush_index_updates periodic task pops
+objects off the set and sends them to solr in batches.  Queueing an object
+multiple times between flushes only results in 1 update, since the set is
+keyed by the object.
+
+Set SEARCH_INDEX_BATCH_UPDATES to False to run a celery task for each update
+instead.
+"""
+
+from collections import defaultdict
 import time
 
 from celery.task import task
-from django.db.models import signals
+from django.conf import settings
+from django.db.models import get_model, signals
 from haystack import indexes, site
 from haystack.exceptions import NotRegistered
 from haystack.utils import get_identifier
@@ -9,6 +23,13 @@ from redisco import models as rmodels
 
 from utils.redis_utils import default_connection
 
+BATCH_UPDATES = getattr(settings, 'SEARCH_INDEX_BATCH_UPDATES', True)
+BATCH_SIZE = getattr(settings, 'SEARCH_INDEX_BATCH_SIZE', 250)
+QUEUE_KEY = 'search-index-update-queue'
+# Failed updates get retried after RETRY_DELAY seconds, doubling each time.
+# After MAX_TRIES failures we give up on them.
+RETRY_DELAY = 60
+MAX_TRIES = 5
 
 class CelerySearchIndex(indexes.SearchIndex):
     def _setup_save(self, model):
@@ -24,7 +45,7 @@ class CelerySearchIndex(indexes.SearchIndex):
         signals.post_delete.disconnect(self.remove_handler, sender=model)
 
     def update_handler(self, instance, **kwargs):
-        update_search_index.deplay(instance.__class__, instance.pk)
+        queue_index_update(instance.__class__, instance.pk)
 
     def remove_handler(self, instance, **kwargs):
         remove_search_index.delay(instance.__class__, get_identifier(instance))
@@ -62,6 +83,167 @@ def update_search_index(model_class, pk):
 
     search_index.update_object(obj)
 
+def queue_index_update(model_class, pk):
+    """Schedule an update to the search index for an object."""
+    queue_index_updates(model_class, [pk])
+
+def queue_index_updates(model_class, pks):
+    """Schedule updates to the search index for several objects."""
+    if not pks:
+        return
+    if not BATCH_UPDATES:
+        for pk in pks:
+            update_search_index.delay(model_class, pk)
+        return
+    now = time.time()
+    members = dict(('%s.%s:%s' % (model_class._meta.app_label,
+                                  model_class._meta.module_name, pk), now)
+                   for pk in pks)
+    default_connection.zadd(QUEUE_KEY, **members)
+
+def _retries_key():
+    return QUEUE_KEY + ':tries'
+
+def _parse_queue_member(member):
+    """Get the model class and pk for a queue member.
+
+    :returns: (model_class, pk) or None if the member is invalid, for example
+        because the model no longer exists.
+    """
+    try:
+        model_name, pk = member.rsplit(':', 1)
+        app_label, module_name = model_name.split('.')
+        pk = int(pk)
+    except ValueError:
+        return None
+    model_class = get_model(app_label, module_name)
+    if model_class is None:
+        return None
+    return model_class, pk
+
+def _get_queued_updates(max_score):
+    """Get the next batch of queued updates.
+
+    We only return updates that are due by max_score, failed updates are
+    rescheduled into the future.
+
+    :returns: list of (member, score) tuples.  The entries stay in the queue
+        until we call _remove_queued_updates().
+    """
+    return default_connection.zrangebyscore(QUEUE_KEY, '-inf', max_score,
+                                            start=0, num=BATCH_SIZE,
+                                            withscores=True)
+
+def _remove_queued_updates(members):
+    """Remove updates that we've sent to solr from the queue.
+
+    If an object was queued again while we were updating it, its score will
+    have changed.  We leave it in the queue, since it may have changed after
+    we read it.
+    """
+    if not members:
+        return
+    pipe = default_connection.pipeline()
+    for member, score in members:
+        pipe.zscore(QUEUE_KEY, member)
+    current_scores = pipe.execute()
+    pipe = default_connection.pipeline()
+    for (member, score), current_score in zip(members, current_scores):
+        if current_score == score:
+            pipe.zrem(QUEUE_KEY, member)
+        pipe.hdel(_retries_key(), member)
+    pipe.execute()
+
+def _retry_queued_updates(members):
+    """Reschedule failed updates, dropping them after MAX_TRIES failures."""
+    if not members:
+        return
+    pipe = default_connection.pipeline()
+    for member in members:
+        pipe.hincrby(_retries_key(), member, 1)
+    tries = pipe.execute()
+    now = time.time()
+    pipe = default_connection.pipeline()
+    for member, try_count in zip(members, tries):
+        if try_count >= MAX_TRIES:
+            log(u'Giving up on search index update for %s' % member)
+            pipe.zrem(QUEUE_KEY, member)
+            pipe.hdel(_retries_key(), member)
+        else:
+            delay = RETRY_DELAY * 2 ** (try_count - 1)
+            pipe.zadd(QUEUE_KEY, **{member: now + delay})
+    pipe.execute()
+
+def _drop_queued_updates(members):
+    pipe = default_connection.pipeline()
+    for member in members:
+        log(u'Dropping invalid search index update: %s' % member)
+        pipe.zrem(QUEUE_KEY, member)
+        pipe.hdel(_retries_key(), member)
+    pipe.execute()
+
+@task()
+def flush_index_updates():
+    """Send the queued search index updates to solr.
+
+    Updates are only removed from the queue after we've sent them.  If
+    a batch fails, we retry its objects 1 at a time and reschedule the ones
+    that still fail with an increasing delay, so 1 bad object doesn't hold up
+    the rest of the queue.
+    """
+    start_time = time.time()
+    while True:
+        members = _get_queued_updates(start_time)
+        if not members:
+            return
+        to_update = defaultdict(list)
+        invalid = []
+        for member, score in members:
+            parsed = _parse_queue_member(member)
+            if parsed is None:
+                invalid.append(member)
+            else:
+                model_class, pk = parsed
+                to_update[model_class].append((member, score, pk))
+        _drop_queued_updates(invalid)
+        sent = []
+        failed = []
+        for model_class, updates in to_update.items():
+            try:
+                update_objects(model_class, [pk for member, score, pk
+                                             in updates])
+            except Exception:
+                log(u'Error updating search index for %s, retrying objects '
+                    'individually' % model_class, exc_info=True)
+            else:
+                sent.extend((member, score) for member, score, pk
+                            in updates)
+                continue
+            for member, score, pk in updates:
+                try:
+                    update_objects(model_class, [pk])
+                except Exception:
+                    log(u'Error updating search index for %s' % member,
+                        exc_info=True)
+                    failed.append(member)
+                else:
+                    sent.append((member, score))
+        _remove_queued_updates(sent)
+        _retry_queued_updates(failed)
+
+def update_objects(model_class, pks):
+    """Update the search index for several objects with 1 request."""
+    try:
+        search_index = site.get_index(model_class)
+    except NotRegistered:
+        log(u'Search index is not registered for %s' % model_class)
+        return
+
+    objects = [obj for obj in search_index.index_queryset().filter(pk__in=pks)
+               if search_index.should_update(obj)]
+    if objects:
+        search_index.backend.update(search_index, objects)
+
 class LogEntry(rmodels.Model):
     num = rmodels.IntegerField()
     time = rmodels.FloatField()
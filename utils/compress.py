@@ -35,3 +35,19 @@ def compress(data):
 def decompress(data):
     """Decompress data created with compress."""
     return zlib.decompress(base64.decodestring(data))
+
+# zlib writes a gzip header and trailer with this wbits value
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+def gzip_string(data, compresslevel=6):
+    """Compress a bytestring using gzip and return the result.
+
+    The gzip header doesn't include a timestamp, so compressing the same data
+    always gives the same result.
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+def gunzip_string(data):
+    """Decompress data created with gzip_string."""
+    return zlib.decompress(data, GZIP_WBITS)
@@ -15,8 +15,11 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
 import requests
 
+from utils.compress import gunzip_string
 
 def url_exists(url):
     """Check that a url (when following redirection) exists.
@@ -29,3 +32,54 @@ def url_exists(url):
         return 200 <= requests.head(url, timeout=15.0).status_code < 400
     except (requests.ConnectionError, requests.Timeout):
         return False
+
+def accepts_gzip(request):
+    """Check if the Accept-Encoding header for a request allows gzip."""
+    gzip_q = any_q = None
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        parts = item.split(';')
+        coding = parts[0].strip().lower()
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding in ('gzip', 'x-gzip'):
+            gzip_q = q
+        elif coding == '*':
+            any_q = q
+    if gzip_q is None:
+        gzip_q = any_q
+    return gzip_q is not None and gzip_q > 0
+
+def conditional_gzip_response(request, etag, gzipped_content, mimetype,
+                              content=None):
+    """Create a response for content that we have an ETag for.
+
+    We send gzipped_content to clients that accept gzip and handle
+    If-None-Match requests using etag.  The gzipped data is a different
+    representation, so it gets a different strong ETag.
+
+    If content is None, we get it by decompressing gzipped_content, which we
+    only need to do for clients that don't accept gzip.
+    """
+    gzip = accepts_gzip(request)
+    if gzip:
+        etag += '-gzip'
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (if_none_match.strip() == '*' or
+                          etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+    elif gzip:
+        response = HttpResponse(gzipped_content, mimetype=mimetype)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        if content is None:
+            content = gunzip_string(gzipped_content)
+        response = HttpResponse(content, mimetype=mimetype)
+    response['ETag'] = quote_etag(etag)
+    response['Vary'] = 'Accept-Encoding'
+    return response
@@ -16,7 +16,11 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import atexit
+import os
+import random
 import socket
+import threading
 import time as _time
 from contextlib import contextmanager
 from functools import wraps
@@ -80,7 +84,136 @@ def find_branch():
 
 BRANCH = find_branch()
 
-def send(service, tag, metric=None):
+# Aggregation
+#
+# Sending a UDP packet for each event adds up quickly, for example
+# MetricsCursorWrapper records 2 timers and a meter for each SQL query.  By
+# default we aggregate events in-process and a background thread sends
+# a summary for each metric every FLUSH_INTERVAL seconds:
+#
+#   - meters/occurrences: a single event with the total count
+#   - gauges: the last value reported
+#   - timers/histograms: an event with the mean, using the metric name as
+#     before, plus events for the count, mean, max, p50, p95 and p99 (the
+#     service names get a " count", " mean", etc. suffix)
+AGGREGATE = getattr(settings, 'METRICS_AGGREGATE', True)
+FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+# Max number of values we store per timer/histogram between flushes.  After
+# this we use reservoir sampling to calculate the percentiles.
+RESERVOIR_SIZE = 1000
+
+def _percentile(sorted_values, p):
+    return sorted_values[int(round(p * (len(sorted_values) - 1)))]
+
+class _Summary(object):
+    """Stores the events for a single metric between flushes."""
+    def __init__(self, tag):
+        self.tag = tag
+        self.count = 0
+        self.total = 0
+        self.max = None
+        self.last = None
+        self.values = []
+
+    def add(self, value, count):
+        self.count += count
+        self.last = value
+        if value is None:
+            return
+        self.total += value * count
+        if self.max is None or value > self.max:
+            self.max = value
+        for i in xrange(count):
+            if len(self.values) < RESERVOIR_SIZE:
+                self.values.append(value)
+            else:
+                pos = random.randint(0, self.count - count + i)
+                if pos < RESERVOIR_SIZE:
+                    self.values[pos] = value
+
+    def events(self, service):
+        if self.tag in ('meter', 'occurrence'):
+            return [(service, self.total or self.count)]
+        elif self.tag == 'gauge':
+            return [(service, self.last)]
+        elif not self.values:
+            return [(service + ' count', self.count)]
+        values = sorted(self.values)
+        mean = float(self.total) / self.count
+        return [
+            (service, mean),
+            (service + ' count', self.count),
+            (service + ' mean', mean),
+            (service + ' max', self.max),
+            (service + ' p50', _percentile(values, 0.5)),
+            (service + ' p95', _percentile(values, 0.95)),
+            (service + ' p99', _percentile(values, 0.99)),
+        ]
+
+class Aggregator(object):
+    """Aggregate metrics in-process and periodically send summaries.
+
+    send_event is called with the event dict for each summary event.
+    """
+    def __init__(self, send_event, flush_interval):
+        self.send_event = send_event
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.summaries = {}
+        self.pid = os.getpid()
+        self.flusher_pid = None
+
+    def check_fork(self):
+        # After a fork the child gets a copy of the parent's unflushed
+        # summaries.  Drop them, otherwise both processes would send them.
+        # Also replace the lock, since another thread may have been holding
+        # it when we forked.
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.lock = threading.Lock()
+            self.summaries = {}
+
+    def record(self, service, tag, metric=None, count=1):
+        self.check_fork()
+        with self.lock:
+            key = (service, tag)
+            try:
+                summary = self.summaries[key]
+            except KeyError:
+                summary = self.summaries[key] = _Summary(tag)
+            summary.add(metric, count)
+        self.ensure_flusher()
+
+    def ensure_flusher(self):
+        # Check the pid, since threads don't survive a fork and both celery
+        # and the web servers fork worker processes.
+        if self.flusher_pid == os.getpid():
+            return
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+        thread = threading.Thread(target=self.run_flusher)
+        thread.daemon = True
+        thread.start()
+
+    def run_flusher(self):
+        while True:
+            _time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        self.check_fork()
+        with self.lock:
+            summaries, self.summaries = self.summaries, {}
+        for (service, tag), summary in summaries.iteritems():
+            for event_service, metric in summary.events(service):
+                try:
+                    self.send_event(make_event(event_service, tag, metric))
+                except:
+                    pass
+
+def make_event(service, tag, metric=None):
     data = {
         'host': HOST + BRANCH,
         'service': service,
@@ -89,8 +222,19 @@ def send(service, tag, metric=None):
 
     if metric:
         data['metric'] = metric
-
-    if ENABLED:
+    return data
+
+aggregator = Aggregator(c.send, FLUSH_INTERVAL)
+atexit.register(aggregator.flush)
+
+def send(service, tag, metric=None, count=1):
+    if not ENABLED:
+        return
+    if AGGREGATE:
+        aggregator.record(service, tag, metric, count)
+        return
+    data = make_event(service, tag, metric)
+    for i in xrange(count):
         try:
             c.send(data)
         except:
@@ -167,5 +311,5 @@ def time_as(name):
 
 
 class ManualTimer(Metric):
-    def record(self, value):
-        send(self.name, 'timer', value)
+    def record(self, value, count=1):
+        send(self.name, 'timer', value, count)
@@ -13,6 +13,7 @@ from xvfbwrapper import Xvfb
 import mock
 import mock
 import requests
+import subtitles.cache
 import utils.youtube
 
 REQUEST_CALLBACKS = []
@@ -85,6 +86,7 @@ class TestCaseMessagesMixin(object):
                 )
 
 save_thumbnail_in_s3 = mock.Mock()
+save_thumbnails_in_s3 = mock.Mock()
 update_team_video = mock.Mock()
 update_search_index = mock.Mock()
 
@@ -92,6 +94,9 @@ test_video_info = utils.youtube.VideoInfo(
     'test-channel-id', 'test-title', 'test-description', 60,
     'http://example.com/youtube-thumb.png')
 youtube_get_video_info = mock.Mock(return_value=test_video_info)
+youtube_get_video_infos = mock.Mock(
+    side_effect=lambda video_ids: dict((video_id, test_video_info)
+                                       for video_id in video_ids))
 youtube_get_user_info = mock.Mock(return_value=test_video_info)
 youtube_get_new_access_token = mock.Mock(return_value='test-access-token')
 youtube_revoke_auth_token = mock.Mock()
@@ -118,10 +123,12 @@ class MonkeyPatcher(object):
         # list of (function, mock object tuples)
         patch_info = [
             ('videos.tasks.save_thumbnail_in_s3', save_thumbnail_in_s3),
+            ('videos.tasks.save_thumbnails_in_s3', save_thumbnails_in_s3),
             ('teams.tasks.update_one_team_video', update_team_video),
             ('utils.celery_search_index.update_search_index',
              update_search_index),
             ('utils.youtube.get_video_info', youtube_get_video_info),
+            ('utils.youtube.get_video_infos', youtube_get_video_infos),
             ('utils.youtube.get_user_info', youtube_get_user_info),
             ('utils.youtube.get_new_access_token',
              youtube_get_new_access_token),
@@ -241,6 +248,8 @@ class UnisubsTestPlugin(Plugin):
     def afterTest(self, test):
         self.patcher.reset_mocks()
         cache.clear()
+        subtitles.cache.clear_subtitles_lru()
+        subtitles.cache.clear_exports_lru()
 
     def wantDirectory(self, dirname):
         if dirname in self.directories_to_skip:
@@ -323,6 +332,13 @@ class RequestsMocker(object):
             patcher = mock.patch('requests.%s' % method, mock_obj)
             patcher.start()
             self.patchers.append(patcher)
+        # Also handle requests made using a session.  The mock isn't a
+        # descriptor, so it doesn't get the session passed in as self.
+        mock_obj = mock.Mock()
+        mock_obj.side_effect = self.mock_request
+        patcher = mock.patch('requests.sessions.Session.request', mock_obj)
+        patcher.start()
+        self.patchers.append(patcher)
 
     def unpatch(self):
         for patcher in self.patchers:
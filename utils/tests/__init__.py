@@ -1,7 +1,11 @@
+from utils.tests.amazonsqs import *
 from utils.tests.behaviors import *
+from utils.tests.celery_search_index import *
 from utils.tests.chunkediter import *
 from utils.tests.bleech import *
 from utils.tests.compress import *
+from utils.tests.http import *
+from utils.tests.metrics import *
 from utils.tests.multiqueryset import *
 from utils.tests.text import *
 from utils.tests.youtube import *
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from django.test import TestCase
+from kombu import BrokerConnection
+import mock
+
+from kombu_backends import amazonsqs
+
+class StopRequest(Exception):
+    pass
+
+class FakeMessage(object):
+    def __init__(self, body):
+        self.body = body
+        self.receipt_handle = 'receipt-%s' % body
+
+    def get_body(self):
+        return self.body
+
+    def get_body_encoded(self):
+        return self.body
+
+class FakeQueue(object):
+    message_class = FakeMessage
+
+    def __init__(self, name):
+        self.name = name
+        self.messages = []
+        self.in_flight = []
+
+    def new_message(self, body):
+        return FakeMessage(body)
+
+    def count(self):
+        return len(self.messages)
+
+class FakeSQSConnection(object):
+    """Stands in for BatchSQSConnection, keeping the queues in memory."""
+    def __init__(self, *args, **kwargs):
+        self.queues = {}
+        self.requests = []
+
+    def create_queue(self, name):
+        return self.queues.setdefault(name, FakeQueue(name))
+
+    def receive_message_batch(self, queue, number_messages,
+                              wait_time_seconds=0):
+        self.requests.append(('receive', number_messages, wait_time_seconds))
+        messages = queue.messages[:number_messages]
+        del queue.messages[:number_messages]
+        queue.in_flight.extend(messages)
+        return messages
+
+    def delete_message_batch(self, queue, messages):
+        self.requests.append(('delete', len(messages)))
+        for message in messages:
+            queue.in_flight.remove(message)
+        return amazonsqs.BatchResults()
+
+    def send_message(self, queue, body):
+        self.requests.append(('send', 1))
+        queue.messages.append(FakeMessage(body))
+
+    def send_message_batch(self, queue, bodies):
+        self.requests.append(('send_batch', len(bodies)))
+        results = amazonsqs.BatchResults()
+        for i, body in enumerate(bodies):
+            if body in self.failing_bodies:
+                results.errors.append({'Id': str(i)})
+            else:
+                queue.messages.append(FakeMessage(body))
+        return results
+
+    failing_bodies = ()
+
+class SQSChannelTest(TestCase):
+    def setUp(self):
+        self.patcher = mock.patch.object(amazonsqs.Channel, 'Client',
+                                         FakeSQSConnection)
+        self.patcher.start()
+        self.connection = BrokerConnection(transport=amazonsqs.Transport)
+        self.channel = self.connection.channel()
+        self.client = self.channel.client
+        self.queue = self.channel._get_queue('test')
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def put_messages(self, count):
+        with amazonsqs.batch_sends():
+            for i in xrange(count):
+                self.channel._put('test', {'n': i})
+
+    def test_batch_sends(self):
+        self.put_messages(25)
+        self.assertEquals(self.client.requests, [
+            ('send_batch', 10), ('send_batch', 10), ('send_batch', 5),
+        ])
+        self.assertEquals(self.queue.count(), 25)
+
+    def test_send_without_batch(self):
+        self.channel._put('test', {'n': 0})
+        self.assertEquals(self.queue.count(), 1)
+
+    def test_batch_send_errors(self):
+        self.client.failing_bodies = [amazonsqs.serialize({'n': 3})]
+        self.put_messages(5)
+        self.assertEquals(self.client.requests, [
+            ('send_batch', 5), ('send', 1),
+        ])
+        self.assertEquals(self.queue.count(), 5)
+
+    def test_batch_chunks_limits_size(self):
+        bodies = ['x' * (100 * 1024)] * 5
+        self.assertEquals([len(chunk) for chunk in
+                           amazonsqs.batch_chunks(bodies)], [2, 2, 1])
+
+    def test_batch_receive(self):
+        self.put_messages(15)
+        self.client.requests = []
+        received = [self.channel._get('test')['n'] for i in xrange(15)]
+        self.assertEquals(received, range(15))
+        self.assertRaises(amazonsqs.Empty, self.channel._get, 'test')
+        self.assertEquals(self.client.requests, [
+            ('receive', 10, 0), ('delete', 10),
+            ('receive', 10, 0), ('delete', 5),
+            ('receive', 10, 0),
+        ])
+        self.assertEquals(self.queue.in_flight, [])
+
+    def test_long_poll_wait_time(self):
+        self.channel._active_queues[:] = ['test', 'other']
+        self.assertRaises(amazonsqs.Empty, self.channel._get, 'test')
+        self.assertEquals(self.client.requests, [
+            ('receive', 10, amazonsqs.SQS_WAIT_TIME_SECONDS // 2),
+        ])
+
+    def test_delete_after_delivery(self):
+        self.put_messages(5)
+        self.client.requests = []
+        self.channel._get('test')
+        # we shouldn't delete messages before they're delivered, otherwise
+        # we would lose them if the process died
+        self.assertEquals(self.client.requests, [('receive', 10, 0)])
+        self.assertEquals(len(self.queue.in_flight), 5)
+        for i in xrange(4):
+            self.channel._get('test')
+        self.assertEquals(self.client.requests, [
+            ('receive', 10, 0), ('delete', 5),
+        ])
+        self.assertEquals(self.queue.in_flight, [])
+
+    def test_buffer_expires(self):
+        self.put_messages(5)
+        with mock.patch('kombu_backends.amazonsqs.time') as mock_time:
+            mock_time.time.return_value = 1000
+            self.channel._get('test')
+            self.channel._get('test')
+            # After SQS_MAX_BUFFER_SECONDS, we should delete the delivered
+            # messages and drop the rest, rather than risk them becoming
+            # visible on SQS while they're still in our buffer.
+            mock_time.time.return_value = (
+                1000 + amazonsqs.SQS_MAX_BUFFER_SECONDS)
+            self.assertRaises(amazonsqs.Empty, self.channel._get, 'test')
+        self.assertEquals(self.client.requests[-2:], [
+            ('delete', 2), ('receive', 10, 0),
+        ])
+        # the 3 dropped messages will become visible again after the
+        # visibility timeout
+        self.assertEquals(len(self.queue.in_flight), 3)
+
+    def test_drain_events_expires_buffers(self):
+        self.put_messages(5)
+        with mock.patch('kombu_backends.amazonsqs.time') as mock_time:
+            mock_time.time.return_value = 1000
+            self.channel._get('test')
+            mock_time.time.return_value = (
+                1000 + amazonsqs.SQS_MAX_BUFFER_SECONDS)
+            # we don't have any consumers, so this won't call _get()
+            self.assertRaises(amazonsqs.Empty, self.channel.drain_events)
+        self.assertEquals(self.client.requests[-1], ('delete', 1))
+        self.assertEquals(self.channel.message_buffers, {})
+
+    def test_close_deletes_delivered_messages(self):
+        self.put_messages(5)
+        self.channel._get('test')
+        self.channel._get('test')
+        self.channel.close()
+        # the 2 delivered messages should be deleted, the other 3 will be
+        # become visible again after the visibility timeout
+        self.assertEquals(len(self.queue.in_flight), 3)
+
+class BatchRequestsAPIVersionTest(TestCase):
+    def setUp(self):
+        self.connection = amazonsqs.BatchSQSConnection('key', 'secret')
+        self.queue = mock.Mock(id='/123/test', message_class=FakeMessage)
+
+    def get_request_params(self, func, *args):
+        with mock.patch.object(self.connection, '_mexe') as mock_mexe:
+            mock_mexe.side_effect = StopRequest()
+            self.assertRaises(StopRequest, func, *args)
+        return mock_mexe.call_args[0][0].params
+
+    def test_batch_requests_use_new_version(self):
+        for func, args in [
+            (self.connection.receive_message_batch, (self.queue, 10)),
+            (self.connection.delete_message_batch,
+             (self.queue, [FakeMessage('a')])),
+            (self.connection.send_message_batch, (self.queue, ['a'])),
+        ]:
+            params = self.get_request_params(func, *args)
+            self.assertEquals(params['Version'],
+                              amazonsqs.BatchRequestsMixin.BATCH_API_VERSION)
+            self.assert_(amazonsqs.API_VERSION_PARAM not in params)
+
+    def test_other_requests_use_boto_version(self):
+        params = self.get_request_params(self.connection.get_all_queues)
+        self.assertEquals(params['Version'],
+                          amazonsqs.SQSConnection.APIVersion)
+        params = self.get_request_params(self.connection.get_queue_attributes,
+                                         self.queue)
+        self.assertEquals(params['Version'],
+                          amazonsqs.SQSConnection.APIVersion)
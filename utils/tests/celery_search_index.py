@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+import time
+
+from django.test import TestCase
+import mock
+
+from teams.models import TeamVideo
+from utils import celery_search_index
+from utils.redis_utils import default_connection
+from videos.models import Video
+
+class IndexUpdateQueueTest(TestCase):
+    def setUp(self):
+        self.queue_key = 'test-search-index-update-queue'
+        default_connection.delete(self.queue_key)
+        default_connection.delete(self.queue_key + ':tries')
+        patches = [
+            mock.patch('utils.celery_search_index.BATCH_UPDATES', True),
+            mock.patch('utils.celery_search_index.QUEUE_KEY',
+                       self.queue_key),
+            mock.patch('utils.celery_search_index.update_objects'),
+        ]
+        self.mock_update_objects = patches[-1].start()
+        for patch in patches[:-1]:
+            patch.start()
+        self.patches = patches
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        default_connection.delete(self.queue_key)
+        default_connection.delete(self.queue_key + ':tries')
+
+    def updated_objects(self):
+        return sorted((args[0], sorted(args[1]))
+                      for args, kwargs
+                      in self.mock_update_objects.call_args_list)
+
+    def test_flush(self):
+        celery_search_index.queue_index_update(Video, 1)
+        celery_search_index.queue_index_update(Video, 2)
+        celery_search_index.queue_index_update(TeamVideo, 1)
+        celery_search_index.flush_index_updates()
+        self.assertEquals(self.updated_objects(), sorted([
+            (Video, [1, 2]),
+            (TeamVideo, [1]),
+        ]))
+        # the queue should be empty now
+        self.mock_update_objects.reset_mock()
+        celery_search_index.flush_index_updates()
+        self.assertEquals(self.updated_objects(), [])
+
+    def test_coalesce_updates(self):
+        for i in xrange(3):
+            celery_search_index.queue_index_update(Video, 1)
+        celery_search_index.flush_index_updates()
+        self.assertEquals(self.updated_objects(), [(Video, [1])])
+
+    def queued_members(self):
+        return default_connection.zrange(self.queue_key, 0, -1)
+
+    def fail_for(self, model_class, pk):
+        def update_objects(update_model_class, pks):
+            if update_model_class is model_class and pk in pks:
+                raise ValueError("solr error")
+        self.mock_update_objects.side_effect = update_objects
+
+    def test_failed_update_retried_individually(self):
+        for pk in xrange(3):
+            celery_search_index.queue_index_update(Video, pk)
+        celery_search_index.queue_index_update(TeamVideo, 1)
+        self.fail_for(Video, 1)
+        celery_search_index.flush_index_updates()
+        # The Video batch failed, so we should have retried each video on
+        # its own.  Only the bad one should stay queued.
+        self.assertEquals(self.updated_objects(), sorted([
+            (Video, [0, 1, 2]),
+            (Video, [0]),
+            (Video, [1]),
+            (Video, [2]),
+            (TeamVideo, [1]),
+        ]))
+        self.assertEquals(self.queued_members(), ['videos.video:1'])
+
+    def test_failed_update_rescheduled(self):
+        celery_search_index.queue_index_update(Video, 1)
+        celery_search_index.queue_index_update(Video, 2)
+        self.fail_for(Video, 1)
+        celery_search_index.flush_index_updates()
+        score = default_connection.zscore(self.queue_key, 'videos.video:1')
+        self.assert_(score >= (time.time() - 1 +
+                               celery_search_index.RETRY_DELAY))
+        # the failed update shouldn't be retried until it's due, so it
+        # doesn't block the updates queued after it
+        self.mock_update_objects.reset_mock()
+        celery_search_index.queue_index_update(Video, 3)
+        celery_search_index.flush_index_updates()
+        self.assertEquals(self.updated_objects(), [(Video, [3])])
+        self.assertEquals(self.queued_members(), ['videos.video:1'])
+
+    def test_give_up_after_max_tries(self):
+        celery_search_index.queue_index_update(Video, 1)
+        self.fail_for(Video, 1)
+        with mock.patch('utils.celery_search_index.RETRY_DELAY', 0):
+            for i in xrange(celery_search_index.MAX_TRIES - 1):
+                celery_search_index.flush_index_updates()
+                self.assertEquals(self.queued_members(), ['videos.video:1'])
+            celery_search_index.flush_index_updates()
+        self.assertEquals(self.queued_members(), [])
+        self.assertEquals(default_connection.hgetall(
+            self.queue_key + ':tries'), {})
+
+    def test_invalid_members_dropped(self):
+        default_connection.zadd(self.queue_key, **{
+            'nosuchapp.nosuchmodel:1': 1,
+            'garbage': 1,
+        })
+        celery_search_index.queue_index_update(Video, 1)
+        celery_search_index.flush_index_updates()
+        self.assertEquals(self.updated_objects(), [(Video, [1])])
+        self.assertEquals(self.queued_members(), [])
+
+    def test_requeued_during_update(self):
+        celery_search_index.queue_index_update(Video, 1)
+        def update_objects(model_class, pks):
+            # simulate the video changing while we update it
+            celery_search_index.queue_index_update(Video, 1)
+        self.mock_update_objects.side_effect = update_objects
+        celery_search_index.flush_index_updates()
+        # we should keep the update queued, since the video changed after
+        # we read it
+        self.assertEquals(self.mock_update_objects.call_count, 1)
+        self.assertEquals(self.queued_members(), ['videos.video:1'])
+
+    def test_batches(self):
+        with mock.patch('utils.celery_search_index.BATCH_SIZE', 2):
+            for pk in xrange(5):
+                celery_search_index.queue_index_update(Video, pk)
+            celery_search_index.flush_index_updates()
+        self.assertEquals(self.mock_update_objects.call_count, 3)
+        self.assertEquals(sorted(sum((args[1] for args, kwargs in
+                                      self.mock_update_objects.call_args_list),
+                                     [])),
+                          range(5))
@@ -17,12 +17,14 @@
 # along with this program. If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from cStringIO import StringIO
 from string import printable as chars
 from random import randint, choice
+import gzip
 
 from django.test import TestCase
 
-from utils.compress import compress, decompress
+from utils.compress import compress, decompress, gzip_string, gunzip_string
 
 class CompressTest(TestCase):
     def test_compression(self):
@@ -53,3 +55,13 @@ class CompressTest(TestCase):
             round_tripped = decompress(compress(encoded_data)).decode('utf-8')
 
             self.assertEqual(data, round_tripped)
+
+    def test_gzip(self):
+        data = ''.join(choice(chars) for _ in xrange(4096))
+        gzipped = gzip_string(data)
+        self.assertEqual(gunzip_string(gzipped), data)
+        # it should be readable by the gzip module
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(gzipped)).read(),
+                         data)
+        # compressing the same data twice should give the same result
+        self.assertEqual(gzip_string(data), gzipped)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see
+
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from utils.compress import gzip_string
+from utils.http import accepts_gzip, conditional_gzip_response
+
+class AcceptsGzipTest(TestCase):
+    def check(self, accept_encoding, correct_result):
+        request = RequestFactory().get('/',
+                                       HTTP_ACCEPT_ENCODING=accept_encoding)
+        self.assertEqual(accepts_gzip(request), correct_result,
+                         accept_encoding)
+
+    def test_accepts_gzip(self):
+        self.check('', False)
+        self.check('gzip', True)
+        self.check('gzip, deflate', True)
+        self.check('deflate, x-gzip', True)
+        self.check('GZIP;q=0.5', True)
+        self.check('deflate', False)
+        self.check('gzip;q=0', False)
+        self.check('gzip; q=0.000, deflate', False)
+        self.check('gzip;q=invalid', False)
+        self.check('*', True)
+        self.check('*;q=0', False)
+        self.check('gzip;q=0, *', False)
+        self.check('gzip, *;q=0', True)
+
+class ConditionalGzipResponseTest(TestCase):
+    def get_response(self, **headers):
+        request = RequestFactory().get('/', **headers)
+        return conditional_gzip_response(request, 'abc',
+                                         gzip_string('content'),
+                                         'text/plain')
+
+    def test_gzip(self):
+        response = self.get_response(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, gzip_string('content'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], '"abc-gzip"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_uncompressed(self):
+        response = self.get_response(HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, 'content')
+        self.assert_(not response.has_header('Content-Encoding'))
+        self.assertEqual(response['ETag'], '"abc"')
+
+    def test_not_modified(self):
+        response = self.get_response(HTTP_IF_NONE_MATCH='"abc"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"abc"')
+        response = self.get_response(HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 304)
+        # the gzip representation has a different ETag
+        response = self.get_response(HTTP_IF_NONE_MATCH='"abc"',
+                                     HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from django.test import TestCase
+import mock
+
+from utils.metrics import Aggregator
+
+class AggregatorTest(TestCase):
+    def setUp(self):
+        self.events = []
+        self.aggregator = Aggregator(self.events.append, 10)
+        # don't start the background thread
+        self.aggregator.ensure_flusher = lambda: None
+
+    def flushed_metrics(self):
+        self.aggregator.flush()
+        return dict((e['service'], e.get('metric')) for e in self.events)
+
+    def test_meter(self):
+        for i in xrange(5):
+            self.aggregator.record('requests', 'meter', 1)
+        self.aggregator.record('requests', 'meter', 3)
+        self.assertEqual(self.flushed_metrics(), {'requests': 8})
+
+    def test_gauge(self):
+        self.aggregator.record('gauges.queue', 'gauge', 10)
+        self.aggregator.record('gauges.queue', 'gauge', 20)
+        self.assertEqual(self.flushed_metrics(), {'gauges.queue': 20})
+
+    def test_timer(self):
+        for i in xrange(1, 101):
+            self.aggregator.record('db-query-time', 'timer', i)
+        self.assertEqual(self.flushed_metrics(), {
+            'db-query-time': 50.5,
+            'db-query-time count': 100,
+            'db-query-time mean': 50.5,
+            'db-query-time max': 100,
+            'db-query-time p50': 51,
+            'db-query-time p95': 95,
+            'db-query-time p99': 99,
+        })
+
+    def test_record_count(self):
+        self.aggregator.record('db-query-time', 'timer', 2, count=10)
+        metrics = self.flushed_metrics()
+        self.assertEqual(metrics['db-query-time count'], 10)
+        self.assertEqual(metrics['db-query-time mean'], 2)
+        self.assertEqual(metrics['db-query-time'], 2)
+
+    def test_flush_resets(self):
+        self.aggregator.record('requests', 'meter', 1)
+        self.aggregator.flush()
+        self.events[:] = []
+        self.assertEqual(self.flushed_metrics(), {})
+
+    def test_fork_drops_inherited_data(self):
+        self.aggregator.record('requests', 'meter', 1)
+        with mock.patch('os.getpid') as getpid:
+            getpid.return_value = self.aggregator.pid + 1
+            self.assertEqual(self.flushed_metrics(), {})
+            self.aggregator.record('requests', 'meter', 2)
+            self.assertEqual(self.flushed_metrics(), {'requests': 2})
@@ -186,6 +186,84 @@ class YouTubeTestCase(TestCase):
             with assert_raises(utils.youtube.APIError):
                 utils.youtube.get_video_info('test-video-id')
 
+    def make_video_item(self, video_id):
+        return {
+            'id': video_id,
+            'snippet': {
+                'title': 'title-%s' % video_id,
+                'channelId': 'test-channel-id',
+                'description': 'test-description',
+                'thumbnails': {
+                    'high': {
+                        'url': 'test-thumbnail-url',
+                    }
+                }
+            },
+            'contentDetails': {
+                'duration': 'PT10S',
+            }
+        }
+
+    def expect_video_info_request(self, mocker, video_ids):
+        mocker.expect_request(
+            'get', 'https://www.googleapis.com/youtube/v3/videos', params={
+                'part': 'snippet,contentDetails',
+                'id': ','.join(video_ids),
+                'key': settings.YOUTUBE_API_KEY,
+            }, body=json.dumps({
+                'items': [self.make_video_item(video_id)
+                          for video_id in video_ids],
+            })
+        )
+
+    def test_get_video_info_cache(self):
+        mocker = test_utils.RequestsMocker()
+        self.expect_video_info_request(mocker, ['test-video-id'])
+        utils.youtube.get_video_info.run_original_for_test()
+        with mocker:
+            video_info = utils.youtube.get_video_info('test-video-id')
+            # the second call should use the cached value
+            self.assertEqual(utils.youtube.get_video_info('test-video-id'),
+                             video_info)
+        self.assertEqual(video_info.title, 'title-test-video-id')
+        # use_cache=False should fetch the info again
+        mocker = test_utils.RequestsMocker()
+        self.expect_video_info_request(mocker, ['test-video-id'])
+        with mocker:
+            utils.youtube.get_video_info('test-video-id', use_cache=False)
+
+    @mock.patch('utils.youtube.VIDEO_INFO_BATCH_SIZE', 2)
+    def test_get_video_infos(self):
+        utils.youtube.get_video_info.run_original_for_test()
+        utils.youtube.get_video_infos.run_original_for_test()
+        mocker = test_utils.RequestsMocker()
+        self.expect_video_info_request(mocker, ['cached-id'])
+        with mocker:
+            utils.youtube.get_video_info('cached-id')
+        # we should fetch the uncached videos in batches.  Videos that
+        # youtube doesn't return are left out of the results.
+        mocker = test_utils.RequestsMocker()
+        self.expect_video_info_request(mocker, ['id1', 'id2'])
+        mocker.expect_request(
+            'get', 'https://www.googleapis.com/youtube/v3/videos', params={
+                'part': 'snippet,contentDetails',
+                'id': 'id3,missing-id',
+                'key': settings.YOUTUBE_API_KEY,
+            }, body=json.dumps({
+                'items': [self.make_video_item('id3')],
+            })
+        )
+        with mocker:
+            video_infos = utils.youtube.get_video_infos(
+                ['id1', 'cached-id', 'id2', 'id1', 'id3', 'missing-id'])
+        self.assertEqual(
+            sorted(video_infos.keys()), ['cached-id', 'id1', 'id2', 'id3'])
+        self.assertEqual(video_infos['id2'].title, 'title-id2')
+        # get_video_info() should use the info that get_video_infos() cached
+        with test_utils.RequestsMocker():
+            self.assertEqual(utils.youtube.get_video_info('id3'),
+                             video_infos['id3'])
+
     def test_update_video_description(self):
         mocker = test_utils.RequestsMocker()
         mocker.expect_request(
@@ -26,6 +26,7 @@ import re
 import simplejson as json
 
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.translation import ugettext as _
 import requests
 
@@ -48,6 +49,11 @@ VideoInfo = namedtuple('VideoInfo',
 
 logger = logging.getLogger('utils.youtube')
 
+# How long to cache VideoInfo objects for
+VIDEO_INFO_CACHE_TIMEOUT = 60 * 60
+# Max number of videos that we can request info for at once
+VIDEO_INFO_BATCH_SIZE = 50
+
 def request_token_url(redirect_uri, state):
     """Get the URL to for the request token
 
@@ -236,26 +242,86 @@ def _parse_8601_duration(duration):
         rv += int(match.group(2)) * 60
     return rv
 
-def get_video_info(video_id):
+def _video_info_cache_key(video_id):
+    return 'youtube-video-info-%s' % video_id
+
+def get_video_info(video_id, use_cache=True):
+    """Get a VideoInfo object for a video
+
+    VideoInfo objects are stored in the django cache for
+    VIDEO_INFO_CACHE_TIMEOUT seconds.  Pass use_cache=False to always fetch
+    fresh data from youtube.
+    """
+    cache_key = _video_info_cache_key(video_id)
+    if use_cache:
+        video_info = cache.get(cache_key)
+        if video_info is not None:
+            return video_info
     try:
-        return _get_video_info(video_id)
+        video_info = _get_video_info(video_id)
     except APIError, e:
         logger.error("Youtube API Error: %s", e)
         raise
+    cache.set(cache_key, video_info, VIDEO_INFO_CACHE_TIMEOUT)
+    return video_info
+
+def get_video_infos(video_ids):
+    """Get VideoInfo objects for several videos at once.
+
+    This works like get_video_info(), but we fetch info for up to
+    VIDEO_INFO_BATCH_SIZE videos with each API request.  Results are stored
+    in the same cache as get_video_info().
+
+    :returns: dict mapping video ids to VideoInfo objects.  Videos that
+        youtube doesn't return info for are not included.
+    """
+    video_ids = list(video_ids)
+    cache_keys = dict((_video_info_cache_key(video_id), video_id)
+                      for video_id in video_ids)
+    rv = dict((cache_keys[key], video_info) for key, video_info in
+              cache.get_many(cache_keys.keys()).items())
+    to_fetch = []
+    for video_id in video_ids:
+        if video_id not in rv and video_id not in to_fetch:
+            to_fetch.append(video_id)
+    for i in xrange(0, len(to_fetch), VIDEO_INFO_BATCH_SIZE):
+        try:
+            fetched = _get_video_infos(to_fetch[i:i+VIDEO_INFO_BATCH_SIZE])
+        except APIError, e:
+            logger.error("Youtube API Error: %s", e)
+            raise
+        cache.set_many(dict(
+            (_video_info_cache_key(video_id), video_info)
+            for video_id, video_info in fetched.items()
+        ), VIDEO_INFO_CACHE_TIMEOUT)
+        rv.update(fetched)
+    return rv
+
+def _parse_video_info(item):
+    snippet = item['snippet']
+    content_details = item['contentDetails']
+    return VideoInfo(snippet['channelId'],
+                     snippet['title'],
+                     snippet['description'],
+                     _parse_8601_duration(content_details['duration']),
+                     snippet['thumbnails']['high']['url'])
 
 def _get_video_info(video_id):
     response = video_get(None, video_id, ['snippet', 'contentDetails'])
     try:
-        snippet = response.json['items'][0]['snippet']
-        content_details = response.json['items'][0]['contentDetails']
-        return VideoInfo(snippet['channelId'],
-                         snippet['title'],
-                         snippet['description'],
-                         _parse_8601_duration(content_details['duration']),
-                         snippet['thumbnails']['high']['url'])
+        return _parse_video_info(response.json['items'][0])
     except StandardError, e:
         raise APIError("get_video_info: Unexpected content: %s" % e)
 
+def _get_video_infos(video_ids):
+    response = video_get(None, ','.join(video_ids),
+                         ['snippet', 'contentDetails'])
+    try:
+        return dict((item['id'], _parse_video_info(item))
+                    for item in response.json['items'])
+    except StandardError, e:
+        raise APIError("get_video_infos: Unexpected content: %s" % e)
+
 
 def update_video_description(video_id, access_token, description):
     # get the current snippet for the video